@@ -0,0 +1,140 @@
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.async_llm import AsyncGroqLLM, create_async_groq_client
+
+
+class FakeGroqServer:
+    # Minimal OpenAI-compatible chat completions endpoint with injected latency and 429s.
+    def __init__(self, latency: float, rate_limit_probability: float, max_concurrent: int, seed: int = 0):
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.max_concurrent = max_concurrent
+        self.rng = random.Random(seed)
+        self.active = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload, extra_headers = await self._respond(json.loads(body or b"{}"))
+                data = json.dumps(payload).encode("utf-8")
+                head = [f"HTTP/1.1 {status}", "content-type: application/json", f"content-length: {len(data)}"]
+                head += [f"{name}: {value}" for name, value in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request: dict) -> tuple[str, dict, dict]:
+        self.requests += 1
+        if self.active >= self.max_concurrent or self.rng.random() < self.rate_limit_probability:
+            self.rate_limited += 1
+            error = {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}
+            return "429 Too Many Requests", error, {"retry-after": "0.05"}
+
+        self.active += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        return "200 OK", {
+            "id": f"fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Answer to: {prompt[:40]}"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }, {}
+
+
+async def run(args) -> dict:
+    server = FakeGroqServer(args.latency, args.rate_limit_probability, args.server_concurrency)
+    base_url = await server.start()
+
+    llm = AsyncGroqLLM(
+        model="fake-model",
+        client=create_async_groq_client(base_url=base_url, api_key="fake"),
+        max_concurrency=args.concurrency,
+        base_delay=0.05,
+        max_delay=1.0,
+    )
+    # Only --unique distinct prompts are used, so concurrent duplicates exercise request coalescing.
+    prompts = [f"question {i % args.unique}" for i in range(args.requests)]
+    random.Random(0).shuffle(prompts)
+
+    start = time.perf_counter()
+    answers = await asyncio.gather(*(llm.generate(prompt) for prompt in prompts))
+    seconds = time.perf_counter() - start
+    await llm.client.close()
+    await server.stop()
+
+    return {
+        "requests": args.requests,
+        "unique_prompts": args.unique,
+        "concurrency": args.concurrency,
+        "seconds": round(seconds, 3),
+        "requests_per_s": round(args.requests / seconds, 2),
+        "errors": sum(answer.startswith("Error:") for answer in answers),
+        "server_requests": server.requests,
+        "server_rate_limited": server.rate_limited,
+        **llm.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of AsyncGroqLLM against a local fake Groq server.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake server takes per completion.")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.05)
+    parser.add_argument("--server-concurrency", type=int, default=32, help="Concurrent requests before the server returns 429.")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
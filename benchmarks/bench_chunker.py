@@ -0,0 +1,85 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.chunker import Segment, approx_token_count, chunk_segments, chunk_text
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+
+
+def make_segments(pages: int, sentences_per_page: int, seed: int = 0) -> list[Segment]:
+    rng = random.Random(seed)
+    segments = []
+    for page in range(1, pages + 1):
+        sentences = []
+        for _ in range(sentences_per_page):
+            words = rng.choices(WORDS, k=rng.randint(6, 30))
+            sentences.append(" ".join(words) + rng.choice([".", ".", ".", "?", "!"]))
+        segments.append(Segment("synthetic.pdf", page, " ".join(sentences)))
+    return segments
+
+
+def measure(fn) -> dict:
+    start = time.perf_counter()
+    chunks = fn()
+    seconds = time.perf_counter() - start
+
+    # Separate run: tracemalloc slows allocation-heavy code too much to time under it.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak, "chunks": chunks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fixed-window and sentence-packing chunkers.")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--sentences-per-page", type=int, default=40)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    segments = make_segments(args.pages, args.sentences_per_page)
+    megabytes = sum(len(segment.text) for segment in segments) / 1e6
+
+    # The legacy path needs the whole document as one string before chunking.
+    fixed = measure(lambda: chunk_text(" ".join(segment.text for segment in segments)))
+    packed = measure(lambda: sum(
+        1 for _ in chunk_segments(iter(segments), max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
+    ))
+
+    results = {
+        "input_mb": round(megabytes, 3),
+        "fixed_window": {
+            "mb_per_s": round(megabytes / fixed["seconds"], 2),
+            "peak_mb": round(fixed["peak_bytes"] / 1e6, 2),
+            "chunks": len(fixed["chunks"]),
+            "mean_tokens": round(sum(map(approx_token_count, fixed["chunks"])) / max(len(fixed["chunks"]), 1), 1),
+        },
+        "sentence_packing": {
+            "mb_per_s": round(megabytes / packed["seconds"], 2),
+            "peak_mb": round(packed["peak_bytes"] / 1e6, 2),
+            "chunks": packed["chunks"],
+        },
+    }
+    print(json.dumps(results, indent=4))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.utils import clean_text, iter_clean_text
+from tests.test_utils import make_text, reference_clean_text
+
+
+def throughput(fn, text: str, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return len(text.encode("utf-8")) / 1e6 / best
+
+
+def main():
+    # Output equivalence with the previous implementation is checked in tests/test_utils.py.
+    parser = argparse.ArgumentParser(description="Measure clean_text MB/s against the previous implementation.")
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"sizes": []}
+    for megabytes in args.megabytes:
+        page = make_text(rng, 2000, 0.02)
+        pages = [page] * max(1, int(megabytes * 1e6 / len(page)))
+        document = "\n\n".join(pages)
+
+        row = {
+            "megabytes": round(len(document.encode("utf-8")) / 1e6, 2),
+            "reference_mb_s": throughput(reference_clean_text, document, args.repeats),
+            "clean_text_mb_s": throughput(clean_text, document, args.repeats),
+            "per_page_mb_s": throughput(lambda _: " ".join(iter_clean_text(pages)), document, args.repeats),
+        }
+        results["sizes"].append(row)
+        print(
+            f"{row['megabytes']:6.2f} MB  reference {row['reference_mb_s']:7.1f} MB/s  "
+            f"clean_text {row['clean_text_mb_s']:7.1f} MB/s  per page {row['per_page_mb_s']:7.1f} MB/s"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
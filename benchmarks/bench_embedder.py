@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.embedder import BACKENDS, Embedder, cosine_agreement
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+
+
+def make_texts(count: int, min_words: int, max_words: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words))) for _ in range(count)]
+
+
+def measure_backend(embedder: Embedder, chunks: list[str], queries: list[str], batch_size: int) -> dict:
+    embedder.embed(chunks[:batch_size], batch_size=batch_size)
+
+    start = time.perf_counter()
+    embedder.embed(chunks, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embedder.embed([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "chunks_per_second": len(chunks) / seconds,
+        "query_ms_p50": float(np.percentile(latencies, 50)),
+        "query_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends for throughput, latency and agreement.")
+    parser.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    chunks = make_texts(args.chunks, 60, 200)
+    queries = make_texts(args.queries, 4, 16, seed=1)
+
+    # The plain torch backend is the reference every other backend is checked against.
+    reference = Embedder(model_name=args.model, device="cpu", backend="torch", num_threads=args.threads)
+    results = {}
+    for backend in args.backends:
+        try:
+            embedder = reference if backend == "torch" else Embedder(
+                model_name=args.model, device="cpu", backend=backend, num_threads=args.threads
+            )
+        except Exception as e:
+            print(f"{backend:<10} unavailable: {e}")
+            continue
+
+        result = measure_backend(embedder, chunks, queries, args.batch_size)
+        result["cosine_to_torch"] = cosine_agreement(reference, embedder, chunks[:500] + queries)
+        results[backend] = result
+        print(
+            f"{backend:<10} {result['chunks_per_second']:8.1f} chunks/s  "
+            f"query p50 {result['query_ms_p50']:6.2f} ms  p95 {result['query_ms_p95']:6.2f} ms  "
+            f"cosine mean {result['cosine_to_torch']['mean']:.4f} min {result['cosine_to_torch']['min']:.4f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "threads": args.threads, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
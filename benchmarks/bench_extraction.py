@@ -0,0 +1,111 @@
+import sys
+import os
+import io
+import json
+import time
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+from src.ingest import OcrTask, extract_document, run_ocr_tasks
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def _sentences(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(rng.choices(WORDS, k=rng.randint(6, 24))).capitalize() + "." for _ in range(count)]
+
+
+def _image(text: str, size: tuple) -> bytes:
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((10, 10), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_slide_deck(pages: int, rng: random.Random) -> bytes:
+    # Slides exported to PDF: a repeated logo, small icons, text layers and the odd real figure or scan.
+    logo = _image("LOGO", (120, 40))
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(480, 20, 580, 50), stream=logo)
+        if page_num % 10 == 9:
+            for strip in range(8):
+                page.insert_image(
+                    fitz.Rect(0, strip * 105, 612, (strip + 1) * 105),
+                    stream=_image(" ".join(_sentences(rng, 2)), (1200, 200)),
+                )
+            continue
+
+        page.insert_textbox(fitz.Rect(50, 60, 550, 600), " ".join(_sentences(rng, 25)), fontsize=10)
+        for icon in range(3):
+            page.insert_image(fitz.Rect(50 + icon * 30, 620, 74 + icon * 30, 644), stream=_image(str(icon), (48, 48)))
+        if page_num % 4 == 0:
+            page.insert_image(fitz.Rect(50, 650, 550, 780), stream=_image(_sentences(rng, 1)[0], (800, 200)))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def ocr_every_image(data: bytes, workers: int) -> int:
+    # The previous behaviour: OCR every image on every page at its stored resolution.
+    doc = fitz.open(stream=data, filetype="pdf")
+    tasks = []
+    for page_num, page in enumerate(doc):
+        page.get_text()
+        for img_index, img_info in enumerate(page.get_images(full=True)):
+            tasks.append(OcrTask(doc.extract_image(img_info[0])["image"], f"image {img_index+1} on page {page_num+1}"))
+    doc.close()
+    run_ocr_tasks(tasks, workers=workers)
+    return len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare planned PDF extraction against OCRing every image.")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    data = make_slide_deck(args.pages, random.Random(args.seed))
+
+    start = time.perf_counter()
+    naive_tasks = ocr_every_image(data, args.workers)
+    naive_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, report = extract_document(NamedBytesIO(data, "deck.pdf"), workers=args.workers)
+    planned_seconds = time.perf_counter() - start
+
+    results = {
+        "pages": args.pages,
+        "naive": {"ocr_tasks": naive_tasks, "seconds": round(naive_seconds, 3)},
+        "planned": {"seconds": round(planned_seconds, 3), **report.summary()},
+    }
+    print(f"naive    {naive_tasks:5d} OCR tasks  {naive_seconds:8.2f} s")
+    print(f"planned  {report.ocr_tasks:5d} OCR tasks  {planned_seconds:8.2f} s  actions {report.summary()['actions']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import faiss
+from src.index_factory import describe_index
+from src.vector_store import VectorStore
+
+
+def make_corpus(n: int, dim: int, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    # Clustered data behaves more like sentence embeddings than uniform noise.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(ground_truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(gt) & set(row[row != -1])) for gt, row in zip(ground_truth, found))
+    return hits / ground_truth.size
+
+
+def time_queries(store: VectorStore, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search_batch_ids(query[None, :], k=k)[0]
+        latencies.append(time.perf_counter() - start)
+        results.append([chunk_id for _, chunk_id in hits] + [-1] * (k - len(hits)))
+    return np.array(latencies), np.array(results)
+
+
+def build_store(index_type: str, corpus: np.ndarray, store_dir: str, args) -> tuple[VectorStore, float]:
+    # Vectors arrive in ingestion-sized batches with periodic saves, so the lazy upgrade from flat
+    # and any retraining happen exactly as they would in the app.
+    store = VectorStore(dim=corpus.shape[1], store_dir=store_dir, index_type=index_type, nlist=args.nlist)
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), args.batch_size):
+        batch = corpus[offset:offset + args.batch_size]
+        store.add(batch, [""] * len(batch))
+        if (offset // args.batch_size + 1) % args.save_every == 0:
+            store.save()
+    store.save()
+    return store, time.perf_counter() - start
+
+
+def index_nlist(store: VectorStore):
+    try:
+        return faiss.extract_index_ivf(store.index).nlist
+    except RuntimeError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of VectorStore index types against the flat index.")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=None, help="Fixed nlist; by default the store sizes and grows it.")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Vectors per VectorStore.add call.")
+    parser.add_argument("--save-every", type=int, default=8, help="Batches between saves.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 128, 256])
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.n, args.dim)
+    queries = make_corpus(args.queries, args.dim, seed=1)
+
+    configs = [("flat", {})]
+    configs += [("hnsw", {"ef_search": ef}) for ef in args.ef_search]
+    configs += [("ivf", {"nprobe": nprobe}) for nprobe in args.nprobe]
+    configs += [("ivfpq", {"nprobe": nprobe}) for nprobe in args.nprobe]
+
+    built = {}
+    ground_truth = None
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for index_type, search_params in configs:
+            if index_type not in built:
+                built[index_type] = build_store(index_type, corpus, os.path.join(tmp_dir, index_type), args)
+            store, build_seconds = built[index_type]
+            store.set_search_params(**search_params)
+
+            latencies, found = time_queries(store, queries, args.k)
+            if ground_truth is None:
+                ground_truth = found
+
+            row = {
+                "index_type": index_type,
+                "built_as": describe_index(store.index),
+                "nlist": index_nlist(store),
+                **search_params,
+                "build_seconds": round(build_seconds, 3),
+                f"recall@{args.k}": round(recall_at_k(ground_truth, found), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            }
+            results.append(row)
+            print(json.dumps(row))
+        for store, _ in built.values():
+            store.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"n": args.n, "dim": args.dim, "k": args.k, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import sys
+import os
+import io
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import docx
+
+from src.ingest_cache import IngestCache
+from src.pipeline import index_file
+from src.vector_store import VectorStore
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+# A paragraph of this many sentences packs into roughly four 256-token chunks.
+SENTENCES_PER_PARAGRAPH = 60
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class HashEmbedder:
+    # Deterministic stand-in that isolates pipeline memory from model activations.
+    def __init__(self, dim: int = 384):
+        self.dimension = dim
+        self.cache_tag = f"hash-{dim}"
+
+    def embed_stream(self, items, window_size: int = 1024, **kwargs):
+        window = []
+        for item in items:
+            window.append(item)
+            if len(window) == window_size:
+                yield window, self._embed(window)
+                window = []
+        if window:
+            yield window, self._embed(window)
+
+    def _embed(self, chunks) -> np.ndarray:
+        seeds = [int.from_bytes(hashlib.sha256(chunk.text.encode("utf-8")).digest()[:8], "little") for chunk in chunks]
+        return np.vstack([np.random.default_rng(seed).standard_normal(self.dimension, dtype=np.float32) for seed in seeds])
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def current(self) -> int:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    def reset(self):
+        self.peak = self.current()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.reset()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+class PhaseEmbedder:
+    # Marks where extraction ends, so the index phase peak is measured on its own.
+    def __init__(self, embedder, sampler: RssSampler):
+        self.embedder = embedder
+        self.sampler = sampler
+        self.extract_peak = 0
+        self.index_start = 0
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
+
+    def embed_stream(self, items, **kwargs):
+        self.extract_peak = self.sampler.peak
+        self.index_start = self.sampler.current()
+        self.sampler.reset()
+        yield from self.embedder.embed_stream(items, **kwargs)
+
+
+def make_docx(chunks: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(max(chunks // 4, 1)):
+        sentences = (" ".join(rng.choices(WORDS, k=rng.randint(6, 24))).capitalize() + "." for _ in range(SENTENCES_PER_PARAGRAPH))
+        document.add_paragraph(" ".join(sentences))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(chunks: int, args) -> dict:
+    if args.model:
+        from src.embedder import Embedder
+        embedder = Embedder(model_name=args.model)
+    else:
+        embedder = HashEmbedder()
+    data = make_docx(chunks, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = VectorStore(dim=embedder.dimension, store_dir=os.path.join(tmp_dir, "store"))
+        cache = IngestCache(os.path.join(tmp_dir, "cache"))
+        start = time.perf_counter()
+        with RssSampler() as sampler:
+            phased = PhaseEmbedder(embedder, sampler)
+            added = index_file(NamedBytesIO(data, "doc.docx"), phased, store, cache=cache, window_size=args.window_size)
+            store.save()
+        seconds = time.perf_counter() - start
+        # The in-memory FAISS flat index is the store's own data, not ingest overhead.
+        index_bytes = store.index.ntotal * embedder.dimension * 4
+        store.close()
+
+    mb = 1024 * 1024
+    index_growth = sampler.peak - phased.index_start
+    return {
+        "chunks": added,
+        "docx_mb": round(len(data) / mb, 1),
+        "seconds": round(seconds, 2),
+        "extract_peak_rss_mb": round(phased.extract_peak / mb, 1),
+        "index_phase_rss_growth_mb": round(index_growth / mb, 1),
+        "faiss_index_mb": round(index_bytes / mb, 1),
+        "ingest_overhead_mb": round((index_growth - index_bytes) / mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure peak RSS of pipeline.index_file (with the ingest cache) as documents grow."
+    )
+    parser.add_argument("--chunks", nargs="+", type=int, default=[5000, 20000, 80000])
+    parser.add_argument("--window-size", type=int, default=1024)
+    parser.add_argument("--model", type=str, default=None, help="Embed with this model instead of a hash embedder.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.chunks[0], args)))
+        return
+
+    # Each size runs in a fresh process so one run's heap does not hide the next one's growth.
+    results = []
+    for chunks in args.chunks:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--chunks", str(chunks),
+                   "--window-size", str(args.window_size), "--seed", str(args.seed)]
+        if args.model:
+            command += ["--model", args.model]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"{result['chunks']:>7} chunks  extract peak {result['extract_peak_rss_mb']:7.1f} MB  "
+            f"index phase +{result['index_phase_rss_growth_mb']:6.1f} MB  faiss {result['faiss_index_mb']:6.1f} MB  "
+            f"overhead {result['ingest_overhead_mb']:6.1f} MB  ({result['seconds']:.1f}s)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"window_size": args.window_size, "model": args.model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import sys
+import os
+import io
+import json
+import time
+import random
+import cProfile
+import pstats
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import docx
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+from pptx import Presentation
+from pptx.util import Inches
+
+from src.chunker import chunk_segments
+from src.embedder import Embedder
+from src.ingest import extract_segments
+from src.query_engine import QueryEngine
+from src import metrics
+from src.vector_store import VectorStore
+
+SIZES = {"small": 5, "medium": 50, "large": 200}
+FORMATS = ("pdf", "docx", "pptx", "png")
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class FakeLLM:
+    def __init__(self, latency: float = 0.0, model: str = "fake-llm"):
+        self.latency = latency
+        self.model = model
+
+    def generate(self, prompt: str, system_prompt: str = "") -> str:
+        time.sleep(self.latency)
+        return f"Fake answer based on {len(prompt)} prompt characters."
+
+    def generate_stream(self, prompt: str, system_prompt: str = "") -> Iterator[str]:
+        yield from self.generate(prompt, system_prompt).split(" ")
+
+
+def _sentences(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(rng.choices(WORDS, k=rng.randint(6, 24))).capitalize() + "." for _ in range(count)]
+
+
+def _text_image(text: str, size=(800, 200)) -> bytes:
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((10, 10), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_pdf(pages: int, rng: random.Random) -> bytes:
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 650), " ".join(_sentences(rng, 20)), fontsize=10)
+        if page_num % 5 == 0:
+            page.insert_image(fitz.Rect(50, 660, 550, 780), stream=_text_image(_sentences(rng, 1)[0]))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_docx(pages: int, rng: random.Random) -> bytes:
+    document = docx.Document()
+    for _ in range(pages * 4):
+        document.add_paragraph(" ".join(_sentences(rng, 5)))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_pptx(pages: int, rng: random.Random) -> bytes:
+    prs = Presentation()
+    for slide_num in range(pages):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = _sentences(rng, 1)[0]
+        slide.placeholders[1].text = "\n".join(_sentences(rng, 6))
+        if slide_num % 5 == 0:
+            slide.shapes.add_picture(io.BytesIO(_text_image(_sentences(rng, 1)[0])), Inches(1), Inches(5), width=Inches(6))
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+def make_png(pages: int, rng: random.Random) -> bytes:
+    lines = _sentences(rng, max(pages, 1))
+    return _text_image("\n".join(lines), size=(1200, 40 + 16 * len(lines)))
+
+
+MAKERS = {"pdf": make_pdf, "docx": make_docx, "pptx": make_pptx, "png": make_png}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def percentile_ms(latencies: list[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 3) if latencies else 0.0
+
+
+class StageTimer:
+    def __init__(self, profile_dir: str = None):
+        self.profile_dir = profile_dir
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                path = os.path.join(self.profile_dir, f"{name}.prof")
+                if os.path.exists(path):
+                    stats = pstats.Stats(path)
+                    stats.add(profiler)
+                    stats.dump_stats(path)
+                else:
+                    profiler.dump_stats(path)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run_size(size: str, pages: int, embedder: Embedder, args, timer: StageTimer) -> dict:
+    rng = random.Random(args.seed)
+    files = {fmt: MAKERS[fmt](pages, rng) for fmt in args.formats}
+
+    segments = []
+    for fmt, data in files.items():
+        with timer.stage(f"extract_{fmt}"):
+            file_segments = extract_segments(NamedBytesIO(data, f"{size}.{fmt}")) or []
+        segments.extend(file_segments)
+
+    with timer.stage("chunk"):
+        chunks = list(chunk_segments(segments, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens))
+
+    texts = [chunk.text for chunk in chunks]
+    with timer.stage("embed"):
+        vectors = embedder.embed(texts)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = VectorStore(dim=vectors.shape[1], store_dir=store_dir, index_type=args.index_type)
+        with timer.stage("index"):
+            store.add(vectors, texts)
+            store.save()
+
+        engine = QueryEngine(llm=FakeLLM(latency=args.llm_latency), vector_store=store, embedder=embedder)
+        queries = [" ".join(rng.choices(WORDS, k=8)) + "?" for _ in range(args.queries)]
+
+        latencies = []
+        with timer.stage("query"):
+            for query in queries:
+                start = time.perf_counter()
+                engine.ask(query)
+                latencies.append(time.perf_counter() - start)
+
+        with timer.stage("query_batch"):
+            engine.ask_many(queries)
+        store.close()
+
+    seconds = {name: round(value, 4) for name, value in timer.seconds.items()}
+    extract_seconds = sum(value for name, value in timer.seconds.items() if name.startswith("extract_"))
+    return {
+        "size": size,
+        "pages_per_format": pages,
+        "formats": list(args.formats),
+        "segments": len(segments),
+        "chunks": len(chunks),
+        "stage_seconds": seconds,
+        "throughput": {
+            "pages_per_s": round(pages * len(files) / extract_seconds, 2) if extract_seconds else None,
+            "chunks_per_s_chunk": round(len(chunks) / timer.seconds["chunk"], 2) if timer.seconds["chunk"] else None,
+            "chunks_per_s_embed": round(len(chunks) / timer.seconds["embed"], 2) if timer.seconds["embed"] else None,
+            "chunks_per_s_index": round(len(chunks) / timer.seconds["index"], 2) if timer.seconds["index"] else None,
+            "queries_per_s": round(len(queries) / timer.seconds["query"], 2) if timer.seconds["query"] else None,
+            "queries_per_s_batch": round(len(queries) / timer.seconds["query_batch"], 2) if timer.seconds["query_batch"] else None,
+        },
+        "query_latency_ms": {
+            "p50": percentile_ms(latencies, 50),
+            "p95": percentile_ms(latencies, 95),
+            "p99": percentile_ms(latencies, 99),
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ingest -> chunk -> embed -> index -> query benchmark.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--index-type", type=str, default="flat")
+    parser.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the fake LLM sleeps per call.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="bench_pipeline.json")
+    parser.add_argument("--profile-dir", type=str, default=None, help="Dump a cProfile .prof file per stage here.")
+    parser.add_argument("--metrics-file", type=str, default=None, help="Enable metrics and write them here in Prometheus format.")
+    args = parser.parse_args()
+
+    if args.metrics_file:
+        metrics.enable()
+
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    embedder = Embedder(model_name=args.model)
+    model_load_seconds = time.perf_counter() - start
+
+    runs = []
+    for size in args.sizes:
+        profile_dir = os.path.join(args.profile_dir, size) if args.profile_dir else None
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        result = run_size(size, SIZES[size], embedder, args, StageTimer(profile_dir))
+        print(json.dumps(result))
+        runs.append(result)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "model": args.model,
+        "model_load_seconds": round(model_load_seconds, 3),
+        "index_type": args.index_type,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Wrote {args.output}")
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+        print(f"Wrote {args.metrics_file}")
+
+
+if __name__ == "__main__":
+    main()
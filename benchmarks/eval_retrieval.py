@@ -0,0 +1,86 @@
+import sys
+import os
+import json
+import zlib
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.embedder import Embedder
+from src.query_engine import RETRIEVAL_MODES, QueryEngine
+from src.utils import clean_text
+from src.vector_store import VectorStore
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "retrieval_corpus.json")
+
+
+class NullLLM:
+    model = "none"
+
+
+class HashingEmbedder:
+    # Offline stand-in for when the model cannot be downloaded: hashed character trigrams.
+    # It only shows whether fusion helps a weak dense retriever; report model numbers where possible.
+    cache_tag = "hashing"
+
+    def __init__(self, dim: int = 384):
+        self.dimension = dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f" {text.lower()} "
+            for i in range(len(padded) - 2):
+                vectors[row, zlib.crc32(padded[i:i + 3].encode("utf-8")) % self.dimension] += 1.0
+        return np.log1p(vectors)
+
+
+def recall_at_k(retrieved: list[list[str]], relevant: list[list[str]], k: int) -> float:
+    scores = [len(set(ids[:k]) & set(rel)) / len(rel) for ids, rel in zip(retrieved, relevant)]
+    return sum(scores) / len(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recall@k of vector vs hybrid retrieval on a fixture corpus.")
+    parser.add_argument("--fixture", type=str, default=FIXTURE)
+    parser.add_argument(
+        "--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2",
+        help="Embedding model, or 'hashing' for an offline character-trigram stand-in.",
+    )
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        fixture = json.load(f)
+
+    passages = fixture["passages"]
+    texts = [clean_text(passage["text"]) for passage in passages]
+    questions = [item["question"] for item in fixture["questions"]]
+    relevant = [item["relevant"] for item in fixture["questions"]]
+
+    embedder = HashingEmbedder() if args.model == "hashing" else Embedder(model_name=args.model)
+    results = {}
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = VectorStore(dim=embedder.dimension, store_dir=store_dir)
+        store.add(embedder.embed(texts), texts)
+        query_vectors = embedder.embed(questions)
+
+        for mode in RETRIEVAL_MODES:
+            engine = QueryEngine(llm=NullLLM(), vector_store=store, embedder=embedder, retrieval_mode=mode)
+            ids = engine.retrieve_ids(questions, query_vectors.copy(), k=max(args.k))
+            retrieved = [[passages[idx]["id"] for idx in row] for row in ids]
+            results[mode] = {f"recall@{k}": round(recall_at_k(retrieved, relevant, k), 3) for k in args.k}
+        store.close()
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+from src import metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class _CacheEntry(NamedTuple):
+    key: Hashable
+    vector: np.ndarray
+    answer: str
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1024):
+        if not 0 < similarity_threshold <= 1:
+            raise ValueError("similarity_threshold must be in (0, 1].")
+
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _drop_stale(self, key: Hashable, now: float):
+        # Entries for any other key belong to an older corpus version or model and can never hit again.
+        stale = [
+            entry_id for entry_id, entry in self._entries.items()
+            if entry.expires_at <= now or entry.key != key
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+
+    def get(self, query_vector: np.ndarray, key: Hashable) -> Optional[str]:
+        query_vector = self._normalize(query_vector)
+        now = time.monotonic()
+
+        with self._lock:
+            self._drop_stale(key, now)
+            if not self._entries:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache="answer", result="miss")
+                return None
+
+            entry_ids = list(self._entries.keys())
+            vectors = np.stack([self._entries[entry_id].vector for entry_id in entry_ids])
+            similarities = vectors @ query_vector
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache="answer", result="miss")
+                return None
+
+            entry_id = entry_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.inc(cache="answer", result="hit")
+            logging.info(f"Answer cache hit (similarity {similarities[best]:.3f}).")
+            return self._entries[entry_id].answer
+
+    def put(self, query_vector: np.ndarray, key: Hashable, answer: str):
+        now = time.monotonic()
+        with self._lock:
+            self._drop_stale(key, now)
+            self._entries[self._next_id] = _CacheEntry(key, self._normalize(query_vector), answer, now + self.ttl_seconds)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,123 @@
+import asyncio
+import random
+import logging
+from typing import Optional
+
+from groq import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncGroq,
+    GroqError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from src import metrics
+from src.groq_llm import LLMError, get_api_key
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def create_async_groq_client(base_url: Optional[str] = None, api_key: Optional[str] = None) -> AsyncGroq:
+    # Retries are handled by AsyncGroqLLM so that they respect its concurrency limit.
+    return AsyncGroq(api_key=api_key or get_api_key(), base_url=base_url, max_retries=0)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncGroqLLM:
+    def __init__(
+        self,
+        model: str = "llama3-8b-8192",
+        client: Optional[AsyncGroq] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ):
+        self.client = client if client is not None else create_async_groq_client()
+        self.model = model
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.retries = 0
+        logging.info(f"AsyncGroqLLM initialized with model: {self.model} (max_concurrency={max_concurrency})")
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter keeps many clients that hit the same 429 from retrying in lockstep.
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    async def _complete(self, prompt: str, system_prompt: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.upstream_calls += 1
+                    with metrics.stage("llm_generate"):
+                        response = await self.client.chat.completions.create(
+                            model=self.model,
+                            messages=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": prompt},
+                            ],
+                            max_tokens=1500,
+                            temperature=0.7,
+                        )
+                metrics.LLM_REQUESTS.inc(result="ok")
+                metrics.record_llm_usage(getattr(response, "usage", None))
+                return response.choices[0].message.content.strip()
+            except RETRYABLE_ERRORS as e:
+                metrics.LLM_REQUESTS.inc(result="retryable_error")
+                if attempt == self.max_retries:
+                    logging.error(f"Giving up after {attempt + 1} attempts in AsyncGroqLLM.generate: {e}")
+                    return LLMError("Error: Could not generate a response due to an API issue.")
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                logging.warning(f"Retryable API error ({type(e).__name__}); retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+            except GroqError as e:
+                metrics.LLM_REQUESTS.inc(result="error")
+                logging.error(f"API error during AsyncGroqLLM.generate: {e}")
+                return LLMError("Error: Could not generate a response due to an API issue.")
+            except Exception as e:
+                metrics.LLM_REQUESTS.inc(result="error")
+                logging.error(f"An unexpected error occurred in AsyncGroqLLM.generate: {e}")
+                return LLMError("Error: An unexpected error occurred while generating a response.")
+
+    async def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        key = (self.model, system_prompt, prompt)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced_calls += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._complete(prompt, system_prompt))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled caller does not cancel the request for the others sharing it.
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "retries": self.retries,
+        }
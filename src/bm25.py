@@ -0,0 +1,129 @@
+import re
+import math
+import heapq
+import sqlite3
+import logging
+from collections import Counter, defaultdict
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_TERM_RE = re.compile(r'\w+')
+
+# Function words carry no ranking signal and have the longest posting lists.
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "what when where which who why how with do does did can could would should will".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [term for term in _TERM_RE.findall(text.lower()) if term not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = 60) -> list[int]:
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    # Postings live in the store's SQLite file so they share its transactions and crash recovery.
+    def __init__(self, conn: sqlite3.Connection, k1: float = 1.5, b: float = 0.75):
+        self.conn = conn
+        self.k1 = k1
+        self.b = b
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS bm25_postings ("
+            "term TEXT NOT NULL, chunk_id INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS bm25_postings_chunk ON bm25_postings (chunk_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS bm25_docs (chunk_id INTEGER PRIMARY KEY, length INTEGER NOT NULL)")
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        doc_count, total_length = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM bm25_docs").fetchone()
+        self.doc_count = doc_count
+        self.total_length = total_length
+
+    def add(self, chunk_ids, texts):
+        documents = dict(zip(chunk_ids, texts))
+        # Re-adding an id replaces it, so its old postings and length must not be counted twice.
+        replaced = self._lengths(list(documents))
+        if replaced:
+            self._delete(list(replaced))
+            self.doc_count -= len(replaced)
+            self.total_length -= sum(replaced.values())
+
+        postings = []
+        docs = []
+        for chunk_id, text in documents.items():
+            terms = tokenize(text)
+            docs.append((chunk_id, len(terms)))
+            postings.extend((term, chunk_id, tf) for term, tf in Counter(terms).items())
+            self.total_length += len(terms)
+        self.conn.executemany("INSERT INTO bm25_postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+        self.conn.executemany("INSERT INTO bm25_docs (chunk_id, length) VALUES (?, ?)", docs)
+        self.doc_count += len(docs)
+
+    def _lengths(self, chunk_ids: list[int]) -> dict[int, int]:
+        lengths = {}
+        # Stay under SQLite's bound-parameter limit on older builds.
+        for start in range(0, len(chunk_ids), 900):
+            batch = chunk_ids[start:start + 900]
+            placeholders = ",".join("?" * len(batch))
+            lengths.update(self.conn.execute(
+                f"SELECT chunk_id, length FROM bm25_docs WHERE chunk_id IN ({placeholders})", batch
+            ).fetchall())
+        return lengths
+
+    def _delete(self, chunk_ids):
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        self.conn.executemany("DELETE FROM bm25_postings WHERE chunk_id = ?", rows)
+        self.conn.executemany("DELETE FROM bm25_docs WHERE chunk_id = ?", rows)
+
+    def remove(self, chunk_ids):
+        self._delete(chunk_ids)
+        self.refresh_stats()
+
+    def remove_orphans(self):
+        # Drops postings for chunks that no longer exist in the store's chunks table.
+        self.conn.execute("DELETE FROM bm25_postings WHERE chunk_id NOT IN (SELECT id FROM chunks)")
+        self.conn.execute("DELETE FROM bm25_docs WHERE chunk_id NOT IN (SELECT id FROM chunks)")
+        self.refresh_stats()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM bm25_postings")
+        self.conn.execute("DELETE FROM bm25_docs")
+        self.doc_count = 0
+        self.total_length = 0
+
+    def search(self, query: str, k: int = 5, allowed_ids: Optional[set[int]] = None) -> list[tuple[float, int]]:
+        terms = list(set(tokenize(query)))
+        if not terms or self.doc_count == 0:
+            return []
+
+        placeholders = ",".join("?" * len(terms))
+        document_frequency = dict(self.conn.execute(
+            f"SELECT term, COUNT(*) FROM bm25_postings WHERE term IN ({placeholders}) GROUP BY term", terms
+        ).fetchall())
+        rows = self.conn.execute(
+            "SELECT p.term, p.chunk_id, p.tf, d.length FROM bm25_postings p "
+            f"JOIN bm25_docs d ON d.chunk_id = p.chunk_id WHERE p.term IN ({placeholders})",
+            terms,
+        ).fetchall()
+
+        avg_length = self.total_length / self.doc_count
+        scores = defaultdict(float)
+        for term, chunk_id, tf, length in rows:
+            if allowed_ids is not None and chunk_id not in allowed_ids:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+
+        return heapq.nlargest(k, ((score, chunk_id) for chunk_id, score in scores.items()))
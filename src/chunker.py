@@ -1,16 +1,124 @@
-def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
-    if not text:
-        return []
-
-    chunks = []
-    start_index = 0
-    text_length = len(text)
-
-    while start_index < text_length:
-        end_index = start_index + chunk_size
-        chunk = text[start_index:end_index]
-        chunks.append(chunk)
-        
-        start_index += chunk_size - chunk_overlap
-
-    return chunks
\ No newline at end of file
+import re
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+
+class Segment(NamedTuple):
+    source: str
+    page: Optional[int]
+    text: str
+
+
+class Chunk(NamedTuple):
+    text: str
+    source: str
+    page: Optional[int]
+    char_offset: int
+
+
+# A sentence runs to terminal punctuation followed by whitespace, so "3.14" or "e.g" do not split it.
+_SENTENCE_RE = re.compile(r'\S[^.!?]*(?:[.!?]+(?!\s|$)[^.!?]*)*(?:[.!?]+|$)')
+_WORD_RE = re.compile(r'\S+')
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+
+def approx_token_count(text: str) -> int:
+    # Close enough to WordPiece counts for budgeting without loading a tokenizer.
+    return len(_TOKEN_RE.findall(text))
+
+
+def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
+    if not text:
+        return []
+
+    chunks = []
+    start_index = 0
+    text_length = len(text)
+
+    while start_index < text_length:
+        end_index = start_index + chunk_size
+        chunk = text[start_index:end_index]
+        chunks.append(chunk)
+        
+        start_index += chunk_size - chunk_overlap
+
+    return chunks
+
+
+def _iter_sentences(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[tuple[int, str, int]]:
+    for match in _SENTENCE_RE.finditer(text):
+        sentence = match.group().rstrip()
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield match.start(), sentence, tokens
+            continue
+
+        # A single sentence over budget is split on word boundaries instead.
+        offset = match.start()
+        words = []
+        word_tokens = 0
+        for word_match in _WORD_RE.finditer(sentence):
+            word = word_match.group()
+            tokens = count_tokens(word)
+            if words and word_tokens + tokens > max_tokens:
+                yield offset, " ".join(words), word_tokens
+                offset = match.start() + word_match.start()
+                words = []
+                word_tokens = 0
+            words.append(word)
+            word_tokens += tokens
+        if words:
+            yield offset, " ".join(words), word_tokens
+
+
+def chunk_segments(
+    segments: Iterable[Segment],
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+    count_tokens: Optional[Callable[[str], int]] = None,
+) -> Iterator[Chunk]:
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens.")
+    count_tokens = count_tokens or approx_token_count
+
+    group = None
+    page_offset = 0
+    window = []  # (offset, sentence, tokens) packed into the current chunk
+    window_tokens = 0
+
+    def flush():
+        offset = window[0][0]
+        return Chunk(" ".join(sentence for _, sentence, _ in window), group[0], group[1], offset)
+
+    for segment in segments:
+        if not segment.text:
+            continue
+
+        if (segment.source, segment.page) != group:
+            if window:
+                yield flush()
+            group = (segment.source, segment.page)
+            page_offset = 0
+            window = []
+            window_tokens = 0
+
+        for offset, sentence, tokens in _iter_sentences(segment.text, max_tokens, count_tokens):
+            if window and window_tokens + tokens > max_tokens:
+                yield flush()
+                # Carry trailing sentences forward as overlap, within the overlap budget.
+                carried = []
+                carried_tokens = 0
+                for item in reversed(window):
+                    if carried_tokens + item[2] > overlap_tokens or carried_tokens + item[2] + tokens > max_tokens:
+                        break
+                    carried.insert(0, item)
+                    carried_tokens += item[2]
+                window = carried
+                window_tokens = carried_tokens
+
+            window.append((page_offset + offset, sentence, tokens))
+            window_tokens += tokens
+
+        page_offset += len(segment.text) + 1
+
+    if window:
+        yield flush()
@@ -0,0 +1,200 @@
+import re
+import logging
+import numpy as np
+from typing import Callable, NamedTuple, Optional
+
+from src.chunker import approx_token_count
+from src.vector_store import ChunkRecord
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+DEFAULT_CONTEXT_WINDOW = 8192
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "gemma2-9b-it": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def context_window(model: str) -> int:
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    # Groq model ids often end in their window size, e.g. "mixtral-8x7b-32768".
+    match = re.search(r'-(\d{4,6})$', model or "")
+    return int(match.group(1)) if match else DEFAULT_CONTEXT_WINDOW
+
+
+def context_budget(model: str, max_output_tokens: int = 1500, reserved_tokens: int = 400) -> int:
+    # reserved_tokens covers the system prompt, question and prompt scaffolding.
+    return max(context_window(model) - max_output_tokens - reserved_tokens, 256)
+
+
+class ContextResult(NamedTuple):
+    text: str
+    chunk_ids: list[int]
+    tokens_used: int
+    tokens_before: int
+    tokens_saved: int
+    merged_spans: int
+    dropped_duplicates: int
+
+
+class _Span:
+    def __init__(self, chunk_id: int, record: ChunkRecord, rank: int):
+        self.chunk_ids = [chunk_id]
+        self.text = record.text
+        self.source = record.source
+        self.page = record.page
+        self.start = record.char_offset
+        self.end = None if record.char_offset is None else record.char_offset + len(record.text)
+        self.rank = rank
+
+    def can_merge(self, record: ChunkRecord) -> bool:
+        if self.start is None or record.char_offset is None:
+            return False
+        if (self.source, self.page) != (record.source, record.page):
+            return False
+        # Chunks are slices of single-spaced page text, so a one-character gap is adjacency.
+        return record.char_offset <= self.end + 1 and record.char_offset + len(record.text) >= self.start - 1
+
+    def merge(self, chunk_id: int, record: ChunkRecord):
+        start = record.char_offset
+        end = start + len(record.text)
+        if start < self.start:
+            self.text = record.text + " " + self.text if end < self.start else record.text[:self.start - start] + self.text
+            self.start = start
+        if end > self.end:
+            self.text = self.text + " " + record.text if start > self.end else self.text + record.text[self.end - start:]
+            self.end = end
+        self.chunk_ids.append(chunk_id)
+
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def maximal_marginal_relevance(
+    query_vector: np.ndarray, vectors: np.ndarray, lambda_mult: float = 0.5, k: Optional[int] = None
+) -> list[int]:
+    query_vector = query_vector.reshape(-1)
+    relevance = vectors @ query_vector
+    selected = []
+    remaining = list(range(len(vectors)))
+    limit = len(vectors) if k is None else min(k, len(vectors))
+    while len(selected) < limit:
+        if selected:
+            redundancy = np.max(vectors[remaining] @ vectors[selected].T, axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        max_tokens: int,
+        duplicate_threshold: float = 0.9,
+        use_mmr: bool = False,
+        mmr_lambda: float = 0.5,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.use_mmr = use_mmr
+        self.mmr_lambda = mmr_lambda
+        self.count_tokens = count_tokens or approx_token_count
+
+    @classmethod
+    def for_model(cls, model: str, max_output_tokens: int = 1500, **kwargs) -> "ContextBuilder":
+        return cls(max_tokens=context_budget(model, max_output_tokens=max_output_tokens), **kwargs)
+
+    def build(
+        self,
+        hits: list[tuple[int, ChunkRecord]],
+        query_vector: Optional[np.ndarray] = None,
+        hit_vectors: Optional[np.ndarray] = None,
+        k: Optional[int] = None,
+    ) -> ContextResult:
+        # With k set, hits are a candidate pool: MMR (or plain rank order) picks the k to use.
+        if self.use_mmr and query_vector is not None and hit_vectors is not None and len(hits) > 1:
+            hits = [hits[i] for i in maximal_marginal_relevance(query_vector, hit_vectors, self.mmr_lambda, k=k)]
+        elif k is not None:
+            hits = hits[:k]
+
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        tokens_before = sum(self.count_tokens(record.text) for _, record in hits)
+        tokens_before += separator_tokens * max(len(hits) - 1, 0)
+
+        # Sweep each page's hits in offset order so chains of overlapping chunks collapse into one span.
+        spans = []
+        by_offset = sorted(
+            ((rank, chunk_id, record) for rank, (chunk_id, record) in enumerate(hits)),
+            key=lambda hit: (hit[2].char_offset is None, str(hit[2].source), hit[2].page or 0, hit[2].char_offset or 0),
+        )
+        for rank, chunk_id, record in by_offset:
+            if spans and spans[-1].can_merge(record):
+                spans[-1].merge(chunk_id, record)
+                spans[-1].rank = min(spans[-1].rank, rank)
+            else:
+                spans.append(_Span(chunk_id, record, rank))
+        merged_spans = len(hits) - len(spans)
+
+        kept = []
+        kept_words = []
+        dropped_duplicates = 0
+        for span in sorted(spans, key=lambda span: span.rank):
+            words = _word_set(span.text)
+            is_duplicate = any(
+                len(words & other) / max(len(words | other), 1) >= self.duplicate_threshold
+                for other in kept_words
+            )
+            if is_duplicate:
+                dropped_duplicates += 1
+                continue
+            kept.append(span)
+            kept_words.append(words)
+
+        parts = []
+        chunk_ids = []
+        tokens_used = 0
+        for span in kept:
+            cost = self.count_tokens(span.text) + (separator_tokens if parts else 0)
+            if tokens_used + cost > self.max_tokens:
+                if parts:
+                    continue
+                # Even the best span is over budget: keep as many of its words as fit.
+                span.text = _truncate(span.text, self.max_tokens, self.count_tokens)
+                cost = self.count_tokens(span.text)
+            parts.append(span.text)
+            chunk_ids.extend(span.chunk_ids)
+            tokens_used += cost
+
+        return ContextResult(
+            text=CONTEXT_SEPARATOR.join(parts),
+            chunk_ids=chunk_ids,
+            tokens_used=tokens_used,
+            tokens_before=tokens_before,
+            tokens_saved=max(tokens_before - tokens_used, 0),
+            merged_spans=merged_spans,
+            dropped_duplicates=dropped_duplicates,
+        )
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low])
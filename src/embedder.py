@@ -1,46 +1,217 @@
-# src/embedder.py
-
-import logging
-import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-class Embedder:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = None):
-        if device is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        else:
-            self.device = device
-            
-        logging.info(f"Using device: {self.device}")
-
-        try:
-            logging.info(f"Loading embedding model: {model_name}")
-            self.model = SentenceTransformer(model_name, device=self.device)
-            logging.info("Embedding model loaded successfully.")
-        except Exception as e:
-            logging.error(f"Failed to load SentenceTransformer model '{model_name}'. Error: {e}")
-            raise
-
-    def embed(self, texts: list[str], batch_size: int = 32, normalize_embeddings: bool = True) -> np.ndarray:
-        if not texts or not isinstance(texts, list):
-            logging.warning("Input to embed is empty or not a list, returning empty array.")
-            return np.array([])
-            
-        logging.info(f"Generating embeddings for {len(texts)} chunks...")
-        
-        try:
-            embeddings = self.model.encode(
-                texts, 
-                batch_size=batch_size,
-                show_progress_bar=True, 
-                convert_to_numpy=True,
-                normalize_embeddings=normalize_embeddings
-            )
-            logging.info("Embeddings generated successfully.")
-            return embeddings
-        except Exception as e:
-            logging.error(f"An error occurred during embedding generation: {e}")
-            return np.array([])
\ No newline at end of file
+# src/embedder.py
+
+import os
+import logging
+import threading
+import itertools
+import numpy as np
+import torch
+from typing import Iterable, Iterator
+from sentence_transformers import SentenceTransformer
+
+from src import metrics
+from src.chunker import approx_token_count
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+# EMBEDDER_BACKEND picks the inference backend; EMBEDDER_THREADS caps CPU threads (0 leaves the default).
+DEFAULT_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch")
+DEFAULT_NUM_THREADS = int(os.getenv("EMBEDDER_THREADS", "0"))
+# Pre-quantized ONNX export shipped with the sentence-transformers models on the Hugging Face hub.
+DEFAULT_ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+# EMBEDDER_MEMORY_MB bounds the estimated activation memory of one encode batch in embed_stream.
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv("EMBEDDER_MEMORY_MB", "256"))
+# Rough float32 activation footprint per token: hidden-width buffers plus one attention row per head.
+ACTIVATION_WIDTH_FACTOR = 8
+ATTENTION_HEADS_ESTIMATE = 12
+
+# torch.set_num_threads is process-wide, so it is applied once by the first torch embedder;
+# later embedders in the same process share that setting.
+_torch_threads = None
+_torch_threads_lock = threading.Lock()
+
+
+def _set_torch_threads(num_threads: int):
+    global _torch_threads
+    with _torch_threads_lock:
+        if _torch_threads is None:
+            torch.set_num_threads(num_threads)
+            _torch_threads = num_threads
+        elif _torch_threads != num_threads:
+            logging.warning(
+                f"Ignoring num_threads={num_threads}: torch already uses {_torch_threads} threads in this process."
+            )
+
+
+class Embedder:
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        device: str = None,
+        backend: str = None,
+        num_threads: int = None,
+        onnx_file_name: str = None,
+    ):
+        backend = backend or DEFAULT_BACKEND
+        num_threads = DEFAULT_NUM_THREADS if num_threads is None else num_threads
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {BACKENDS}.")
+
+        if device is None:
+            self.device = "cuda" if torch.cuda.is_available() and backend == "torch" else "cpu"
+        else:
+            self.device = device
+            
+        logging.info(f"Using device: {self.device}")
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.onnx_file_name = None
+        if backend.startswith("onnx"):
+            self.onnx_file_name = onnx_file_name or (DEFAULT_ONNX_INT8_FILE if backend == "onnx-int8" else None)
+        # One instance is shared by every session in the process; encode calls are serialized.
+        self._lock = threading.Lock()
+
+        try:
+            logging.info(f"Loading embedding model: {model_name} (backend: {backend})")
+            self.model = self._load_model()
+            logging.info("Embedding model loaded successfully.")
+        except Exception as e:
+            logging.error(f"Failed to load SentenceTransformer model '{model_name}'. Error: {e}")
+            raise
+
+    def _load_model(self) -> SentenceTransformer:
+        if self.backend.startswith("torch"):
+            if self.num_threads:
+                _set_torch_threads(self.num_threads)
+            model = SentenceTransformer(self.model_name, device=self.device)
+            if self.backend == "torch-int8":
+                # Dynamic quantization stores Linear weights as int8 and quantizes activations per batch.
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            return model
+
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            session_options.intra_op_num_threads = self.num_threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+        if self.onnx_file_name:
+            model_kwargs["file_name"] = self.onnx_file_name
+        return SentenceTransformer(self.model_name, device=self.device, backend="onnx", model_kwargs=model_kwargs)
+
+    @property
+    def cache_tag(self) -> str:
+        # Different ONNX exports of one model (e.g. quantized variants) give different vectors.
+        if self.onnx_file_name:
+            return f"{self.model_name}:{self.backend}:{self.onnx_file_name}"
+        return f"{self.model_name}:{self.backend}"
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _batch_bytes(self, batch_size: int, seq_len: int) -> int:
+        per_token = ACTIVATION_WIDTH_FACTOR * self.dimension + ATTENTION_HEADS_ESTIMATE * seq_len
+        return 4 * batch_size * seq_len * per_token
+
+    def _embed_window(
+        self,
+        texts: list[str],
+        memory_budget_bytes: int,
+        max_batch_size: int,
+        normalize_embeddings: bool,
+    ) -> np.ndarray:
+        max_seq_len = self.model.max_seq_length or 512
+        # +2 for the [CLS]/[SEP] tokens the tokenizer adds.
+        lengths = [min(approx_token_count(text) + 2, max_seq_len) for text in texts]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        start = 0
+        while start < len(order):
+            # Lengths ascend, so the last item of a batch sets its padded length.
+            end = start + 1
+            while (
+                end < len(order)
+                and end - start < max_batch_size
+                and self._batch_bytes(end - start + 1, lengths[order[end]]) <= memory_budget_bytes
+            ):
+                end += 1
+
+            batch = order[start:end]
+            with self._lock, metrics.stage("embed"):
+                vectors[batch] = self.model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=normalize_embeddings,
+                )
+            start = end
+        metrics.TEXTS_EMBEDDED.inc(len(texts))
+        return vectors
+
+    def embed_stream(
+        self,
+        items: Iterable,
+        window_size: int = 1024,
+        memory_budget_mb: int = None,
+        max_batch_size: int = 256,
+        normalize_embeddings: bool = True,
+    ) -> Iterator[tuple[list, np.ndarray]]:
+        memory_budget_bytes = (memory_budget_mb or DEFAULT_MEMORY_BUDGET_MB) * 1024 * 1024
+        iterator = iter(items)
+        total = 0
+
+        while True:
+            window = list(itertools.islice(iterator, window_size))
+            if not window:
+                break
+
+            texts = [item if isinstance(item, str) else item.text for item in window]
+            try:
+                vectors = self._embed_window(texts, memory_budget_bytes, max_batch_size, normalize_embeddings)
+            except Exception as e:
+                logging.error(f"An error occurred during embedding generation: {e}")
+                raise
+
+            total += len(window)
+            yield window, vectors
+
+        logging.info(f"Streamed embeddings for {total} chunks.")
+
+    def embed(self, texts: list[str], batch_size: int = 32, normalize_embeddings: bool = True) -> np.ndarray:
+        if not texts or not isinstance(texts, list):
+            logging.warning("Input to embed is empty or not a list, returning empty array.")
+            return np.array([])
+            
+        logging.info(f"Generating embeddings for {len(texts)} chunks...")
+        
+        try:
+            with self._lock, metrics.stage("embed"):
+                embeddings = self.model.encode(
+                    texts, 
+                    batch_size=batch_size,
+                    show_progress_bar=True, 
+                    convert_to_numpy=True,
+                    normalize_embeddings=normalize_embeddings
+                )
+            metrics.TEXTS_EMBEDDED.inc(len(texts))
+            logging.info("Embeddings generated successfully.")
+            return embeddings
+        except Exception as e:
+            logging.error(f"An error occurred during embedding generation: {e}")
+            return np.array([])
+
+
+def cosine_agreement(reference: Embedder, candidate: Embedder, texts: list[str]) -> dict:
+    reference_vectors = reference.embed(texts, normalize_embeddings=True)
+    candidate_vectors = candidate.embed(texts, normalize_embeddings=True)
+    similarities = np.sum(reference_vectors * candidate_vectors, axis=1)
+    return {
+        "mean": float(np.mean(similarities)),
+        "min": float(np.min(similarities)),
+        "p01": float(np.percentile(similarities, 1)),
+    }
@@ -0,0 +1,125 @@
+import os
+import logging
+from typing import NamedTuple, Optional
+
+from src import metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# A page with less text than this and mostly covered by images is treated as a scan.
+MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "50"))
+# A page with at least this much text only OCRs images that cover a real share of it.
+DENSE_TEXT_CHARS = int(os.getenv("OCR_DENSE_TEXT_CHARS", "400"))
+SCAN_COVERAGE = 0.5
+DENSE_PAGE_MIN_IMAGE_COVERAGE = 0.1
+MIN_IMAGE_SIDE_PX = 64
+MIN_IMAGE_AREA_FRACTION = 0.02
+# OCR_DPI is the resolution scanned pages are rendered at before OCR.
+RENDER_DPI = int(os.getenv("OCR_DPI", "200"))
+# Used to estimate time saved when nothing in the document was OCRed to measure against.
+DEFAULT_OCR_SECONDS_PER_IMAGE = 0.8
+
+
+class ImageRef(NamedTuple):
+    xref: int
+    bbox: tuple
+    digest: Optional[bytes]
+
+
+class PagePlan(NamedTuple):
+    page: int
+    action: str
+    text_chars: int
+    image_count: int
+    image_coverage: float
+    ocr_images: list[ImageRef]
+    skipped_tiny: int
+    skipped_duplicate: int
+    skipped_decorative: int
+
+
+class ExtractionReport(NamedTuple):
+    source: str
+    pages: list[PagePlan]
+    ocr_tasks: int
+    ocr_seconds: float
+    estimated_seconds_saved: float
+
+    def summary(self) -> dict:
+        actions = {}
+        for plan in self.pages:
+            actions[plan.action] = actions.get(plan.action, 0) + 1
+        return {
+            "source": self.source,
+            "pages": len(self.pages),
+            "actions": actions,
+            "ocr_tasks": self.ocr_tasks,
+            "skipped_tiny": sum(p.skipped_tiny for p in self.pages),
+            "skipped_duplicate": sum(p.skipped_duplicate for p in self.pages),
+            "skipped_decorative": sum(p.skipped_decorative for p in self.pages),
+            "ocr_seconds": round(self.ocr_seconds, 3),
+            "estimated_seconds_saved": round(self.estimated_seconds_saved, 3),
+        }
+
+
+def _area(rect) -> float:
+    return max(0.0, rect[2] - rect[0]) * max(0.0, rect[3] - rect[1])
+
+
+def _clip(bbox, page_rect) -> tuple:
+    return (
+        max(bbox[0], page_rect[0]),
+        max(bbox[1], page_rect[1]),
+        min(bbox[2], page_rect[2]),
+        min(bbox[3], page_rect[3]),
+    )
+
+
+def plan_page(page, page_number: int, text: str, seen: set) -> PagePlan:
+    page_rect = tuple(page.rect)
+    page_area = _area(page_rect) or 1.0
+    text_chars = len(text.strip())
+
+    infos = page.get_image_info(hashes=True, xrefs=True)
+    # Overlapping images can push this above 1; it only feeds threshold checks.
+    coverage = sum(_area(_clip(info["bbox"], page_rect)) for info in infos) / page_area
+
+    if text_chars < MIN_TEXT_CHARS and coverage >= SCAN_COVERAGE:
+        # One render of the whole page beats OCRing the strips and tiles scanners often emit.
+        return PagePlan(page_number, "render", text_chars, len(infos), coverage, [], 0, 0, 0)
+
+    ocr_images = []
+    tiny = duplicate = decorative = 0
+    for info in infos:
+        area_fraction = _area(_clip(info["bbox"], page_rect)) / page_area
+        if min(info["width"], info["height"]) < MIN_IMAGE_SIDE_PX or area_fraction < MIN_IMAGE_AREA_FRACTION:
+            tiny += 1
+            continue
+
+        if text_chars >= DENSE_TEXT_CHARS and area_fraction < DENSE_PAGE_MIN_IMAGE_COVERAGE:
+            decorative += 1
+            continue
+
+        # Only OCRed images count as seen: a logo skipped on a dense page still gets OCRed on a sparse one.
+        key = info.get("digest") or info["xref"]
+        if key in seen:
+            duplicate += 1
+            continue
+        seen.add(key)
+        ocr_images.append(ImageRef(info["xref"], tuple(info["bbox"]), info.get("digest")))
+
+    action = "ocr_images" if ocr_images else "text"
+    return PagePlan(page_number, action, text_chars, len(infos), coverage, ocr_images, tiny, duplicate, decorative)
+
+
+def build_report(source: str, plans: list[PagePlan], ocr_tasks: int, ocr_seconds: float) -> ExtractionReport:
+    per_task = ocr_seconds / ocr_tasks if ocr_tasks else DEFAULT_OCR_SECONDS_PER_IMAGE
+    # A rendered page replaces OCR of each image fragment on it.
+    avoided = sum(p.skipped_tiny + p.skipped_duplicate + p.skipped_decorative for p in plans)
+    avoided += sum(max(0, p.image_count - 1) for p in plans if p.action == "render")
+    report = ExtractionReport(source, plans, ocr_tasks, ocr_seconds, avoided * per_task)
+    for reason in ("tiny", "duplicate", "decorative"):
+        metrics.OCR_SKIPPED.inc(sum(getattr(p, f"skipped_{reason}") for p in plans), reason=reason)
+    logging.info(f"Extraction plan for {source}: {report.summary()}")
+    return report
+
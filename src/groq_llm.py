@@ -1,79 +1,134 @@
-import os
-import logging
-import requests
-from groq import Groq, GroqError
-from functools import lru_cache
-import streamlit as st
-
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-class GroqLLM:
-    def __init__(self, model: str = "llama3-8b-8192"):
-        api_key = st.secrets["GROQ_API_KEY"]
-        if not api_key:
-            logging.error("GROQ_API_KEY environment variable not found.")
-            raise ValueError("API key for Groq is not set. Please set the GROQ_API_KEY environment variable.")
-        
-        try:
-            self.client = Groq(api_key=api_key)
-            self.model = model
-            logging.info(f"GroqLLM initialized with model: {self.model}")
-        except GroqError as e:
-            logging.error(f"Failed to initialize Groq client: {e}")
-            raise
-
-    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
-        logging.info(f"Generating response for model {self.model}")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=1500,
-                temperature=0.7,
-            )
-            return response.choices[0].message.content.strip()
-        except GroqError as e:
-            logging.error(f"API error during GroqLLM.generate: {e}")
-            return "Error: Could not generate a response due to an API issue."
-        except Exception as e:
-            logging.error(f"An unexpected error occurred in GroqLLM.generate: {e}")
-            return "Error: An unexpected error occurred while generating a response."
-
-@lru_cache(maxsize=1)
-def list_groq_models() -> list[str]:
-    api_key = st.secrets["GROQ_API_KEY"]
-    if not api_key:
-        logging.warning("GROQ_API_KEY not found, cannot fetch models from API.")
-        return ["llama3-8b-8192"]
-
-    url = "https://api.groq.com/openai/v1/models"
-    headers = {"Authorization": f"Bearer {api_key}"}
-
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-        
-        exclude_keywords = ['whisper', 'tts', 'guard']
-        valid_models = [
-            model["id"] for model in data
-            if not any(keyword in model["id"].lower() for keyword in exclude_keywords)
-        ]
-
-        if not valid_models:
-            logging.warning("No valid chat models found after filtering, returning a hardcoded default list.")
-            return ["llama3-8b-8192", "llama3-70b-8192", "gemma2-9b-it", "mixtral-8x7b-32768"]
-
-        logging.info(f"Successfully fetched and filtered Groq models: {valid_models}")
-        return valid_models
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Network error fetching Groq models: {e}")
-    except Exception as e:
-        logging.error(f"An unexpected error occurred while fetching Groq models: {e}")
-
+import os
+import logging
+import requests
+from groq import Groq, GroqError
+from functools import lru_cache
+from typing import Iterator, Optional
+import streamlit as st
+
+from src import metrics
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class LLMError(str):
+    # An error message shown in place of an answer; callers check the type, not the text, to tell it apart.
+    pass
+
+
+def get_api_key() -> str:
+    api_key = st.secrets["GROQ_API_KEY"]
+    if not api_key:
+        logging.error("GROQ_API_KEY environment variable not found.")
+        raise ValueError("API key for Groq is not set. Please set the GROQ_API_KEY environment variable.")
+    return api_key
+
+
+def create_groq_client() -> Groq:
+    api_key = get_api_key()
+    try:
+        return Groq(api_key=api_key)
+    except GroqError as e:
+        logging.error(f"Failed to initialize Groq client: {e}")
+        raise
+
+
+class GroqLLM:
+    def __init__(self, model: str = "llama3-8b-8192", client: Optional[Groq] = None):
+        self.client = client if client is not None else create_groq_client()
+        self.model = model
+        logging.info(f"GroqLLM initialized with model: {self.model}")
+
+    def generate(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
+        logging.info(f"Generating response for model {self.model}")
+        try:
+            with metrics.stage("llm_generate"):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    max_tokens=1500,
+                    temperature=0.7,
+                )
+            metrics.LLM_REQUESTS.inc(result="ok")
+            metrics.record_llm_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content.strip()
+        except GroqError as e:
+            metrics.LLM_REQUESTS.inc(result="error")
+            logging.error(f"API error during GroqLLM.generate: {e}")
+            return LLMError("Error: Could not generate a response due to an API issue.")
+        except Exception as e:
+            metrics.LLM_REQUESTS.inc(result="error")
+            logging.error(f"An unexpected error occurred in GroqLLM.generate: {e}")
+            return LLMError("Error: An unexpected error occurred while generating a response.")
+
+    def generate_stream(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> Iterator[str]:
+        logging.info(f"Streaming response for model {self.model}")
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=1500,
+                temperature=0.7,
+                stream=True,
+            )
+            usage = None
+            for chunk in metrics.timed_iter(stream, "llm_stream"):
+                # Groq reports token usage on the final chunk of a stream.
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            metrics.LLM_REQUESTS.inc(result="ok")
+            metrics.record_llm_usage(usage)
+        except GroqError as e:
+            metrics.LLM_REQUESTS.inc(result="error")
+            logging.error(f"API error during GroqLLM.generate_stream: {e}")
+            yield LLMError("Error: Could not generate a response due to an API issue.")
+        except Exception as e:
+            metrics.LLM_REQUESTS.inc(result="error")
+            logging.error(f"An unexpected error occurred in GroqLLM.generate_stream: {e}")
+            yield LLMError("Error: An unexpected error occurred while generating a response.")
+
+@lru_cache(maxsize=1)
+def list_groq_models() -> list[str]:
+    api_key = st.secrets["GROQ_API_KEY"]
+    if not api_key:
+        logging.warning("GROQ_API_KEY not found, cannot fetch models from API.")
+        return ["llama3-8b-8192"]
+
+    url = "https://api.groq.com/openai/v1/models"
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        response.raise_for_status()
+        data = response.json().get("data", [])
+        
+        exclude_keywords = ['whisper', 'tts', 'guard']
+        valid_models = [
+            model["id"] for model in data
+            if not any(keyword in model["id"].lower() for keyword in exclude_keywords)
+        ]
+
+        if not valid_models:
+            logging.warning("No valid chat models found after filtering, returning a hardcoded default list.")
+            return ["llama3-8b-8192", "llama3-70b-8192", "gemma2-9b-it", "mixtral-8x7b-32768"]
+
+        logging.info(f"Successfully fetched and filtered Groq models: {valid_models}")
+        return valid_models
+
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Network error fetching Groq models: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while fetching Groq models: {e}")
+
     return ["llama3-8b-8192", "llama3-70b-8192", "gemma2-9b-it", "mixtral-8x7b-32768"]
\ No newline at end of file
@@ -0,0 +1,197 @@
+import math
+import faiss
+import numpy as np
+import logging
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq", "auto")
+TRAINED_INDEX_TYPES = ("ivf", "ivfpq")
+
+# faiss warns below ~39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+# Below this, probing a handful of lists scans most of the data anyway, and a PQ codebook
+# (256 centroids per sub-quantizer) cannot be trained without faiss warnings.
+MIN_TRAINING_SIZE = 256 * MIN_POINTS_PER_CENTROID
+
+
+def default_nlist(ntotal: int) -> int:
+    nlist = int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // MIN_POINTS_PER_CENTROID))
+
+
+def default_pq_m(dim: int) -> int:
+    # Largest sub-quantizer count that divides dim with at least 8 dims per code.
+    for m in range(dim // 8, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def min_training_size(index_type: str, nlist: int) -> int:
+    if index_type not in TRAINED_INDEX_TYPES:
+        return 0
+    return max(MIN_TRAINING_SIZE, nlist * MIN_POINTS_PER_CENTROID)
+
+
+def build_index(
+    index_type: str,
+    dim: int,
+    train_vectors: Optional[np.ndarray] = None,
+    nlist: Optional[int] = None,
+    hnsw_m: int = 32,
+    ef_construction: int = 40,
+    pq_m: Optional[int] = None,
+    pq_bits: int = 8,
+) -> faiss.Index:
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+
+    if index_type in TRAINED_INDEX_TYPES:
+        if train_vectors is None or len(train_vectors) == 0:
+            raise ValueError(f"Index type '{index_type}' requires training vectors.")
+        nlist = nlist or default_nlist(len(train_vectors))
+        if len(train_vectors) < min_training_size(index_type, nlist):
+            raise ValueError(
+                f"Index type '{index_type}' with nlist={nlist} needs at least "
+                f"{min_training_size(index_type, nlist)} training vectors, got {len(train_vectors)}."
+            )
+
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m or default_pq_m(dim), pq_bits, faiss.METRIC_INNER_PRODUCT)
+
+        sample = sample_training_vectors(
+            train_vectors, max(nlist * MAX_POINTS_PER_CENTROID, min_training_size(index_type, nlist))
+        )
+        logging.info(f"Training {index_type} index (nlist={nlist}) on {len(sample)} vectors.")
+        index.train(sample)
+        return index
+
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+
+def sample_training_vectors(vectors: np.ndarray, max_size: int, seed: int = 1234) -> np.ndarray:
+    if len(vectors) <= max_size:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), size=max_size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+
+def unwrap_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def with_ids(index: faiss.Index) -> faiss.Index:
+    # IVF indexes store ids in their inverted lists. Anything else gets an id map; IndexIDMap
+    # over IVF would desync on removal because IVF does not renumber its internal ids.
+    if isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        lists = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(index.nlist)
+            if invlists.list_size(list_no)
+        ]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def reconstruct_all(index: faiss.Index) -> tuple[np.ndarray, np.ndarray]:
+    # Returns (ids, vectors) in matching order. IVF-PQ vectors come back decoded, so they are approximate.
+    ids = index_ids(index)
+    if len(ids) == 0:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    ivf_index = faiss.downcast_index(index)
+    if not isinstance(ivf_index, faiss.IndexIVF):
+        return ids, unwrap_index(index).reconstruct_n(0, index.ntotal)
+
+    # Stable ids are not positions, so decode the inverted lists directly: a standalone code is
+    # the list number (little-endian, coarse_code_size bytes) followed by the stored code.
+    invlists = ivf_index.invlists
+    coarse_size = ivf_index.coarse_code_size()
+    list_ids, codes = [], []
+    for list_no in range(ivf_index.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        list_ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+        list_codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size)
+        prefix = np.frombuffer(int(list_no).to_bytes(coarse_size, "little"), dtype=np.uint8)
+        codes.append(np.hstack([np.tile(prefix, (size, 1)), list_codes.reshape(size, invlists.code_size)]))
+    return np.concatenate(list_ids), ivf_index.sa_decode(np.vstack(codes))
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    return describe_index(index) != "hnsw"
+
+
+def id_selector(index: faiss.Index, ids) -> faiss.IDSelector:
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    ivf_index = faiss.downcast_index(index)
+    # IVF removal with a hashtable direct map only accepts an explicit id array.
+    if isinstance(ivf_index, faiss.IndexIVF) and ivf_index.direct_map.type == faiss.DirectMap.Hashtable:
+        selector = faiss.IDSelectorArray(ids)
+        # IDSelectorArray points into the numpy buffer instead of copying it.
+        selector.referenced_ids = ids
+        return selector
+    return faiss.IDSelectorBatch(ids)
+
+
+def search_parameters(
+    index: faiss.Index,
+    selector: faiss.IDSelector,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> faiss.SearchParameters:
+    kind = describe_index(index)
+    if kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or faiss.extract_index_ivf(index).nprobe)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or unwrap_index(index).hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def configure_search(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+
+    if ef_search is not None:
+        hnsw_index = unwrap_index(index)
+        if isinstance(hnsw_index, faiss.IndexHNSW):
+            hnsw_index.hnsw.efSearch = ef_search
+
+
+def describe_index(index: faiss.Index) -> str:
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
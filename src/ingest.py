@@ -1,98 +1,247 @@
-import os
-import pytesseract
-import docx
-import fitz  # PyMuPDF
-from PIL import Image
-from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-from src.utils import clean_text, detect_file_type
-from io import BytesIO
-import logging
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-def ingest_file(uploaded_file):
-    file_extension = detect_file_type(uploaded_file.name)
-    file_bytes = uploaded_file.read()
-    all_text = []
-
-    logging.info(f"Starting ingestion for file: {uploaded_file.name} (type: {file_extension})")
-
-    if file_extension == "pdf":
-        try:
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            for page_num, page in enumerate(doc):
-                all_text.append(page.get_text())
-
-                image_list = page.get_images(full=True)
-                for img_index, img_info in enumerate(image_list):
-                    xref = img_info[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes_data = base_image["image"]
-                    
-                    try:
-                        image = Image.open(BytesIO(image_bytes_data))
-                        ocr_text = pytesseract.image_to_string(image)
-                        if ocr_text.strip():
-                            all_text.append(f"<IMAGE_TEXT>{ocr_text.strip()}</IMAGE_TEXT>")
-                            logging.info(f"Extracted text from image {img_index+1} on page {page_num+1}.")
-                    except Exception as e:
-                        logging.warning(f"Could not process image {img_index+1} on page {page_num+1}: {e}")
-            doc.close()
-
-        except Exception as e:
-            logging.error(f"Error processing PDF file {uploaded_file.name}: {e}")
-            return None
-
-    elif file_extension == "docx":
-        try:
-            doc = docx.Document(BytesIO(file_bytes))
-            for para in doc.paragraphs:
-                all_text.append(para.text)
-            logging.info(f"Extracted {len(all_text)} paragraphs from DOCX.")
-
-        except Exception as e:
-            logging.error(f"Error processing DOCX file {uploaded_file.name}: {e}")
-            return None
-
-    elif file_extension == "pptx":
-        try:
-            prs = Presentation(BytesIO(file_bytes))
-            for slide_num, slide in enumerate(prs.slides):
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        all_text.append(shape.text)
-
-                    if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-                        try:
-                            image = shape.image
-                            image_bytes_data = image.blob
-                            
-                            pil_image = Image.open(BytesIO(image_bytes_data))
-                            ocr_text = pytesseract.image_to_string(pil_image)
-                            if ocr_text.strip():
-                                all_text.append(f"<IMAGE_TEXT>{ocr_text.strip()}</IMAGE_TEXT>")
-                                logging.info(f"Extracted text from image on slide {slide_num+1}.")
-                        except Exception as e:
-                            logging.warning(f"Could not process image on slide {slide_num+1}: {e}")
-
-        except Exception as e:
-            logging.error(f"Error processing PPTX file {uploaded_file.name}: {e}")
-            return None
-
-    elif file_extension in ["png", "jpg", "jpeg"]:
-        try:
-            image = Image.open(BytesIO(file_bytes))
-            ocr_text = pytesseract.image_to_string(image)
-            all_text.append(ocr_text)
-            logging.info("Extracted text from standalone image file.")
-        except Exception as e:
-            logging.error(f"Error processing image file {uploaded_file.name}: {e}")
-            return None
-
-    else:
-        logging.error(f"Unsupported file type: {file_extension}")
-        raise ValueError(f"Unsupported file type: {file_extension}")
-
-    final_text = "\n\n".join(all_text)
-    return clean_text(final_text)
\ No newline at end of file
+import os
+import time
+import pytesseract
+import docx
+import fitz  # PyMuPDF
+from PIL import Image
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from src.utils import clean_text, detect_file_type, iter_clean_text
+from src import metrics
+from src.chunker import Segment
+from src.extraction_planner import RENDER_DPI, ExtractionReport, build_report, plan_page
+from io import BytesIO
+from typing import NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# OCR_WORKERS <= 1 keeps the serial path; OCR_TIMEOUT is seconds per image (0 disables it).
+DEFAULT_OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+DEFAULT_OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "0"))
+# Images are downscaled to OCR_MAX_SIDE pixels and, with OCR_BINARIZE=1, thresholded before Tesseract.
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2500"))
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "1") == "1"
+
+
+class OcrTask(NamedTuple):
+    image_bytes: bytes
+    label: str
+
+
+def _otsu_threshold(image: Image.Image) -> int:
+    histogram = image.histogram()
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, 0.0
+    for i, count in enumerate(histogram):
+        background += count
+        if background == 0 or background == total:
+            continue
+        weighted_background += i * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / (total - background)
+        variance = background * (total - background) * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+
+def prepare_for_ocr(image: Image.Image, max_side: int = OCR_MAX_SIDE, binarize: bool = OCR_BINARIZE) -> Image.Image:
+    image = image.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side))
+    if binarize:
+        threshold = _otsu_threshold(image)
+        image = image.point(lambda p: 255 if p > threshold else 0)
+    return image
+
+
+def _ocr_image_bytes(image_bytes: bytes, timeout: float = 0) -> str:
+    image = prepare_for_ocr(Image.open(BytesIO(image_bytes)))
+    return pytesseract.image_to_string(image, timeout=timeout)
+
+
+def run_ocr_tasks(tasks: list[OcrTask], workers: int = 1, timeout: float = 0) -> list[Optional[str]]:
+    if not tasks:
+        return []
+
+    with metrics.stage("ocr"):
+        results = _run_ocr_tasks(tasks, workers, timeout)
+    failed = sum(1 for result in results if result is None)
+    metrics.OCR_IMAGES.inc(len(results) - failed, result="ok")
+    metrics.OCR_IMAGES.inc(failed, result="failed")
+    return results
+
+
+def _run_ocr_tasks(tasks: list[OcrTask], workers: int, timeout: float) -> list[Optional[str]]:
+    results = []
+    if workers > 1 and len(tasks) > 1:
+        logging.info(f"Running OCR on {len(tasks)} images with {min(workers, len(tasks))} worker processes.")
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(_ocr_image_bytes, task.image_bytes, timeout) for task in tasks]
+            for task, future in zip(tasks, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logging.warning(f"Could not process {task.label}: {e}")
+                    results.append(None)
+        return results
+
+    for task in tasks:
+        try:
+            results.append(_ocr_image_bytes(task.image_bytes, timeout))
+        except Exception as e:
+            logging.warning(f"Could not process {task.label}: {e}")
+            results.append(None)
+    return results
+
+
+def _assemble(parts: list, workers: int, timeout: float) -> list[tuple[Optional[int], str]]:
+    tasks = [part for _, part in parts if isinstance(part, OcrTask)]
+    ocr_results = iter(run_ocr_tasks(tasks, workers=workers, timeout=timeout))
+
+    all_text = []
+    for page, part in parts:
+        if not isinstance(part, OcrTask):
+            all_text.append((page, part))
+            continue
+
+        ocr_text = next(ocr_results)
+        if ocr_text and ocr_text.strip():
+            all_text.append((page, f"<IMAGE_TEXT>{ocr_text.strip()}</IMAGE_TEXT>"))
+            logging.info(f"Extracted text from {part.label}.")
+    return all_text
+
+
+def _plan_pdf_parts(file_bytes: bytes) -> tuple[list, list]:
+    parts, plans = [], []
+    seen = set()
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    try:
+        for page_num, page in enumerate(doc):
+            text = page.get_text()
+            plan = plan_page(page, page_num + 1, text, seen)
+            plans.append(plan)
+            parts.append((page_num + 1, text))
+
+            if plan.action == "render":
+                pixmap = page.get_pixmap(dpi=RENDER_DPI, colorspace=fitz.csGRAY)
+                parts.append((page_num + 1, OcrTask(pixmap.tobytes("png"), f"rendered page {page_num+1}")))
+                continue
+
+            for img_index, image in enumerate(plan.ocr_images):
+                if image.xref:
+                    image_bytes = doc.extract_image(image.xref)["image"]
+                else:
+                    # Inline images have no xref to extract; render their area instead.
+                    clip = fitz.Rect(image.bbox)
+                    image_bytes = page.get_pixmap(dpi=RENDER_DPI, clip=clip, colorspace=fitz.csGRAY).tobytes("png")
+                parts.append((page_num + 1, OcrTask(image_bytes, f"image {img_index+1} on page {page_num+1}")))
+    finally:
+        doc.close()
+    return parts, plans
+
+
+def _extract_parts(uploaded_file, workers: Optional[int] = None, ocr_timeout: Optional[float] = None):
+    workers = DEFAULT_OCR_WORKERS if workers is None else workers
+    ocr_timeout = DEFAULT_OCR_TIMEOUT if ocr_timeout is None else ocr_timeout
+
+    file_extension = detect_file_type(uploaded_file.name)
+    file_bytes = uploaded_file.read()
+    parts = []
+
+    logging.info(f"Starting ingestion for file: {uploaded_file.name} (type: {file_extension})")
+
+    if file_extension == "pdf":
+        try:
+            with metrics.stage("parse_pdf"):
+                parts, plans = _plan_pdf_parts(file_bytes)
+        except Exception as e:
+            logging.error(f"Error processing PDF file {uploaded_file.name}: {e}")
+            return None
+
+        start = time.perf_counter()
+        assembled = _assemble(parts, workers=workers, timeout=ocr_timeout)
+        ocr_tasks = sum(1 for _, part in parts if isinstance(part, OcrTask))
+        report = build_report(uploaded_file.name, plans, ocr_tasks, time.perf_counter() - start)
+        return assembled, report
+
+    elif file_extension == "docx":
+        try:
+            doc = docx.Document(BytesIO(file_bytes))
+            for para in doc.paragraphs:
+                parts.append((None, para.text))
+            logging.info(f"Extracted {len(parts)} paragraphs from DOCX.")
+
+        except Exception as e:
+            logging.error(f"Error processing DOCX file {uploaded_file.name}: {e}")
+            return None
+
+    elif file_extension == "pptx":
+        try:
+            prs = Presentation(BytesIO(file_bytes))
+            for slide_num, slide in enumerate(prs.slides):
+                for shape in slide.shapes:
+                    if hasattr(shape, "text"):
+                        parts.append((slide_num + 1, shape.text))
+
+                    if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+                        try:
+                            parts.append((slide_num + 1, OcrTask(shape.image.blob, f"image on slide {slide_num+1}")))
+                        except Exception as e:
+                            logging.warning(f"Could not process image on slide {slide_num+1}: {e}")
+
+        except Exception as e:
+            logging.error(f"Error processing PPTX file {uploaded_file.name}: {e}")
+            return None
+
+    elif file_extension in ["png", "jpg", "jpeg"]:
+        try:
+            parts.append((1, _ocr_image_bytes(file_bytes, ocr_timeout)))
+            logging.info("Extracted text from standalone image file.")
+        except Exception as e:
+            logging.error(f"Error processing image file {uploaded_file.name}: {e}")
+            return None
+
+    else:
+        logging.error(f"Unsupported file type: {file_extension}")
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+    return _assemble(parts, workers=workers, timeout=ocr_timeout), None
+
+
+def ingest_file(uploaded_file, workers: Optional[int] = None, ocr_timeout: Optional[float] = None):
+    extracted = _extract_parts(uploaded_file, workers=workers, ocr_timeout=ocr_timeout)
+    if extracted is None:
+        return None
+
+    parts, _ = extracted
+    return " ".join(iter_clean_text(text for _, text in parts))
+
+
+def extract_document(
+    uploaded_file, workers: Optional[int] = None, ocr_timeout: Optional[float] = None
+) -> Optional[tuple[list[Segment], Optional[ExtractionReport]]]:
+    with metrics.stage("extract"):
+        extracted = _extract_parts(uploaded_file, workers=workers, ocr_timeout=ocr_timeout)
+    if extracted is None:
+        return None
+
+    parts, report = extracted
+    segments = []
+    with metrics.stage("clean_text"):
+        for page, text in parts:
+            cleaned = clean_text(text)
+            if cleaned:
+                segments.append(Segment(uploaded_file.name, page, cleaned))
+    return segments, report
+
+
+def extract_segments(uploaded_file, workers: Optional[int] = None, ocr_timeout: Optional[float] = None):
+    extracted = extract_document(uploaded_file, workers=workers, ocr_timeout=ocr_timeout)
+    if extracted is None:
+        return None
+    return extracted[0]
@@ -0,0 +1,180 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from src import metrics
+from src.chunker import Chunk
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Bump when ingest_file/clean_text output changes so stale entries stop matching.
+INGEST_VERSION = 3
+
+
+class CacheEntry(NamedTuple):
+    text: str
+    chunks: list[Chunk]
+    embeddings: np.ndarray
+
+
+class IngestCache:
+    def __init__(self, cache_dir: str = "ingest_cache", max_bytes: int = 2 * 1024 ** 3):
+        self.cache_path = Path(cache_dir)
+        self.cache_path.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(file_bytes: bytes, settings: dict) -> str:
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        settings = dict(settings, ingest_version=INGEST_VERSION)
+        settings_blob = json.dumps(settings, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(content_hash.encode("ascii") + settings_blob).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_path / key
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry_path = self._entry_path(key)
+        if not entry_path.is_dir():
+            metrics.CACHE_LOOKUPS.inc(cache="ingest", result="miss")
+            return None
+
+        try:
+            text = (entry_path / "text.txt").read_text(encoding="utf-8")
+            with open(entry_path / "chunks.json", "r", encoding="utf-8") as f:
+                chunks = [Chunk(*chunk) for chunk in json.load(f)]
+            embeddings = np.load(entry_path / "embeddings.npy", mmap_mode="r")
+        except Exception as e:
+            logging.warning(f"Discarding unreadable ingest cache entry {key}: {e}")
+            shutil.rmtree(entry_path, ignore_errors=True)
+            metrics.CACHE_LOOKUPS.inc(cache="ingest", result="miss")
+            return None
+
+        metrics.CACHE_LOOKUPS.inc(cache="ingest", result="hit")
+        # The directory mtime doubles as the LRU timestamp.
+        os.utime(entry_path)
+        logging.info(f"Ingest cache hit for {key[:12]} ({len(chunks)} chunks).")
+        return CacheEntry(text, chunks, embeddings)
+
+    def put(self, key: str, text: str, chunks: list[Chunk], embeddings: np.ndarray):
+        writer = self.writer(key)
+        writer.add_text(text)
+        writer.add(chunks, embeddings)
+        writer.commit()
+
+    def writer(self, key: str) -> "CacheWriter":
+        return CacheWriter(self, key)
+
+    def _evict(self):
+        entries = []
+        total_bytes = 0
+        for entry_path in self.cache_path.iterdir():
+            if not entry_path.is_dir() or entry_path.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in entry_path.iterdir() if f.is_file())
+            entries.append((entry_path.stat().st_mtime, size, entry_path))
+            total_bytes += size
+
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_bytes -= size
+            logging.info(f"Evicted ingest cache entry {entry_path.name[:12]}.")
+
+
+class CacheWriter:
+    # Writes an entry window by window so callers never hold a whole document's chunks and vectors.
+    def __init__(self, cache: IngestCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.tmp_path = cache.cache_path / f".{key}.tmp-{os.getpid()}-{id(self)}"
+        self.count = 0
+        self.dim = None
+        self.failed = False
+        self._has_text = False
+        self._files = []
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        try:
+            self.tmp_path.mkdir()
+            self._text = self._open("text.txt", "w", encoding="utf-8")
+            self._chunks = self._open("chunks.json", "w", encoding="utf-8")
+            self._vectors = self._open("embeddings.raw", "wb")
+            self._chunks.write("[")
+        except Exception as e:
+            self._fail(e)
+
+    def _open(self, name: str, mode: str, **kwargs):
+        f = open(self.tmp_path / name, mode, **kwargs)
+        self._files.append(f)
+        return f
+
+    def add_text(self, text: str):
+        if self.failed:
+            return
+        try:
+            self._text.write(" " + text if self._has_text else text)
+            self._has_text = True
+        except Exception as e:
+            self._fail(e)
+
+    def add(self, chunks: list[Chunk], embeddings: np.ndarray):
+        if self.failed or not len(chunks):
+            return
+        try:
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            if self.dim is not None and embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension changed from {self.dim} to {embeddings.shape[1]}.")
+            self.dim = embeddings.shape[1]
+            for chunk in chunks:
+                self._chunks.write("," if self.count else "")
+                json.dump(list(chunk), self._chunks)
+                self.count += 1
+            self._vectors.write(embeddings.tobytes())
+        except Exception as e:
+            self._fail(e)
+
+    def commit(self) -> bool:
+        if self.failed:
+            return False
+        try:
+            self._chunks.write("]")
+            self._close_files()
+            raw_path = self.tmp_path / "embeddings.raw"
+            shape = (self.count, self.dim or 0)
+            with open(self.tmp_path / "embeddings.npy", "wb") as out, open(raw_path, "rb") as raw:
+                np.lib.format.write_array_header_1_0(
+                    out, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False, "shape": shape}
+                )
+                shutil.copyfileobj(raw, out)
+            raw_path.unlink()
+
+            entry_path = self.cache._entry_path(self.key)
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.replace(self.tmp_path, entry_path)
+            logging.info(f"Stored ingest cache entry {self.key[:12]} ({self.count} chunks).")
+        except Exception as e:
+            self._fail(e)
+            return False
+
+        self.cache._evict()
+        return True
+
+    def abort(self):
+        self._close_files()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def _close_files(self):
+        for f in self._files:
+            f.close()
+
+    def _fail(self, error: Exception):
+        # A cache write failure only costs a later cache miss, so indexing carries on.
+        logging.error(f"Failed to write ingest cache entry {self.key}: {error}")
+        self.failed = True
+        self.abort()
@@ -0,0 +1,482 @@
+import os
+import sys
+import time
+import atexit
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from src import metrics
+from src.embedder import Embedder
+from src.ingest_cache import IngestCache
+from src.pipeline import index_cached, prepare_file
+from src.vector_store import VectorStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# JOB_WORKERS is how many worker processes the UI starts (0 leaves it to `python -m src.jobs`).
+# A running job whose heartbeat is older than JOB_LEASE_SECONDS is assumed dead and requeued.
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+DEFAULT_JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+DEFAULT_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+DEFAULT_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+HEARTBEAT_SECONDS = 2.0
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Smaller than the pipeline default so progress and cancellation checks come more often.
+JOB_WINDOW_SIZE = 256
+
+QUEUED = "queued"
+RUNNING = "running"
+READY = "ready"
+INDEXING = "indexing"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# Ready jobs are embedded and wait in the ingest cache for the UI process to add them to its store;
+# one caller claims each by moving it to indexing.
+ACTIVE_STATUSES = (QUEUED, RUNNING, READY, INDEXING)
+
+COLUMNS = (
+    "id", "namespace", "course", "source", "size", "digest", "status", "stage", "progress",
+    "error", "cache_key", "chunks", "attempts", "cancel_requested", "created_at", "updated_at",
+)
+
+
+class Job(NamedTuple):
+    id: int
+    namespace: str
+    course: str
+    source: str
+    size: int
+    digest: str
+    status: str
+    stage: str
+    progress: float
+    error: Optional[str]
+    cache_key: Optional[str]
+    chunks: int
+    attempts: int
+    cancel_requested: int
+    created_at: float
+    updated_at: float
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class SpooledUpload(BytesIO):
+    # Stands in for a Streamlit UploadedFile when a worker reads the spooled copy back.
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+class JobQueue:
+    def __init__(self, jobs_dir: str = JOBS_DIR, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.jobs_path = Path(jobs_dir)
+        self.files_path = self.jobs_path / "files"
+        self.files_path.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+
+        self._lock = threading.RLock()
+        # Autocommit, so claims can take the write lock up front with BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(
+            str(self.jobs_path / "jobs.sqlite"), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                course TEXT NOT NULL,
+                source TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL DEFAULT '',
+                progress REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                cache_key TEXT,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                heartbeat_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_document ON jobs (namespace, course, source)")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _select(self, where: str, params: tuple = ()) -> list[Job]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE {where} ORDER BY id", params)
+            return [Job(*row) for row in rows]
+
+    def _file_path(self, job_id: int) -> Path:
+        return self.files_path / str(job_id)
+
+    def _discard_file(self, job_id: int):
+        self._file_path(job_id).unlink(missing_ok=True)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        jobs = self._select("id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def jobs(self, namespace: str, course: Optional[str] = None) -> list[Job]:
+        if course is None:
+            return self._select("namespace = ?", (namespace,))
+        return self._select("namespace = ? AND course = ?", (namespace, course))
+
+    def documents(self, namespace: str, course: str) -> list[Job]:
+        return self._select("namespace = ? AND course = ? AND status = ?", (namespace, course, DONE))
+
+    def submit(self, namespace: str, course: str, name: str, data: bytes) -> Job:
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, digest, status FROM jobs WHERE namespace = ? AND course = ? AND source = ? "
+                "AND status IN (?, ?, ?, ?, ?) ORDER BY id DESC",
+                (namespace, course, name, QUEUED, RUNNING, READY, INDEXING, DONE),
+            ).fetchall()
+            # Re-uploading the latest version (e.g. after a page refresh) reuses its job.
+            if rows and rows[0][1] == digest:
+                job_id = rows[0][0]
+            else:
+                self._cancel_rows(conn, [(row[0], row[2]) for row in rows if row[2] != DONE])
+                job_id = conn.execute(
+                    "INSERT INTO jobs (namespace, course, source, size, digest, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (namespace, course, name, len(data), digest, QUEUED, now, now),
+                ).lastrowid
+                # Written before the commit so no worker can claim the job without its file.
+                self._file_path(job_id).write_bytes(data)
+                logging.info(f"Queued ingestion job {job_id} for '{name}' ({len(data)} bytes).")
+        return self.get(job_id)
+
+    def _cancel_rows(self, conn: sqlite3.Connection, rows: list[tuple[int, str]]):
+        now = time.time()
+        for job_id, status in rows:
+            if status == RUNNING:
+                # The worker notices on its next heartbeat and stops at the next progress report.
+                conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (now, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (CANCELLED, now, job_id))
+                self._discard_file(job_id)
+
+    def cancel(self, job_id: int):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and row[0] in ACTIVE_STATUSES:
+                self._cancel_rows(conn, [(job_id, row[0])])
+                logging.info(f"Cancelled ingestion job {job_id}.")
+
+    def remove_document(self, namespace: str, course: str, source: str):
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, status FROM jobs WHERE namespace = ? AND course = ? AND source = ?",
+                (namespace, course, source),
+            ).fetchall()
+            self._cancel_rows(conn, [row for row in rows if row[1] in ACTIVE_STATUSES])
+            finished = [row[0] for row in rows if row[1] not in ACTIVE_STATUSES]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in finished])
+            for job_id in finished:
+                self._discard_file(job_id)
+
+    def claim(self) -> Optional[Job]:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = '', progress = 0, error = NULL, attempts = attempts + 1, "
+                "heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now, now, row[0]),
+            )
+        return self.get(row[0])
+
+    def read_upload(self, job: Job) -> SpooledUpload:
+        return SpooledUpload(self._file_path(job.id).read_bytes(), job.source)
+
+    def _update_running(self, job: Job, assignments: str, params: tuple) -> bool:
+        # attempts doubles as the lease token: a worker whose job was requeued and re-claimed can no longer update it.
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND attempts = ? AND status = ?",
+                params + (time.time(), job.id, job.attempts, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+    def heartbeat(self, job: Job) -> bool:
+        # Returns True when the worker should stop: the job was cancelled or its lease was lost.
+        if not self._update_running(job, "heartbeat_at = ?", (time.time(),)):
+            return True
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        return row is None or bool(row[0])
+
+    def update_progress(self, job: Job, stage: str, progress: float):
+        self._update_running(job, "stage = ?, progress = ?, heartbeat_at = ?", (stage, progress, time.time()))
+
+    def mark_ready(self, job: Job, cache_key: str, chunks: int) -> Optional[str]:
+        # A cancel that lands after the worker's last check still wins. Returns the resulting status,
+        # or None when the lease was lost.
+        with self._lock:
+            if not self._update_running(
+                job,
+                "status = CASE WHEN cancel_requested THEN ? ELSE ? END, stage = '', progress = 1, cache_key = ?, chunks = ?",
+                (CANCELLED, READY, cache_key, chunks),
+            ):
+                return None
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        # A row deleted in between was removed along with its document.
+        status = row[0] if row else CANCELLED
+        if status == CANCELLED:
+            self._discard_file(job.id)
+        return status
+
+    def mark_failed(self, job: Job, error: str):
+        if self._update_running(job, "status = ?, error = ?", (FAILED, error)):
+            self._discard_file(job.id)
+
+    def mark_cancelled(self, job: Job):
+        if self._update_running(job, "status = ?", (CANCELLED,)):
+            self._discard_file(job.id)
+
+    def claim_ready(self, job: Job) -> Optional[Job]:
+        # Compare-and-set, so when several sessions poll the same library only one indexes each job.
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, heartbeat_at = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (INDEXING, now, now, job.id, READY),
+            )
+            if cursor.rowcount == 0:
+                return None
+        return self.get(job.id)
+
+    def mark_done(self, job: Job):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (DONE, time.time(), job.id, INDEXING),
+            )
+            if cursor.rowcount == 0:
+                return
+            # The new version replaces whatever was indexed for this document before.
+            conn.execute(
+                "DELETE FROM jobs WHERE namespace = ? AND course = ? AND source = ? AND status = ? AND id < ?",
+                (job.namespace, job.course, job.source, DONE, job.id),
+            )
+        self._discard_file(job.id)
+
+    def requeue(self, job: Job, error: str):
+        with self._transaction() as conn:
+            status = FAILED if job.attempts >= self.max_attempts else QUEUED
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (status, error, time.time(), job.id, INDEXING),
+            )
+        if status == FAILED:
+            self._discard_file(job.id)
+
+    def requeue_stale(self, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, attempts, cancel_requested FROM jobs WHERE status = ? AND heartbeat_at < ?",
+                (RUNNING, now - lease_seconds),
+            ).fetchall()
+            for job_id, attempts, cancel_requested in rows:
+                if cancel_requested:
+                    status, error = CANCELLED, None
+                elif attempts >= self.max_attempts:
+                    status, error = FAILED, f"Worker stopped responding after {attempts} attempts."
+                else:
+                    status, error = QUEUED, None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, now, job_id)
+                )
+                if status != QUEUED:
+                    self._discard_file(job_id)
+            # A session that crashed while indexing leaves its claim behind; the upsert is idempotent, so retry it.
+            indexing = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND heartbeat_at < ?",
+                (READY, now, INDEXING, now - lease_seconds),
+            ).rowcount
+        if rows or indexing:
+            logging.warning(f"Recovered {len(rows) + indexing} ingestion job(s) from workers or sessions that stopped responding.")
+        return len(rows) + indexing
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _keep_alive(queue: JobQueue, job: Job, stop: threading.Event, cancelled: threading.Event):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        if queue.heartbeat(job):
+            cancelled.set()
+
+
+def run_job(queue: JobQueue, job: Job, embedder: Embedder, cache: IngestCache) -> str:
+    stop, cancelled = threading.Event(), threading.Event()
+    keeper = threading.Thread(target=_keep_alive, args=(queue, job, stop, cancelled), daemon=True)
+    keeper.start()
+
+    def report(stage: str, progress: float):
+        if cancelled.is_set():
+            raise JobCancelled()
+        queue.update_progress(job, stage, progress)
+
+    logging.info(f"Worker {os.getpid()} started job {job.id} for '{job.source}' (attempt {job.attempts}).")
+    try:
+        key, chunks = prepare_file(queue.read_upload(job), embedder, cache, window_size=JOB_WINDOW_SIZE, progress=report)
+        if cancelled.is_set():
+            raise JobCancelled()
+        if chunks == 0:
+            status = FAILED
+            queue.mark_failed(job, f"No text could be extracted from '{job.source}'.")
+        else:
+            status = queue.mark_ready(job, key, chunks) or READY
+    except JobCancelled:
+        status = CANCELLED
+        queue.mark_cancelled(job)
+    except Exception as e:
+        logging.error(f"Ingestion job {job.id} for '{job.source}' failed: {e}")
+        status = FAILED
+        queue.mark_failed(job, str(e))
+    finally:
+        stop.set()
+        keeper.join()
+
+    metrics.JOBS.inc(status=status)
+    logging.info(f"Job {job.id} for '{job.source}' finished as {status}.")
+    return status
+
+
+def index_ready_jobs(queue: JobQueue, namespace: str, vector_store: VectorStore, cache: IngestCache) -> list[Job]:
+    # Runs in the process that owns the vector store, so workers never write to it concurrently.
+    indexed = []
+    for job in queue.jobs(namespace):
+        if job.status != READY:
+            continue
+        job = queue.claim_ready(job)
+        if job is None:
+            continue
+        added = index_cached(cache, job.cache_key, job.source, vector_store, course=job.course)
+        if added is None:
+            logging.warning(f"Ingest cache entry for job {job.id} is gone; requeueing it.")
+            queue.requeue(job, "Ingest cache entry was evicted before indexing.")
+            continue
+        # Saved before the job is marked done, so a crash in between only repeats an idempotent upsert.
+        vector_store.save()
+        queue.mark_done(job)
+        indexed.append(job)
+    return indexed
+
+
+def run_worker(
+    jobs_dir: str = JOBS_DIR,
+    model_name: Optional[str] = None,
+    poll_seconds: float = DEFAULT_POLL_SECONDS,
+    parent_pid: Optional[int] = None,
+    slot: int = 0,
+):
+    queue = JobQueue(jobs_dir)
+    embedder = Embedder(model_name=model_name) if model_name else Embedder()
+    cache = IngestCache()
+    # Keyed by slot rather than pid, so a restarted worker overwrites its predecessor's metrics file.
+    metrics.start_exporters_from_env(instance=f"worker-{slot}")
+    logging.info(f"Ingestion worker {os.getpid()} polling {jobs_dir}.")
+
+    try:
+        while True:
+            if parent_pid is not None and os.getppid() != parent_pid:
+                logging.info(f"Ingestion worker {os.getpid()} exiting: parent process is gone.")
+                break
+            queue.requeue_stale()
+            job = queue.claim()
+            if job is None:
+                time.sleep(poll_seconds)
+                continue
+            run_job(queue, job, embedder, cache)
+    except KeyboardInterrupt:
+        # An interrupted job keeps its running status and is requeued once its lease expires.
+        logging.info(f"Ingestion worker {os.getpid()} interrupted.")
+    finally:
+        queue.close()
+
+
+def start_workers(count: int, jobs_dir: str = JOBS_DIR, model_name: Optional[str] = None) -> list[subprocess.Popen]:
+    # Separate interpreters rather than multiprocessing: under Streamlit the app script is __main__,
+    # and spawned children would run it again while importing it.
+    command = [sys.executable, "-m", "src.jobs", "--workers", "1", "--jobs-dir", jobs_dir, "--parent-pid", str(os.getpid())]
+    if model_name:
+        command += ["--model", model_name]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.getenv("PYTHONPATH")])))
+    workers = [subprocess.Popen(command + ["--slot", str(slot)], env=env) for slot in range(count)]
+
+    def stop_workers():
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            try:
+                worker.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+
+    if workers:
+        atexit.register(stop_workers)
+        logging.info(f"Started {len(workers)} ingestion worker process(es).")
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingestion workers for the job queue in JOBS_DIR.")
+    parser.add_argument("--workers", type=int, default=max(1, DEFAULT_JOB_WORKERS))
+    parser.add_argument("--jobs-dir", type=str, default=JOBS_DIR)
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--parent-pid", type=int, default=None, help="Exit when this process is gone.")
+    parser.add_argument("--slot", type=int, default=0, help="Worker number, used to name its metrics file.")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        run_worker(args.jobs_dir, model_name=args.model, parent_pid=args.parent_pid, slot=args.slot)
+        return
+
+    workers = start_workers(args.workers, jobs_dir=args.jobs_dir, model_name=args.model)
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
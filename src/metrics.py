@@ -0,0 +1,318 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# METRICS_ENABLED=1 turns recording on; METRICS_PORT serves /metrics on localhost and
+# METRICS_FILE is rewritten every METRICS_FILE_INTERVAL seconds, both in Prometheus text format.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_TIMER = nullcontext()
+
+
+class _State:
+    enabled = METRICS_ENABLED
+
+
+def enable():
+    _State.enabled = True
+
+
+def disable():
+    _State.enabled = False
+
+
+def is_enabled() -> bool:
+    return _State.enabled
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not _State.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not _State.enabled:
+            return
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not _State.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last slot is +Inf), then sum and count.
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        if not _State.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_key(labels))
+        return state[2] if state else 0
+
+    def total(self, **labels) -> float:
+        state = self._values.get(_label_key(labels))
+        return state[1] if state else 0.0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric '{metric.name}' is already registered as a {existing.kind}.")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def reset(self):
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Time spent in each pipeline stage.")
+OCR_IMAGES = REGISTRY.counter("rag_ocr_images_total", "Images sent to OCR, by result.")
+OCR_SKIPPED = REGISTRY.counter("rag_ocr_images_skipped_total", "Images the extraction planner did not OCR, by reason.")
+CHUNKS_INDEXED = REGISTRY.counter("rag_chunks_indexed_total", "Chunks added to a vector store.")
+TEXTS_EMBEDDED = REGISTRY.counter("rag_texts_embedded_total", "Texts passed through the embedding model.")
+CACHE_LOOKUPS = REGISTRY.counter("rag_cache_lookups_total", "Cache lookups, by cache and result.")
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "LLM tokens reported by the API, by kind.")
+LLM_REQUESTS = REGISTRY.counter("rag_llm_requests_total", "LLM requests, by result.")
+INDEX_VECTORS = REGISTRY.gauge("rag_index_vectors", "Vectors held by the vector store indexes open in this process.")
+JOBS = REGISTRY.counter("rag_jobs_total", "Ingestion jobs finished by a worker, by status.")
+
+
+def record_llm_usage(usage):
+    if not _State.enabled or usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+def stage(name: str):
+    return STAGE_SECONDS.time(stage=name)
+
+
+def timed_iter(iterable: Iterable, name: str) -> Iterator:
+    # Charges only the time spent producing items to the stage, not the consumer's work between them.
+    if not _State.enabled:
+        return iter(iterable)
+    return _timed_iter(iter(iterable), name)
+
+
+def _timed_iter(iterator: Iterator, name: str) -> Iterator:
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
+
+
+def write_prometheus(path: str):
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(render_prometheus(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def _write_periodically(path: str, interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            write_prometheus(path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics to {path}: {e}")
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def _instance_path(path: str, instance: str) -> str:
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}-{instance}{path.suffix}"))
+
+
+def start_exporters_from_env(instance: Optional[str] = None):
+    # Worker processes pass an instance name: they write their own METRICS_FILE variant and leave the port to the UI.
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started or not _State.enabled:
+            return
+        _exporters_started = True
+        if METRICS_PORT and instance is None:
+            start_http_server(METRICS_PORT)
+        if METRICS_FILE:
+            path = METRICS_FILE if instance is None else _instance_path(METRICS_FILE, instance)
+            threading.Thread(
+                target=_write_periodically, args=(path, METRICS_FILE_INTERVAL), name="metrics-file", daemon=True
+            ).start()
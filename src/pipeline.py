@@ -0,0 +1,191 @@
+import logging
+import numpy as np
+from typing import Callable, Optional
+
+from src.ingest import extract_segments
+from src.chunker import Chunk, chunk_segments
+from src.embedder import Embedder
+from src.ingest_cache import IngestCache
+from src.vector_store import VectorStore
+from src import metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Share of prepare_file progress reported once extraction (including OCR) is done; embedding fills the rest.
+EXTRACT_PROGRESS = 0.5
+
+
+def chunk_metadata(chunk: Chunk, course: Optional[str] = None) -> dict:
+    return {"source": chunk.source, "page": chunk.page, "char_offset": chunk.char_offset, "course": course}
+
+
+def _cache_key(cache: IngestCache, uploaded_file, embedder: Embedder, max_tokens: int, overlap_tokens: int) -> str:
+    file_bytes = uploaded_file.read()
+    uploaded_file.seek(0)
+    return cache.make_key(file_bytes, {
+        "chunker": "sentences",
+        "max_tokens": max_tokens,
+        "overlap_tokens": overlap_tokens,
+        "model_name": embedder.cache_tag,
+    })
+
+
+def process_file(
+    uploaded_file,
+    embedder: Embedder,
+    cache: Optional[IngestCache] = None,
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+) -> tuple[list[Chunk], np.ndarray]:
+    key = None
+    if cache is not None:
+        key = _cache_key(cache, uploaded_file, embedder, max_tokens, overlap_tokens)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry.chunks, entry.embeddings
+
+    segments = extract_segments(uploaded_file)
+    if not segments:
+        return [], np.array([])
+
+    with metrics.stage("chunk"):
+        chunks = list(chunk_segments(segments, max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+    vectors = embedder.embed([chunk.text for chunk in chunks])
+
+    if cache is not None and vectors.size > 0:
+        text = " ".join(segment.text for segment in segments)
+        cache.put(key, text, chunks, vectors)
+    return chunks, vectors
+
+
+def prepare_file(
+    uploaded_file,
+    embedder: Embedder,
+    cache: IngestCache,
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+    window_size: int = 1024,
+    progress: Optional[Callable[[str, float], None]] = None,
+) -> tuple[str, int]:
+    # Runs extraction, chunking and embedding into the ingest cache without touching a vector store,
+    # so it can run in a worker process; index_cached later adds the result to a store.
+    key = _cache_key(cache, uploaded_file, embedder, max_tokens, overlap_tokens)
+    entry = cache.get(key)
+    if entry is not None:
+        return key, len(entry.chunks)
+
+    report = progress or (lambda stage, fraction: None)
+    report("extract", 0.0)
+    segments = extract_segments(uploaded_file)
+    if not segments:
+        return key, 0
+
+    # Progress follows the extracted text consumed by the lazy chunker.
+    total_chars = sum(len(segment.text) for segment in segments) or 1
+    consumed_chars = 0
+
+    def counted_segments():
+        nonlocal consumed_chars
+        for segment in segments:
+            consumed_chars += len(segment.text)
+            yield segment
+
+    report("embed", EXTRACT_PROGRESS)
+    chunks = metrics.timed_iter(
+        chunk_segments(counted_segments(), max_tokens=max_tokens, overlap_tokens=overlap_tokens), "chunk"
+    )
+    writer = cache.writer(key)
+    added = 0
+    try:
+        for window, vectors in embedder.embed_stream(chunks, window_size=window_size):
+            writer.add(window, vectors)
+            added += len(window)
+            report("embed", EXTRACT_PROGRESS + (1 - EXTRACT_PROGRESS) * consumed_chars / total_chars)
+    except BaseException:
+        writer.abort()
+        raise
+
+    if not added:
+        writer.abort()
+        return key, 0
+    for segment in segments:
+        writer.add_text(segment.text)
+    if not writer.commit():
+        raise RuntimeError(f"Could not write the ingest cache entry for '{uploaded_file.name}'.")
+    return key, added
+
+
+def index_cached(
+    cache: IngestCache,
+    key: str,
+    source: str,
+    vector_store: VectorStore,
+    course: Optional[str] = None,
+    window_size: int = 1024,
+) -> Optional[int]:
+    entry = cache.get(key)
+    if entry is None:
+        return None
+
+    # Embeddings are memory-mapped, so adding them window by window keeps only one window resident.
+    windows = (
+        (
+            entry.embeddings[start:start + window_size],
+            [chunk.text for chunk in entry.chunks[start:start + window_size]],
+            [chunk_metadata(chunk, course) for chunk in entry.chunks[start:start + window_size]],
+        )
+        for start in range(0, len(entry.chunks), window_size)
+    )
+    vector_store.upsert_document_windows(source, windows, course=course)
+    return len(entry.chunks)
+
+
+def index_file(
+    uploaded_file,
+    embedder: Embedder,
+    vector_store: VectorStore,
+    cache: Optional[IngestCache] = None,
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+    window_size: int = 1024,
+    course: Optional[str] = None,
+) -> int:
+    # Re-indexing a file replaces its previous chunks, so the work stays proportional to that file.
+    key = None
+    if cache is not None:
+        key = _cache_key(cache, uploaded_file, embedder, max_tokens, overlap_tokens)
+        added = index_cached(cache, key, uploaded_file.name, vector_store, course=course, window_size=window_size)
+        if added is not None:
+            return added
+
+    # A file that fails to extract leaves its previously indexed version in place.
+    segments = extract_segments(uploaded_file)
+    if not segments:
+        return 0
+
+    # Chunks are produced lazily and each embedded window goes straight into the store and the
+    # cache writer, so nothing here holds on to the whole file's chunks or vectors.
+    chunks = metrics.timed_iter(chunk_segments(segments, max_tokens=max_tokens, overlap_tokens=overlap_tokens), "chunk")
+    writer = cache.writer(key) if cache is not None else None
+
+    def windows():
+        for window, vectors in embedder.embed_stream(chunks, window_size=window_size):
+            if writer is not None:
+                writer.add(window, vectors)
+            yield vectors, [chunk.text for chunk in window], [chunk_metadata(chunk, course) for chunk in window]
+
+    try:
+        added = len(vector_store.upsert_document_windows(uploaded_file.name, windows(), course=course))
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        if added:
+            for segment in segments:
+                writer.add_text(segment.text)
+            writer.commit()
+        else:
+            writer.abort()
+    return added
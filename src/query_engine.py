@@ -1,70 +1,307 @@
-import logging
-from typing import Optional
-
-# Assuming these are your other modules
-from src.groq_llm import GroqLLM
-from src.vector_store import VectorStore
-from src.embedder import Embedder
-
-# Configure logging for better diagnostics
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-class QueryEngine:
-    def __init__(self, llm: GroqLLM, vector_store: VectorStore, embedder: Embedder):
-        if not all([llm, vector_store, embedder]):
-            raise ValueError("LLM, VectorStore, and Embedder must all be provided and initialized.")
-        
-        self.llm = llm
-        self.vector_store = vector_store
-        self.embedder = embedder
-        logging.info("QueryEngine initialized successfully with injected dependencies.")
-
-    def build_context(self, query: str, k: int = 5) -> str:
-        logging.info(f"Embedding query: '{query[:50]}...'")
-        query_vector = self.embedder.embed([query])
-
-        if query_vector.size == 0:
-            logging.warning("Query embedding resulted in an empty vector.")
-            return ""
-
-        logging.info(f"Searching for top {k} relevant chunks.")
-        search_results = self.vector_store.search(query_vector=query_vector, k=k)
-
-        context = "\n\n---\n\n".join([text for score, text in search_results])
-        return context
-
-    def _build_prompt(self, query: str, context: str) -> tuple[str, str]:
-        system_prompt = (
-            "You are an expert study assistant. Your task is to answer the user's question "
-            "based exclusively on the provided context. Do not use any external knowledge. "
-            "Synthesize the information from the context into a clear, concise, and helpful answer. "
-            "If the answer is not found within the context, state clearly that you "
-            "cannot answer the question with the given information."
-        )
-
-        user_prompt = f"""
-        **Context:**
-        {context}
-
-        ---
-
-        **Question:**
-        {query}
-        """
-        return system_prompt, user_prompt.strip()
-
-    def ask(self, query: str) -> str:
-        logging.info("Starting RAG pipeline for a new query.")
-        
-        context = self.build_context(query)
-        if not context.strip():
-            logging.warning("No context was retrieved for the query. Cannot generate an answer.")
-            return "I could not find any relevant information in the uploaded documents to answer your question."
-
-        system_prompt, user_prompt = self._build_prompt(query, context)
-        
-        logging.info("Sending prompt to LLM for answer generation.")
-        answer = self.llm.generate(prompt=user_prompt, system_prompt=system_prompt)
-        
-        logging.info("Successfully generated an answer.")
-        return answer
\ No newline at end of file
+import asyncio
+import logging
+import numpy as np
+from typing import Iterator, Optional, Union
+
+# Assuming these are your other modules
+from src.groq_llm import GroqLLM, LLMError
+from src.async_llm import AsyncGroqLLM
+from src.vector_store import VectorStore
+from src.embedder import Embedder
+from src.answer_cache import SemanticAnswerCache
+from src.bm25 import reciprocal_rank_fusion
+from src.context_builder import ContextBuilder, ContextResult
+from src import metrics
+
+# Configure logging for better diagnostics
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+NO_CONTEXT_ANSWER = "I could not find any relevant information in the uploaded documents to answer your question."
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+class BaseQueryEngine:
+    # Retrieval, context building, prompting and the answer cache; subclasses add the sync or async entry points.
+    def __init__(
+        self,
+        llm: Union[GroqLLM, AsyncGroqLLM],
+        vector_store: VectorStore,
+        embedder: Embedder,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        retrieval_mode: str = "vector",
+        candidate_k: int = 20,
+        rrf_k: int = 60,
+        context_builder: Optional[ContextBuilder] = None,
+        filters: Optional[dict] = None,
+    ):
+        if not all([llm, vector_store, embedder]):
+            raise ValueError("LLM, VectorStore, and Embedder must all be provided and initialized.")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}'. Expected one of {RETRIEVAL_MODES}.")
+        
+        self.llm = llm
+        self.vector_store = vector_store
+        self.embedder = embedder
+        self.answer_cache = answer_cache
+        self.retrieval_mode = retrieval_mode
+        self.candidate_k = candidate_k
+        self.rrf_k = rrf_k
+        self.context_builder = context_builder or ContextBuilder.for_model(llm.model)
+        # Metadata filters (course, source, page) applied to every search; see VectorStore.FILTER_COLUMNS.
+        self.filters = filters
+        logging.info(f"{type(self).__name__} initialized successfully with injected dependencies.")
+
+    def _cache_key(self) -> tuple:
+        filters = repr(sorted(self.filters.items())) if self.filters else None
+        return (self.vector_store.version, self.retrieval_mode, self.llm.model, self.embedder.cache_tag, filters)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        logging.info(f"Embedding query: '{query[:50]}...'")
+        with metrics.stage("embed_query"):
+            return self.embedder.embed([query])
+
+    def build_context(self, query: str, k: int = 5) -> str:
+        return self._build_context_for_vector(self._embed_query(query), query, k=k)
+
+    def _build_context_for_vector(self, query_vector: np.ndarray, query: str, k: int = 5) -> str:
+        if query_vector.size == 0:
+            logging.warning("Query embedding resulted in an empty vector.")
+            return ""
+
+        return self._build_contexts_for_vectors(query_vector.reshape(1, -1), [query], k=k)[0]
+
+    def build_context_many(self, queries: list[str], k: int = 5) -> list[str]:
+        return [result.text for result in self.build_context_results(queries, k=k)]
+
+    def build_context_results(self, queries: list[str], k: int = 5) -> list[ContextResult]:
+        # Results carry per-query token and dedup stats alongside the text, so concurrent callers never share them.
+        if not queries:
+            return []
+
+        logging.info(f"Embedding {len(queries)} queries in one batch.")
+        query_vectors = self.embedder.embed(list(queries))
+
+        if query_vectors.size == 0:
+            logging.warning("Batch query embedding resulted in an empty array.")
+            return [self.context_builder.build([]) for _ in queries]
+
+        return self._context_results_for_vectors(query_vectors, list(queries), k=k)
+
+    def retrieve_ids(self, queries: list[str], query_vectors: np.ndarray, k: int = 5) -> list[list[int]]:
+        if self.retrieval_mode == "vector":
+            if self.context_builder.use_mmr:
+                # MMR needs a wider pool than k to have anything to trade relevance against.
+                k = max(k, self.candidate_k)
+            hits_per_query = self.vector_store.search_batch_ids(query_vectors, k=k, filters=self.filters)
+            return [[idx for _, idx in hits] for hits in hits_per_query]
+
+        # Hybrid: fuse dense and BM25 candidate lists by reciprocal rank.
+        candidate_k = max(k, self.candidate_k)
+        vector_hits = self.vector_store.search_batch_ids(query_vectors, k=candidate_k, filters=self.filters)
+        results = []
+        for query, hits in zip(queries, vector_hits):
+            lexical_hits = self.vector_store.lexical_search_ids(query, k=candidate_k, filters=self.filters)
+            fused = reciprocal_rank_fusion(
+                [[idx for _, idx in hits], [idx for _, idx in lexical_hits]], k=self.rrf_k
+            )
+            results.append(fused[:candidate_k] if self.context_builder.use_mmr else fused[:k])
+        return results
+
+    def _build_contexts_for_vectors(self, query_vectors: np.ndarray, queries: list[str], k: int = 5) -> list[str]:
+        return [result.text for result in self._context_results_for_vectors(query_vectors, queries, k=k)]
+
+    def _context_results_for_vectors(self, query_vectors: np.ndarray, queries: list[str], k: int = 5) -> list[ContextResult]:
+        logging.info(f"Searching for top {k} relevant chunks for {len(query_vectors)} queries ({self.retrieval_mode}).")
+        with metrics.stage("retrieve"):
+            ids_per_query = self.retrieve_ids(queries, query_vectors, k=k)
+        records = self.vector_store.get_records([idx for ids in ids_per_query for idx in ids])
+
+        results = []
+        for query_vector, ids in zip(query_vectors, ids_per_query):
+            hits = [(idx, records[idx]) for idx in ids if idx in records]
+            hit_vectors = None
+            if self.context_builder.use_mmr:
+                hit_vectors = self.vector_store.get_vectors([idx for idx, _ in hits])
+            with metrics.stage("build_context"):
+                result = self.context_builder.build(hits, query_vector=query_vector, hit_vectors=hit_vectors, k=k)
+            logging.info(
+                f"Context uses {result.tokens_used} tokens from {len(hits)} hits "
+                f"({result.tokens_saved} saved, {result.merged_spans} merged, {result.dropped_duplicates} duplicates dropped)."
+            )
+            results.append(result)
+        return results
+
+    def _build_prompt(self, query: str, context: str) -> tuple[str, str]:
+        system_prompt = (
+            "You are an expert study assistant. Your task is to answer the user's question "
+            "based exclusively on the provided context. Do not use any external knowledge. "
+            "Synthesize the information from the context into a clear, concise, and helpful answer. "
+            "If the answer is not found within the context, state clearly that you "
+            "cannot answer the question with the given information."
+        )
+
+        user_prompt = f"""
+        **Context:**
+        {context}
+
+        ---
+
+        **Question:**
+        {query}
+        """
+        return system_prompt, user_prompt.strip()
+
+    def _cached_answer(self, query_vector: np.ndarray) -> Optional[str]:
+        if self.answer_cache is None or query_vector.size == 0:
+            return None
+        return self.answer_cache.get(query_vector, self._cache_key())
+
+    def _cache_answer(self, query_vector: np.ndarray, answer: str):
+        if self.answer_cache is None or query_vector.size == 0:
+            return
+        if answer == NO_CONTEXT_ANSWER or isinstance(answer, LLMError):
+            return
+        self.answer_cache.put(query_vector, self._cache_key(), answer)
+
+
+class QueryEngine(BaseQueryEngine):
+    def ask(self, query: str) -> str:
+        logging.info("Starting RAG pipeline for a new query.")
+        
+        query_vector = self._embed_query(query)
+        cached = self._cached_answer(query_vector)
+        if cached is not None:
+            return cached
+
+        context = self._build_context_for_vector(query_vector, query)
+        answer = self._answer(query, context)
+        self._cache_answer(query_vector, answer)
+        return answer
+
+    def ask_many(self, queries: list[str]) -> list[str]:
+        logging.info(f"Starting RAG pipeline for a batch of {len(queries)} queries.")
+        if not queries:
+            return []
+
+        query_vectors = self.embedder.embed(list(queries))
+        if query_vectors.size == 0:
+            logging.warning("Batch query embedding resulted in an empty array.")
+            return [self._answer(query, "") for query in queries]
+
+        answers = [self._cached_answer(vector) for vector in query_vectors]
+        misses = [i for i, answer in enumerate(answers) if answer is None]
+        if misses:
+            contexts = self._build_contexts_for_vectors(query_vectors[misses], [queries[i] for i in misses])
+            for i, context in zip(misses, contexts):
+                answers[i] = self._answer(queries[i], context)
+                self._cache_answer(query_vectors[i], answers[i])
+        return answers
+
+    def ask_stream(self, query: str) -> Iterator[str]:
+        logging.info("Starting streaming RAG pipeline for a new query.")
+
+        query_vector = self._embed_query(query)
+        cached = self._cached_answer(query_vector)
+        if cached is not None:
+            yield cached
+            return
+
+        context = self._build_context_for_vector(query_vector, query)
+        if not context.strip():
+            logging.warning("No context was retrieved for the query. Cannot generate an answer.")
+            yield NO_CONTEXT_ANSWER
+            return
+
+        with metrics.stage("build_prompt"):
+            system_prompt, user_prompt = self._build_prompt(query, context)
+
+        logging.info("Streaming prompt to LLM for answer generation.")
+        parts = []
+        failed = False
+        for token in self.llm.generate_stream(prompt=user_prompt, system_prompt=system_prompt):
+            # A stream that breaks part-way still yields text first, so the joined answer can't be checked for errors.
+            failed = failed or isinstance(token, LLMError)
+            parts.append(token)
+            yield token
+        if failed:
+            logging.warning("Not caching a streamed answer that ended with an LLM error.")
+            return
+        self._cache_answer(query_vector, "".join(parts).strip())
+
+    def _answer(self, query: str, context: str) -> str:
+        if not context.strip():
+            logging.warning("No context was retrieved for the query. Cannot generate an answer.")
+            return NO_CONTEXT_ANSWER
+
+        with metrics.stage("build_prompt"):
+            system_prompt, user_prompt = self._build_prompt(query, context)
+        
+        logging.info("Sending prompt to LLM for answer generation.")
+        answer = self.llm.generate(prompt=user_prompt, system_prompt=system_prompt)
+        
+        logging.info("Successfully generated an answer.")
+        return answer
+
+
+class AsyncQueryEngine(BaseQueryEngine):
+    def __init__(
+        self,
+        llm: AsyncGroqLLM,
+        vector_store: VectorStore,
+        embedder: Embedder,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        **kwargs,
+    ):
+        super().__init__(llm=llm, vector_store=vector_store, embedder=embedder, answer_cache=answer_cache, **kwargs)
+
+    async def aask(self, query: str) -> str:
+        logging.info("Starting async RAG pipeline for a new query.")
+
+        # Embedding and FAISS search are CPU-bound; keep them off the event loop.
+        query_vector = await asyncio.to_thread(self._embed_query, query)
+        cached = self._cached_answer(query_vector)
+        if cached is not None:
+            return cached
+
+        context = await asyncio.to_thread(self._build_context_for_vector, query_vector, query)
+        if not context.strip():
+            logging.warning("No context was retrieved for the query. Cannot generate an answer.")
+            return NO_CONTEXT_ANSWER
+
+        with metrics.stage("build_prompt"):
+            system_prompt, user_prompt = self._build_prompt(query, context)
+        answer = await self.llm.generate(prompt=user_prompt, system_prompt=system_prompt)
+        self._cache_answer(query_vector, answer)
+        return answer
+
+    async def aask_many(self, queries: list[str]) -> list[str]:
+        logging.info(f"Starting async RAG pipeline for a batch of {len(queries)} queries.")
+        if not queries:
+            return []
+
+        query_vectors = await asyncio.to_thread(self.embedder.embed, list(queries))
+        if query_vectors.size == 0:
+            logging.warning("Batch query embedding resulted in an empty array.")
+            return [NO_CONTEXT_ANSWER for _ in queries]
+
+        answers = [self._cached_answer(vector) for vector in query_vectors]
+        misses = [i for i, answer in enumerate(answers) if answer is None]
+        if not misses:
+            return answers
+
+        contexts = await asyncio.to_thread(
+            self._build_contexts_for_vectors, query_vectors[misses], [queries[i] for i in misses]
+        )
+
+        async def answer_one(i: int, context: str) -> str:
+            if not context.strip():
+                return NO_CONTEXT_ANSWER
+            with metrics.stage("build_prompt"):
+                system_prompt, user_prompt = self._build_prompt(queries[i], context)
+            answer = await self.llm.generate(prompt=user_prompt, system_prompt=system_prompt)
+            self._cache_answer(query_vectors[i], answer)
+            return answer
+
+        generated = await asyncio.gather(*(answer_one(i, context) for i, context in zip(misses, contexts)))
+        for i, answer in zip(misses, generated):
+            answers[i] = answer
+        return answers
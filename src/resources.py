@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from groq import Groq
+
+from src.embedder import Embedder
+from src.groq_llm import GroqLLM, create_groq_client
+from src.jobs import DEFAULT_JOB_WORKERS, JOBS_DIR, JobQueue, start_workers
+from src.vector_store import VectorStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Open stores beyond MAX_OPEN_VECTOR_STORES, or unused for VECTOR_STORE_IDLE_SECONDS, are saved and closed;
+# their directories stay on disk and reopen on the next get_vector_store.
+MAX_OPEN_VECTOR_STORES = int(os.getenv("MAX_OPEN_VECTOR_STORES", "32"))
+VECTOR_STORE_IDLE_SECONDS = float(os.getenv("VECTOR_STORE_IDLE_SECONDS", "1800"))
+
+_lock = threading.Lock()
+_embedders: dict[tuple, Embedder] = {}
+_groq_client: Optional[Groq] = None
+# Least recently used first; values are (store, last use on the monotonic clock).
+_vector_stores: "OrderedDict[str, tuple[VectorStore, float]]" = OrderedDict()
+# Namespace -> number of use_vector_store blocks currently holding that store.
+_vector_store_users: dict[str, int] = {}
+_job_queue: Optional[JobQueue] = None
+
+
+def get_embedder(
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    device: Optional[str] = None,
+    backend: Optional[str] = None,
+    num_threads: Optional[int] = None,
+) -> Embedder:
+    key = (model_name, device, backend, num_threads)
+    with _lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            logging.info(f"Loading shared embedder for {model_name}.")
+            embedder = Embedder(model_name=model_name, device=device, backend=backend, num_threads=num_threads)
+            _embedders[key] = embedder
+        return embedder
+
+
+def get_groq_client() -> Groq:
+    global _groq_client
+    with _lock:
+        if _groq_client is None:
+            # The Groq client keeps a pooled HTTP connection; one per process is enough.
+            _groq_client = create_groq_client()
+        return _groq_client
+
+
+def get_llm(model: str) -> GroqLLM:
+    return GroqLLM(model=model, client=get_groq_client())
+
+
+def get_vector_store(namespace: str, dim: int, root_dir: str = "vector_store", **kwargs) -> VectorStore:
+    # The store may be closed by a later eviction; code that keeps using it across calls
+    # (e.g. a polling fragment) should hold it through use_vector_store instead.
+    return _open_vector_store(namespace, dim, root_dir, pin=False, **kwargs)
+
+
+@contextmanager
+def use_vector_store(namespace: str, dim: int, root_dir: str = "vector_store", **kwargs) -> Iterator[VectorStore]:
+    store = _open_vector_store(namespace, dim, root_dir, pin=True, **kwargs)
+    try:
+        yield store
+    finally:
+        with _lock:
+            _vector_store_users[namespace] -= 1
+            if not _vector_store_users[namespace]:
+                del _vector_store_users[namespace]
+            # The idle timeout counts from the end of the last use, not its start.
+            if namespace in _vector_stores and _vector_stores[namespace][0] is store:
+                _vector_stores[namespace] = (store, time.monotonic())
+
+
+def _open_vector_store(namespace: str, dim: int, root_dir: str, pin: bool, **kwargs) -> VectorStore:
+    if not namespace or Path(namespace).name != namespace:
+        raise ValueError(f"Invalid vector store namespace: '{namespace}'.")
+
+    now = time.monotonic()
+    with _lock:
+        entry = _vector_stores.get(namespace)
+        store = entry[0] if entry is not None else None
+        if store is not None and store.dim != dim:
+            raise ValueError(f"Namespace '{namespace}' already holds a store of dimension {store.dim}, not {dim}.")
+        if store is None:
+            store = VectorStore(dim=dim, store_dir=str(Path(root_dir) / namespace), **kwargs)
+        _vector_stores[namespace] = (store, now)
+        _vector_stores.move_to_end(namespace)
+        if pin:
+            _vector_store_users[namespace] = _vector_store_users.get(namespace, 0) + 1
+
+        # Stores in use are never closed under their users; they become candidates again once released.
+        candidates = [name for name in _vector_stores if name != namespace and name not in _vector_store_users]
+        evict = [name for name in candidates if now - _vector_stores[name][1] > VECTOR_STORE_IDLE_SECONDS]
+        overflow = len(_vector_stores) - len(evict) - MAX_OPEN_VECTOR_STORES
+        evict += [name for name in candidates if name not in evict][:max(0, overflow)]
+        # Taken out under the lock, so nobody can pick up a store that is about to close.
+        evicted = [(name, _vector_stores.pop(name)[0]) for name in evict]
+
+    for name, evicted_store in evicted:
+        _close_vector_store(name, evicted_store)
+    return store
+
+
+def release_vector_store(namespace: str):
+    with _lock:
+        entry = _vector_stores.pop(namespace, None)
+    if entry is not None:
+        _close_vector_store(namespace, entry[0])
+
+
+def _close_vector_store(namespace: str, store: VectorStore):
+    try:
+        store.save()
+    finally:
+        store.close()
+    logging.info(f"Closed vector store for namespace '{namespace}'.")
+
+
+def get_job_queue(jobs_dir: str = JOBS_DIR, workers: int = DEFAULT_JOB_WORKERS) -> JobQueue:
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(jobs_dir)
+            # Workers live as long as this process; every session shares them through the queue.
+            start_workers(workers, jobs_dir=jobs_dir, model_name=DEFAULT_EMBEDDING_MODEL)
+        return _job_queue
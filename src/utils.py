@@ -1,31 +1,54 @@
-import os
-import re
-import unicodedata
-from pathlib import Path
-
-def detect_file_type(file_name: str) -> str:
-    if not file_name or not isinstance(file_name, str):
-        return ""
-    suffix = Path(file_name).suffix
-    return suffix[1:].lower() if suffix else ""
-
-
-def clean_text(text: str) -> str:
-    if not text or not isinstance(text, str):
-        return ""
-
-    text = unicodedata.normalize('NFKC', text)
-
-    text = text.lower()
-
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)
-
-    text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', text)
-
-    text = re.sub(r'<.*?>', '', text)
-
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    
-    text = re.sub(r'\s+', ' ', text)
-
-    return text.strip()
\ No newline at end of file
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Iterable, Iterator
+
+def detect_file_type(file_name: str) -> str:
+    if not file_name or not isinstance(file_name, str):
+        return ""
+    suffix = Path(file_name).suffix
+    return suffix[1:].lower() if suffix else ""
+
+
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+# Emails and tags share one pass: neither can contain or create the other, so the result
+# matches removing them one after the other. URLs stay separate because removing one can
+# expose an email (e.g. "a@b.cohttp://x").
+_EMAIL_OR_TAG_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b|<.*?>')
+
+
+def _clean_line(line: str) -> str:
+    # ASCII text is already NFKC-normalized.
+    if not line.isascii():
+        line = unicodedata.normalize('NFKC', line)
+    line = line.lower()
+    if "http" in line or "www." in line:
+        line = _URL_RE.sub('', line)
+    if "@" in line or "<" in line:
+        line = _EMAIL_OR_TAG_RE.sub('', line)
+    return line
+
+
+def clean_text(text: str) -> str:
+    if not text or not isinstance(text, str):
+        return ""
+
+    lowered = text.lower() if text.isascii() else None
+    if lowered is not None and not ("http" in lowered or "www." in lowered or "@" in lowered or "<" in lowered):
+        text = lowered
+    else:
+        # NFKC and every pattern stop at "\n", so lines are cleaned independently and only
+        # the ones that need it pay for normalization or a regex pass.
+        text = "\n".join(_clean_line(line) for line in text.split("\n"))
+
+    # Collapses every whitespace run to one space and strips the ends, like re.sub(r'\s+', ' ').strip().
+    return " ".join(text.split())
+
+
+def iter_clean_text(texts: Iterable[str]) -> Iterator[str]:
+    # " ".join(iter_clean_text(parts)) == clean_text("\n\n".join(parts)) without building the joined document.
+    for text in texts:
+        cleaned = clean_text(text)
+        if cleaned:
+            yield cleaned
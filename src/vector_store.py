@@ -1,92 +1,724 @@
-import os
-import faiss
-import numpy as np
-import json
-import logging
-from pathlib import Path
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-class VectorStore:
-    def __init__(self, dim: int, store_dir: str = "vector_store"):
-        self.dim = dim
-        self.store_path = Path(store_dir)
-        self.store_path.mkdir(exist_ok=True)
-
-        self.index_path = self.store_path / "faiss.index"
-        self.meta_path = self.store_path / "metadata.json"
-
-        self.index = None
-        self.metadata = []
-        self._load()
-
-    def _load(self):
-        if self.index_path.exists() and self.meta_path.exists():
-            try:
-                self.index = faiss.read_index(str(self.index_path))
-                with open(self.meta_path, "r", encoding="utf-8") as f:
-                    self.metadata = json.load(f)
-                
-                if self.index.d != self.dim:
-                    logging.warning(
-                        f"Stored index dimension ({self.index.d}) differs from "
-                        f"configured dimension ({self.dim}). Re-initializing."
-                    )
-                    self._initialize_new_index()
-                else:
-                    logging.info(f"Loaded existing vector index with {self.index.ntotal} vectors.")
-            except Exception as e:
-                logging.error(f"Failed to load existing index or metadata: {e}. Re-initializing.")
-                self._initialize_new_index()
-        else:
-            logging.info("No existing index found. Initializing a new one.")
-            self._initialize_new_index()
-
-    def _initialize_new_index(self):
-        self.index = faiss.IndexFlatIP(self.dim)
-        self.metadata = []
-
-    def add(self, vectors: np.ndarray, texts: list[str]):
-        if vectors.shape[0] != len(texts):
-            raise ValueError("The number of vectors and texts must be the same.")
-        
-        if vectors.shape[1] != self.dim:
-            raise ValueError(f"Vector dimension mismatch. Expected {self.dim}, got {vectors.shape[1]}.")
-
-        faiss.normalize_L2(vectors)
-        self.index.add(vectors)
-        self.metadata.extend(texts)
-        logging.info(f"Added {len(vectors)} new vectors to the index.")
-
-    def save(self):
-        try:
-            faiss.write_index(self.index, str(self.index_path))
-            with open(self.meta_path, "w", encoding="utf-8") as f:
-                json.dump(self.metadata, f, indent=4)
-            logging.info(f"Saved vector index and metadata to {self.store_path}.")
-        except Exception as e:
-            logging.error(f"Failed to save index or metadata: {e}")
-            raise
-
-    def search(self, query_vector: np.ndarray, k: int = 5) -> list[tuple[float, str]]:
-        if self.index.ntotal == 0:
-            logging.warning("Search attempted on an empty index.")
-            return []
-
-        if query_vector.ndim == 1:
-            query_vector = np.expand_dims(query_vector, axis=0)
-
-        if query_vector.shape[1] != self.dim:
-            raise ValueError(f"Query vector dimension mismatch. Expected {self.dim}, got {query_vector.shape[1]}.")
-
-        faiss.normalize_L2(query_vector)
-
-        distances, indices = self.index.search(query_vector, k)
-        
-        results = []
-        for i in range(min(k, len(indices[0]))):
-            idx = indices[0][i]
-            if idx != -1:
-                results.append((float(distances[0][i]), self.metadata[idx]))
-        
-        return results
\ No newline at end of file
+import os
+import faiss
+import numpy as np
+import json
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from src import metrics
+from src.bm25 import BM25Index
+from src.index_factory import (
+    INDEX_TYPES,
+    TRAINED_INDEX_TYPES,
+    build_index,
+    configure_search,
+    default_nlist,
+    describe_index,
+    id_selector,
+    index_ids,
+    min_training_size,
+    reconstruct_all,
+    search_parameters,
+    supports_removal,
+    unwrap_index,
+    with_ids,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Version 2 keeps stable chunk ids: segments are .npz files holding ids, vectors and removed ids.
+MANIFEST_VERSION = 2
+CHUNK_METADATA_COLUMNS = {"source": "TEXT", "page": "INTEGER", "char_offset": "INTEGER", "course": "TEXT"}
+FILTER_COLUMNS = ("course", "source", "page")
+# Compact once this share of an HNSW index is tombstones, since HNSW cannot remove in place.
+MAX_TOMBSTONE_FRACTION = 0.2
+# Retrain an IVF index on save once the corpus would call for this many times its current nlist.
+RETRAIN_NLIST_GROWTH = 2
+# Unsaved vectors past this count are spilled to a segment file, so a large ingest does not
+# keep a second copy of every vector in memory until save.
+MAX_PENDING_VECTORS = int(os.getenv("VECTOR_STORE_MAX_PENDING", "16384"))
+
+
+class ChunkRecord(NamedTuple):
+    text: str
+    source: Optional[str] = None
+    page: Optional[int] = None
+    char_offset: Optional[int] = None
+    course: Optional[str] = None
+
+
+def _atomic_replace(tmp_path: Path, path: Path):
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class VectorStore:
+    def __init__(
+        self,
+        dim: int,
+        store_dir: str = "vector_store",
+        max_segments: int = 16,
+        index_type: str = "flat",
+        auto_threshold: int = 50_000,
+        auto_index_type: str = "ivf",
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        pq_m: Optional[int] = None,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+        if auto_index_type not in INDEX_TYPES or auto_index_type in ("flat", "auto"):
+            raise ValueError(f"auto_index_type must be one of 'hnsw', 'ivf' or 'ivfpq', got '{auto_index_type}'.")
+
+        self.dim = dim
+        self.store_path = Path(store_dir)
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        self.max_segments = max_segments
+
+        self.index_type = index_type
+        self.auto_threshold = auto_threshold
+        self.auto_index_type = auto_index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+
+        self.manifest_path = self.store_path / "manifest.json"
+        self.segments_path = self.store_path / "segments"
+        self.segments_path.mkdir(exist_ok=True)
+        self.chunks_path = self.store_path / "chunks.sqlite"
+
+        # Layout before segmented persistence; migrated on first load.
+        self.legacy_index_path = self.store_path / "faiss.index"
+        self.legacy_meta_path = self.store_path / "metadata.json"
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.chunks_path), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+        existing_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for column, column_type in CHUNK_METADATA_COLUMNS.items():
+            if column not in existing_columns:
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_course ON chunks (course)")
+        self.bm25 = BM25Index(self._conn)
+        self._conn.commit()
+
+        self.index = None
+        self._base_index = None
+        self._segments = []
+        self._generation = 0
+        self._next_id = 0
+        self._pending = []
+        self._pending_count = 0
+        self._pending_removed = []
+        # Ids removed from an index type that cannot delete in place; filtered at search, dropped on compaction.
+        self._tombstones = set()
+        # Ids added by upserts still in progress; another upsert of the same document must not remove them.
+        self._upserting_ids = set()
+        self._needs_compaction = False
+        # Bumped whenever the corpus changes so caches keyed on it go stale.
+        self.version = 0
+        # This store's share of metrics.INDEX_VECTORS, taken back out on close.
+        self._recorded_size = 0
+        self._load()
+        self._maybe_upgrade_index()
+
+    def _load(self):
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self._generation = manifest["generation"]
+
+                if manifest["dim"] != self.dim:
+                    logging.warning(
+                        f"Stored index dimension ({manifest['dim']}) differs from "
+                        f"configured dimension ({self.dim}). Re-initializing."
+                    )
+                    self._initialize_new_index()
+                    return
+
+                if manifest.get("version", 1) < 2:
+                    self._migrate_positional(manifest)
+                    return
+
+                self._base_index = manifest["base_index"]
+                self._segments = list(manifest["segments"])
+                self._next_id = manifest["next_id"]
+
+                if self._base_index:
+                    self.index = faiss.read_index(str(self.store_path / self._base_index))
+                else:
+                    self.index = self._new_index()
+                configure_search(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+                for segment in self._segments:
+                    with np.load(self.segments_path / segment) as data:
+                        if len(data["ids"]):
+                            self.index.add_with_ids(data["vectors"], data["ids"])
+                        self._remove_from_index(data["removed"])
+
+                # Rows written by a save that crashed before its manifest landed.
+                unsaved_rows = self._conn.execute("DELETE FROM chunks WHERE id >= ?", (self._next_id,)).rowcount
+                # Matching counts mean the last save finished; only then can the O(N) id comparison be skipped.
+                row_count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+                saved_rows = manifest.get("rows")
+                if unsaved_rows or saved_rows is None or row_count != saved_rows or self._live_count() != saved_rows:
+                    self._reconcile_rows()
+                self._backfill_bm25()
+                self._conn.commit()
+                self._remove_unreferenced_files()
+                self._record_size()
+                logging.info(
+                    f"Loaded existing vector index with {self.index.ntotal} vectors "
+                    f"({len(self._segments)} segments)."
+                )
+            except Exception as e:
+                logging.error(f"Failed to load existing index or metadata: {e}. Re-initializing.")
+                self._initialize_new_index()
+        elif self.legacy_index_path.exists() and self.legacy_meta_path.exists():
+            self._migrate_legacy()
+        else:
+            logging.info("No existing index found. Initializing a new one.")
+            self._initialize_new_index()
+
+    def _migrate_positional(self, manifest: dict):
+        # Version 1 stores used each vector's position as its chunk id.
+        if manifest["base_index"]:
+            index = faiss.read_index(str(self.store_path / manifest["base_index"]))
+        else:
+            index = build_index("hnsw", self.dim, hnsw_m=self.hnsw_m) if self.index_type == "hnsw" else build_index("flat", self.dim)
+        for segment in manifest["segments"]:
+            index.add(np.load(self.segments_path / segment))
+
+        self.index = self._with_positional_ids(index)
+        configure_search(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        self._next_id = self.index.ntotal
+        self._conn.execute("DELETE FROM chunks WHERE id >= ?", (self._next_id,))
+        self._reconcile_rows()
+        self._backfill_bm25()
+        self.compact()
+        logging.info(f"Migrated vector index with {self.index.ntotal} vectors to stable chunk ids.")
+
+    def _with_positional_ids(self, index: faiss.Index) -> faiss.Index:
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexIVF):
+            # IVF already numbers vectors by position; an array direct map would block removal.
+            if index.direct_map.type == faiss.DirectMap.Array:
+                index.set_direct_map_type(faiss.DirectMap.NoMap)
+            return index
+
+        kind = describe_index(index)
+        wrapped = with_ids(build_index(kind, self.dim, hnsw_m=self.hnsw_m))
+        if index.ntotal:
+            wrapped.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype=np.int64))
+        return wrapped
+
+    def _live_count(self) -> int:
+        return self.index.ntotal - len(self._tombstones)
+
+    def _reconcile_rows(self):
+        # A crash between the SQLite commit and the manifest write can leave rows and index ids out of step.
+        live_ids = set(index_ids(self.index).tolist()) - self._tombstones
+        row_ids = {row[0] for row in self._conn.execute("SELECT id FROM chunks")}
+
+        stale_rows = row_ids - live_ids
+        if stale_rows:
+            logging.warning(f"Dropping {len(stale_rows)} chunk rows with no vector in the index.")
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in stale_rows])
+
+        orphan_ids = sorted(live_ids - row_ids)
+        if orphan_ids:
+            logging.warning(f"Removing {len(orphan_ids)} vectors whose chunk rows were deleted.")
+            self._remove_from_index(orphan_ids)
+            self._pending_removed.extend(orphan_ids)
+        self.bm25.remove_orphans()
+
+    def _migrate_legacy(self):
+        try:
+            index = faiss.read_index(str(self.legacy_index_path))
+            with open(self.legacy_meta_path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            if index.d != self.dim:
+                logging.warning(
+                    f"Stored index dimension ({index.d}) differs from "
+                    f"configured dimension ({self.dim}). Re-initializing."
+                )
+                self._initialize_new_index()
+                return
+
+            self._initialize_new_index()
+            self.index = self._with_positional_ids(index)
+            configure_search(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+            self._next_id = self.index.ntotal
+            self._conn.executemany("INSERT INTO chunks (id, text) VALUES (?, ?)", enumerate(metadata))
+            self.bm25.add(range(len(metadata)), metadata)
+            self.compact()
+            self.legacy_index_path.unlink()
+            self.legacy_meta_path.unlink()
+            logging.info(f"Migrated legacy index with {self.index.ntotal} vectors to segmented storage.")
+        except Exception as e:
+            logging.error(f"Failed to migrate legacy index or metadata: {e}. Re-initializing.")
+            self._initialize_new_index()
+
+    def _initialize_new_index(self):
+        self.index = self._new_index()
+        self._base_index = None
+        self._segments = []
+        self._next_id = 0
+        self._pending = []
+        self._pending_count = 0
+        self._pending_removed = []
+        self._tombstones = set()
+        self.version += 1
+        # Left uncommitted so the previous corpus survives until the next save.
+        self._conn.execute("DELETE FROM chunks")
+        self.bm25.clear()
+
+    def _backfill_bm25(self):
+        # Stores written before the lexical index existed get indexed once on load.
+        rows = self._conn.execute(
+            "SELECT id, text FROM chunks WHERE id NOT IN (SELECT chunk_id FROM bm25_docs)"
+        ).fetchall()
+        if rows:
+            logging.info(f"Building BM25 postings for {len(rows)} existing chunks.")
+            self.bm25.add([chunk_id for chunk_id, _ in rows], [text for _, text in rows])
+
+    def _new_index(self) -> faiss.Index:
+        # Trained index types start flat until there is enough data to train on.
+        if self.index_type == "hnsw":
+            index = with_ids(build_index("hnsw", self.dim, hnsw_m=self.hnsw_m))
+        else:
+            index = with_ids(build_index("flat", self.dim))
+        configure_search(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        return index
+
+    def _upgrade_target(self) -> Optional[str]:
+        current = describe_index(self.index)
+        ntotal = self.index.ntotal
+
+        if self.index_type == "auto":
+            if current != "flat" or ntotal < self.auto_threshold:
+                return None
+            target = self.auto_index_type
+        elif self.index_type in TRAINED_INDEX_TYPES and current == "flat":
+            target = self.index_type
+        else:
+            return None
+
+        nlist = self.nlist or default_nlist(ntotal)
+        if ntotal < max(min_training_size(target, nlist), 1):
+            return None
+        return target
+
+    def _maybe_upgrade_index(self):
+        target = self._upgrade_target()
+        if target is None:
+            return
+
+        ids = index_ids(self.index)
+        vectors = unwrap_index(self.index).reconstruct_n(0, self.index.ntotal)
+        logging.info(f"Upgrading flat index with {len(vectors)} vectors to '{target}'.")
+        self._rebuild_index(target, ids, vectors)
+
+    def _needs_retraining(self) -> bool:
+        # An IVF index trained on the first few thousand vectors keeps that nlist forever otherwise,
+        # and nprobe then covers most of its lists. A fixed nlist from the caller is left alone.
+        if self.nlist or describe_index(self.index) not in TRAINED_INDEX_TYPES:
+            return False
+        current = faiss.extract_index_ivf(self.index).nlist
+        return default_nlist(self.index.ntotal) >= RETRAIN_NLIST_GROWTH * current
+
+    def _retrain_index(self):
+        kind = describe_index(self.index)
+        ids, vectors = reconstruct_all(self.index)
+        logging.info(
+            f"Retraining '{kind}' index on {len(vectors)} vectors "
+            f"(nlist {faiss.extract_index_ivf(self.index).nlist} -> {default_nlist(len(vectors))})."
+        )
+        self._rebuild_index(kind, ids, vectors)
+
+    def _rebuild_index(self, target: str, ids: np.ndarray, vectors: np.ndarray):
+        index = build_index(
+            target,
+            self.dim,
+            train_vectors=vectors,
+            nlist=self.nlist or default_nlist(len(vectors)),
+            hnsw_m=self.hnsw_m,
+            pq_m=self.pq_m,
+        )
+        index = with_ids(index)
+        configure_search(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        # Segments replay on top of the base snapshot, so the new index needs a fresh one.
+        self._needs_compaction = True
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            configure_search(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def _remove_unreferenced_files(self):
+        referenced = set(self._segments)
+        for path in self.segments_path.iterdir():
+            if path.name not in referenced:
+                path.unlink(missing_ok=True)
+        for path in self.store_path.glob("base-*.index*"):
+            if path.name != self._base_index:
+                path.unlink(missing_ok=True)
+
+    def _write_manifest(self):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "dim": self.dim,
+            "generation": self._generation,
+            "base_index": self._base_index,
+            "segments": self._segments,
+            "next_id": self._next_id,
+            # Rows and live vectors agree at every save; a load that finds otherwise reconciles them.
+            "rows": self._live_count(),
+        }
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        _atomic_replace(tmp_path, self.manifest_path)
+
+    def _record_size(self):
+        # One series summed over open stores; a label per store would grow with every library ever opened.
+        if not metrics.is_enabled():
+            return
+        size = self.index.ntotal - len(self._tombstones)
+        metrics.INDEX_VECTORS.inc(size - self._recorded_size)
+        self._recorded_size = size
+
+    def _validate(self, vectors: np.ndarray, texts: list[str], metadatas: Optional[list[dict]]):
+        if vectors.shape[0] != len(texts):
+            raise ValueError("The number of vectors and texts must be the same.")
+
+        if metadatas is not None and len(metadatas) != len(texts):
+            raise ValueError("The number of metadata entries and texts must be the same.")
+
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension mismatch. Expected {self.dim}, got {vectors.shape[1]}.")
+
+    def add(self, vectors: np.ndarray, texts: list[str], metadatas: Optional[list[dict]] = None) -> list[int]:
+        self._validate(vectors, texts, metadatas)
+
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        with self._lock, metrics.stage("index_add"):
+            ids = np.arange(self._next_id, self._next_id + len(texts), dtype=np.int64)
+            self._next_id += len(texts)
+            self.index.add_with_ids(vectors, ids)
+            self._pending.append((ids, vectors))
+            self._pending_count += len(ids)
+            self.version += 1
+            self._conn.executemany(
+                "INSERT INTO chunks (id, text, source, page, char_offset, course) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (int(chunk_id), text, meta.get("source"), meta.get("page"), meta.get("char_offset"), meta.get("course"))
+                    for chunk_id, text, meta in zip(ids, texts, metadatas)
+                ],
+            )
+            self.bm25.add(ids.tolist(), texts)
+            self._maybe_upgrade_index()
+            if self._pending_count >= MAX_PENDING_VECTORS:
+                self._write_segment()
+            self._record_size()
+        metrics.CHUNKS_INDEXED.inc(len(texts))
+        logging.info(f"Added {len(vectors)} new vectors to the index.")
+        return ids.tolist()
+
+    def _remove_from_index(self, ids):
+        if len(ids) == 0:
+            return
+        if supports_removal(self.index):
+            self.index.remove_ids(id_selector(self.index, ids))
+        else:
+            self._tombstones.update(int(chunk_id) for chunk_id in ids)
+
+    def remove_ids(self, ids: list[int]) -> int:
+        ids = sorted({int(chunk_id) for chunk_id in ids})
+        if not ids:
+            return 0
+
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self.bm25.remove(ids)
+            self._remove_from_index(ids)
+            self._pending_removed.extend(ids)
+            self.version += 1
+            self._record_size()
+        logging.info(f"Removed {len(ids)} vectors from the index.")
+        return len(ids)
+
+    def document_ids(self, source: str, course: Optional[str] = None) -> list[int]:
+        query, params = "SELECT id FROM chunks WHERE source = ?", [source]
+        if course is not None:
+            query, params = query + " AND course = ?", params + [course]
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def remove_document(self, source: str, course: Optional[str] = None) -> int:
+        with self._lock:
+            return self.remove_ids(self.document_ids(source, course=course))
+
+    def upsert_document(
+        self,
+        source: str,
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: Optional[list[dict]] = None,
+        course: Optional[str] = None,
+    ) -> list[int]:
+        with self._lock:
+            return self.upsert_document_windows(source, [(vectors, texts, metadatas)], course=course)
+
+    def upsert_document_windows(
+        self,
+        source: str,
+        windows: Iterable[tuple[np.ndarray, list[str], Optional[list[dict]]]],
+        course: Optional[str] = None,
+    ) -> list[int]:
+        # The previous chunks are removed only once every window is in, so a failure part-way
+        # (e.g. while embedding the next window) leaves the old version of the document searchable.
+        # Searches that run in between can briefly see both versions.
+        ids = []
+        try:
+            for vectors, texts, metadatas in windows:
+                self._validate(vectors, texts, metadatas)
+                metadatas = [dict(meta, source=source) for meta in (metadatas or [{} for _ in texts])]
+                if course is not None:
+                    metadatas = [dict(meta, course=course) for meta in metadatas]
+                with self._lock:
+                    added = self.add(vectors, texts, metadatas)
+                    self._upserting_ids.update(added)
+                ids.extend(added)
+        except BaseException:
+            with self._lock:
+                self._upserting_ids.difference_update(ids)
+                self.remove_ids(ids)
+            raise
+        # The old chunks are whatever else the document has by the time this upsert finishes, so two
+        # concurrent upserts of one file leave exactly one complete version instead of both.
+        with self._lock:
+            self._upserting_ids.difference_update(ids)
+            new_ids = set(ids)
+            old_ids = [
+                idx for idx in self.document_ids(source, course=course)
+                if idx not in new_ids and idx not in self._upserting_ids
+            ]
+            removed = self.remove_ids(old_ids)
+        logging.info(f"Upserted '{source}': replaced {removed} chunks with {len(ids)}.")
+        return ids
+
+    def save(self):
+        with self._lock:
+            if self._needs_retraining():
+                self._retrain_index()
+            too_many_tombstones = len(self._tombstones) > MAX_TOMBSTONE_FRACTION * max(self.index.ntotal, 1)
+            if self._needs_compaction or too_many_tombstones or len(self._segments) >= self.max_segments:
+                self.compact()
+                return
+
+            try:
+                if self._pending or self._pending_removed:
+                    self._write_segment()
+
+                self._conn.commit()
+                self._write_manifest()
+                self._remove_unreferenced_files()
+                logging.info(f"Saved {len(self._segments)} segment(s) and chunk texts to {self.store_path}.")
+            except Exception as e:
+                logging.error(f"Failed to save index or metadata: {e}")
+                raise
+
+    def _write_segment(self):
+        # The segment only becomes part of the store once save() writes a manifest naming it;
+        # until then a crash leaves it unreferenced and it is deleted on the next load.
+        self._generation += 1
+        segment = f"seg-{self._generation:06d}.npz"
+        tmp_path = self.segments_path / f"{segment}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=np.concatenate([ids for ids, _ in self._pending]) if self._pending else np.empty(0, dtype=np.int64),
+                vectors=np.vstack([vectors for _, vectors in self._pending]) if self._pending else np.empty((0, self.dim), dtype=np.float32),
+                removed=np.array(self._pending_removed, dtype=np.int64),
+            )
+        _atomic_replace(tmp_path, self.segments_path / segment)
+        self._segments.append(segment)
+        self._pending = []
+        self._pending_count = 0
+        self._pending_removed = []
+
+    def compact(self):
+        with self._lock:
+            try:
+                if self._tombstones:
+                    self._drop_tombstones()
+
+                self._generation += 1
+                base_index = f"base-{self._generation:06d}.index"
+                tmp_path = self.store_path / f"{base_index}.tmp"
+                faiss.write_index(self.index, str(tmp_path))
+                _atomic_replace(tmp_path, self.store_path / base_index)
+
+                self._base_index = base_index
+                self._segments = []
+                self._conn.commit()
+                self._write_manifest()
+                self._pending = []
+                self._pending_count = 0
+                self._pending_removed = []
+                self._needs_compaction = False
+                self._remove_unreferenced_files()
+                logging.info(f"Compacted vector index with {self.index.ntotal} vectors into {base_index}.")
+            except Exception as e:
+                logging.error(f"Failed to compact index: {e}")
+                raise
+
+    def _drop_tombstones(self):
+        ids = index_ids(self.index)
+        keep = ~np.isin(ids, np.fromiter(self._tombstones, dtype=np.int64))
+        vectors = unwrap_index(self.index).reconstruct_n(0, self.index.ntotal)[keep]
+        index = with_ids(build_index(describe_index(self.index), self.dim, hnsw_m=self.hnsw_m))
+        configure_search(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        index.add_with_ids(vectors, ids[keep])
+        logging.info(f"Rebuilt index without {len(self._tombstones)} removed vectors.")
+        self.index = index
+        self._tombstones = set()
+
+    def get_texts(self, ids: list[int]) -> dict[int, str]:
+        return {chunk_id: record.text for chunk_id, record in self.get_records(ids).items()}
+
+    def get_records(self, ids: list[int]) -> dict[int, ChunkRecord]:
+        records = {}
+        ids = list(set(ids))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit on older builds.
+            for start in range(0, len(ids), 900):
+                batch = ids[start:start + 900]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, text, source, page, char_offset, course FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                records.update((row[0], ChunkRecord(*row[1:])) for row in rows)
+        return records
+
+    def get_vectors(self, ids: list[int]) -> Optional[np.ndarray]:
+        if not ids:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        with self._lock:
+            try:
+                # IVF indexes can only reconstruct by id once they keep a direct map; a hashtable
+                # one also survives removals.
+                ivf_index = faiss.extract_index_ivf(self.index)
+                if ivf_index.direct_map.type != faiss.DirectMap.Hashtable:
+                    ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            except RuntimeError:
+                pass
+            try:
+                return np.vstack([self.index.reconstruct(int(chunk_id)) for chunk_id in ids])
+            except RuntimeError as e:
+                logging.warning(f"Index does not support reconstructing vectors: {e}")
+                return None
+
+    def _filtered_ids(self, filters: Optional[dict]) -> Optional[set[int]]:
+        if not filters:
+            return None
+
+        clauses, params = [], []
+        for column, value in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown filter '{column}'. Expected one of {FILTER_COLUMNS}.")
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(f"{column} IN ({','.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        rows = self._conn.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", params)
+        return {row[0] for row in rows}
+
+    def _search_selector(self, allowed_ids: Optional[set[int]]) -> Optional[faiss.IDSelector]:
+        if allowed_ids is not None:
+            return faiss.IDSelectorBatch(np.fromiter(allowed_ids - self._tombstones, dtype=np.int64))
+        if self._tombstones:
+            removed = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64))
+            selector = faiss.IDSelectorNot(removed)
+            selector.referenced_selector = removed
+            return selector
+        return None
+
+    def search(self, query_vector: np.ndarray, k: int = 5, filters: Optional[dict] = None) -> list[tuple[float, str]]:
+        if query_vector.ndim == 1:
+            query_vector = np.expand_dims(query_vector, axis=0)
+
+        results = self.search_batch(query_vector[:1], k=k, filters=filters)
+        return results[0] if results else []
+
+    def search_batch(
+        self, query_vectors: np.ndarray, k: int = 5, filters: Optional[dict] = None
+    ) -> list[list[tuple[float, str]]]:
+        hits_per_query = self.search_batch_ids(query_vectors, k=k, filters=filters)
+        texts = self.get_texts([idx for hits in hits_per_query for _, idx in hits])
+        return [[(score, texts[idx]) for score, idx in hits if idx in texts] for hits in hits_per_query]
+
+    def search_batch_ids(
+        self, query_vectors: np.ndarray, k: int = 5, filters: Optional[dict] = None
+    ) -> list[list[tuple[float, int]]]:
+        if self.index.ntotal == 0:
+            logging.warning("Search attempted on an empty index.")
+            return [[] for _ in range(len(query_vectors))]
+
+        if query_vectors.ndim == 1:
+            query_vectors = np.expand_dims(query_vectors, axis=0)
+
+        if query_vectors.shape[1] != self.dim:
+            raise ValueError(f"Query vector dimension mismatch. Expected {self.dim}, got {query_vectors.shape[1]}.")
+
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        faiss.normalize_L2(query_vectors)
+
+        with self._lock, metrics.stage("vector_search"):
+            allowed_ids = self._filtered_ids(filters)
+            if allowed_ids is not None and not allowed_ids:
+                return [[] for _ in range(len(query_vectors))]
+
+            # Filters and tombstones are applied inside the FAISS search, so k results still come back.
+            selector = self._search_selector(allowed_ids)
+            if selector is None:
+                distances, indices = self.index.search(query_vectors, k)
+            else:
+                params = search_parameters(self.index, selector, nprobe=self.nprobe, ef_search=self.ef_search)
+                distances, indices = self.index.search(query_vectors, k, params=params)
+
+        return [
+            [(float(row_distances[i]), int(row_indices[i])) for i in range(len(row_indices)) if row_indices[i] != -1]
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+
+    def lexical_search_ids(self, query: str, k: int = 5, filters: Optional[dict] = None) -> list[tuple[float, int]]:
+        with self._lock, metrics.stage("lexical_search"):
+            return self.bm25.search(query, k=k, allowed_ids=self._filtered_ids(filters))
+
+    def close(self):
+        with self._lock:
+            if metrics.is_enabled():
+                metrics.INDEX_VECTORS.inc(-self._recorded_size)
+            self._recorded_size = 0
+            self._conn.close()
@@ -0,0 +1,141 @@
+import json
+import time
+import asyncio
+
+from src.async_llm import AsyncGroqLLM, create_async_groq_client
+from src.groq_llm import LLMError
+
+
+class FakeGroqServer:
+    # OpenAI-compatible chat completions endpoint with injected latency and scripted 429s.
+    def __init__(self, latency: float = 0.05, rate_limited_requests: int = 0, retry_after: str = "0.1"):
+        self.latency = latency
+        self.rate_limited_requests = rate_limited_requests
+        self.retry_after = retry_after
+        self.requests = 0
+        self.completions = 0
+        self.active = 0
+        self.peak_active = 0
+        self.request_times = []
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload, extra_headers = await self._respond(json.loads(body or b"{}"))
+                data = json.dumps(payload).encode("utf-8")
+                head = [f"HTTP/1.1 {status}", "content-type: application/json", f"content-length: {len(data)}"]
+                head += [f"{name}: {value}" for name, value in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request: dict) -> tuple[str, dict, dict]:
+        self.requests += 1
+        self.request_times.append(time.monotonic())
+        if self.requests <= self.rate_limited_requests:
+            error = {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}
+            return "429 Too Many Requests", error, {"retry-after": self.retry_after}
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        self.completions += 1
+        prompt = request["messages"][-1]["content"]
+        return "200 OK", {
+            "id": f"fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Answer to: {prompt}"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }, {}
+
+
+async def _run(server: FakeGroqServer, prompts: list[str], **llm_kwargs) -> tuple[list[str], AsyncGroqLLM]:
+    base_url = await server.start()
+    llm = AsyncGroqLLM(
+        model="fake-model",
+        client=create_async_groq_client(base_url=base_url, api_key="fake"),
+        base_delay=0.01,
+        max_delay=1.0,
+        **llm_kwargs,
+    )
+    try:
+        answers = await asyncio.gather(*(llm.generate(prompt) for prompt in prompts))
+    finally:
+        await llm.client.close()
+        await server.stop()
+    return answers, llm
+
+
+def test_concurrency_bound_is_never_exceeded():
+    server = FakeGroqServer(latency=0.05)
+    prompts = [f"question {i}" for i in range(40)]
+    answers, llm = asyncio.run(_run(server, prompts, max_concurrency=4))
+
+    assert answers == [f"Answer to: {prompt}" for prompt in prompts]
+    assert server.completions == 40
+    assert server.peak_active == 4
+
+
+def test_rate_limited_requests_are_retried_with_backoff():
+    server = FakeGroqServer(rate_limited_requests=3, retry_after="0.1")
+    answers, llm = asyncio.run(_run(server, ["question"], max_concurrency=1, max_retries=5))
+
+    assert answers == ["Answer to: question"]
+    assert server.requests == 4
+    assert llm.stats()["retries"] == 3
+    # Each retry waits at least the server's retry-after.
+    gaps = [later - earlier for earlier, later in zip(server.request_times, server.request_times[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+def test_retry_budget_exhaustion_returns_error():
+    server = FakeGroqServer(rate_limited_requests=100, retry_after="0.01")
+    answers, llm = asyncio.run(_run(server, ["question"], max_concurrency=1, max_retries=2))
+
+    assert isinstance(answers[0], LLMError)
+    assert answers[0].startswith("Error:")
+    assert server.requests == 3
+    assert llm.stats()["retries"] == 2
+
+
+def test_duplicate_in_flight_prompts_are_coalesced():
+    server = FakeGroqServer(latency=0.1)
+    prompts = ["same question"] * 10 + ["other question"] * 5
+    answers, llm = asyncio.run(_run(server, prompts, max_concurrency=8))
+
+    assert answers == [f"Answer to: {prompt}" for prompt in prompts]
+    assert server.requests == 2
+    assert llm.stats() == {"upstream_calls": 2, "coalesced_calls": 13, "retries": 0}
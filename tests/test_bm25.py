@@ -0,0 +1,28 @@
+import sqlite3
+
+from src.bm25 import BM25Index
+
+
+def _index() -> BM25Index:
+    return BM25Index(sqlite3.connect(":memory:"))
+
+
+def test_readding_an_id_replaces_it():
+    index = _index()
+    index.add([1, 2], ["gradient descent converges", "entropy of a distribution"])
+    index.add([2], ["eigenvalues of a linear map stretch space"])
+
+    expected = (index.doc_count, index.total_length)
+    index.refresh_stats()
+    assert expected == (index.doc_count, index.total_length) == (2, 8)
+    assert index.search("entropy") == []
+    assert [chunk_id for _, chunk_id in index.search("eigenvalues")] == [2]
+
+
+def test_remove_updates_stats():
+    index = _index()
+    index.add([1, 2, 3], ["gradient descent", "gradient ascent", "entropy"])
+    index.remove([1, 3])
+
+    assert (index.doc_count, index.total_length) == (1, 2)
+    assert [chunk_id for _, chunk_id in index.search("gradient")] == [2]
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from src.chunker import Segment, approx_token_count, chunk_segments
+
+WORDS = "gradient entropy eigenvalue recursion proof matrix vector limit series integral".split()
+
+
+def _sentences(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))).capitalize() + "." for _ in range(count)]
+
+
+def _page_texts(segments: list[Segment]) -> dict:
+    # chunk_segments treats consecutive segments of one page as joined by a single space.
+    pages = {}
+    for segment in segments:
+        key = (segment.source, segment.page)
+        pages[key] = pages[key] + " " + segment.text if key in pages else segment.text
+    return pages
+
+
+def test_chunk_offsets_slice_the_page_text():
+    sentences = _sentences(120)
+    segments = [
+        Segment("notes.pdf", 1, " ".join(sentences[:40])),
+        Segment("notes.pdf", 1, " ".join(sentences[40:70])),
+        Segment("notes.pdf", 2, " ".join(sentences[70:])),
+    ]
+    pages = _page_texts(segments)
+
+    chunks = list(chunk_segments(segments, max_tokens=40, overlap_tokens=10))
+    assert len(chunks) > 5
+    for chunk in chunks:
+        page_text = pages[(chunk.source, chunk.page)]
+        assert page_text[chunk.char_offset:chunk.char_offset + len(chunk.text)] == chunk.text
+        assert approx_token_count(chunk.text) <= 40
+
+
+def test_consecutive_chunks_overlap_within_budget():
+    text = " ".join(_sentences(80, seed=1))
+    chunks = list(chunk_segments([Segment("notes.pdf", 1, text)], max_tokens=50, overlap_tokens=15))
+
+    overlapping = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_end = previous.char_offset + len(previous.text)
+        assert previous.char_offset < chunk.char_offset <= previous_end + 1
+        overlap = text[chunk.char_offset:previous_end]
+        assert approx_token_count(overlap) <= 15
+        overlapping += bool(overlap)
+    assert overlapping > len(chunks) // 2
+    # Together the chunks cover the whole page.
+    assert chunks[0].char_offset == 0
+    assert chunks[-1].char_offset + len(chunks[-1].text) == len(text)
+
+
+def test_oversize_sentence_is_split_on_word_boundaries():
+    long_sentence = " ".join(WORDS * 10) + "."
+    text = f"Short opener. {long_sentence} Short closer."
+    chunks = list(chunk_segments([Segment("notes.pdf", 1, text)], max_tokens=12, overlap_tokens=4))
+
+    assert len(chunks) > len(WORDS * 10) // 12
+    covered = [False] * len(text)
+    for chunk in chunks:
+        assert approx_token_count(chunk.text) <= 12
+        assert text[chunk.char_offset:chunk.char_offset + len(chunk.text)] == chunk.text
+        covered[chunk.char_offset:chunk.char_offset + len(chunk.text)] = [True] * len(chunk.text)
+    assert all(covered[i] for i, char in enumerate(text) if not char.isspace())
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        list(chunk_segments([Segment("notes.pdf", 1, "One sentence.")], max_tokens=10, overlap_tokens=10))
@@ -0,0 +1,41 @@
+from src.extraction_planner import DENSE_TEXT_CHARS, plan_page
+
+
+class FakePage:
+    def __init__(self, infos: list[dict]):
+        self.rect = (0, 0, 600, 800)
+        self.infos = infos
+
+    def get_image_info(self, hashes: bool = False, xrefs: bool = False) -> list[dict]:
+        return self.infos
+
+
+def _image(xref: int, bbox: tuple, digest: bytes) -> dict:
+    return {"xref": xref, "bbox": bbox, "width": 300, "height": 300, "digest": digest}
+
+
+def test_image_skipped_as_decorative_is_still_ocred_where_it_is_content():
+    # 5% of the page: decorative next to dense text, content on a sparse page.
+    figure = _image(7, (0, 0, 120, 200), b"figure")
+    dense_text = "x" * DENSE_TEXT_CHARS
+    seen = set()
+
+    dense = plan_page(FakePage([figure]), 0, dense_text, seen)
+    sparse = plan_page(FakePage([figure]), 1, "Figure 1", seen)
+    repeat = plan_page(FakePage([figure]), 2, "Figure 1 again", seen)
+
+    assert dense.action == "text"
+    assert dense.skipped_decorative == 1
+    assert sparse.action == "ocr_images"
+    assert [ref.digest for ref in sparse.ocr_images] == [b"figure"]
+    assert sparse.skipped_duplicate == 0
+    assert repeat.ocr_images == []
+    assert repeat.skipped_duplicate == 1
+
+
+def test_duplicates_within_a_page_are_ocred_once():
+    logo = _image(3, (0, 0, 300, 300), b"logo")
+    plan = plan_page(FakePage([logo, dict(logo, bbox=(300, 400, 600, 700))]), 0, "", set())
+
+    assert len(plan.ocr_images) == 1
+    assert plan.skipped_duplicate == 1
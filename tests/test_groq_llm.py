@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from groq import GroqError
+
+from src.groq_llm import GroqLLM, LLMError
+
+
+def _chunk(content=None, usage=None):
+    choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(choices=choices, x_groq=SimpleNamespace(usage=usage) if usage else None)
+
+
+class FakeCompletions:
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if not kwargs.get("stream"):
+            text = "".join(chunk.choices[0].delta.content or "" for chunk in self.chunks if chunk.choices)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f" {text} "))], usage=None)
+        return self._stream()
+
+    def _stream(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise GroqError("connection reset")
+            yield chunk
+
+
+def _llm(completions) -> GroqLLM:
+    return GroqLLM(model="fake-model", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+
+def test_generate_stream_yields_deltas_in_order():
+    usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+    completions = FakeCompletions([_chunk("Hel"), _chunk(""), _chunk("lo"), _chunk(None), _chunk("!"), _chunk(None, usage)])
+    tokens = list(_llm(completions).generate_stream("question", system_prompt="system"))
+
+    assert tokens == ["Hel", "lo", "!"]
+    assert not any(isinstance(token, LLMError) for token in tokens)
+    assert completions.calls[0]["stream"] is True
+    assert completions.calls[0]["messages"] == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "question"},
+    ]
+
+
+def test_generate_stream_failure_mid_stream_ends_with_error():
+    completions = FakeCompletions([_chunk("Partial "), _chunk("answer"), _chunk(" lost")], fail_after=2)
+    tokens = list(_llm(completions).generate_stream("question"))
+
+    assert tokens[:2] == ["Partial ", "answer"]
+    assert len(tokens) == 3
+    assert isinstance(tokens[-1], LLMError)
+    assert not "".join(tokens).startswith("Error:")
+
+
+def test_generate_failure_returns_error():
+    class Failing:
+        def create(self, **kwargs):
+            raise GroqError("rate limited")
+
+    answer = _llm(Failing()).generate("question")
+    assert isinstance(answer, LLMError)
+    assert answer.startswith("Error:")
+
+
+def test_generate_strips_answer():
+    answer = _llm(FakeCompletions([_chunk("An answer")])).generate("question")
+    assert answer == "An answer"
+    assert not isinstance(answer, LLMError)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from src import ingest_cache
+from src.chunker import Chunk
+from src.ingest_cache import IngestCache
+
+SETTINGS = {"chunker": "sentences", "max_tokens": 256, "overlap_tokens": 32, "model_name": "all-MiniLM-L6-v2"}
+
+
+def _window(start: int, count: int, dim: int = 8) -> tuple[list[Chunk], np.ndarray]:
+    chunks = [Chunk(f"chunk {i}", "doc.pdf", i // 10, i * 7) for i in range(start, start + count)]
+    return chunks, np.random.default_rng(start).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_writer_entry_matches_put(tmp_path):
+    cache = IngestCache(str(tmp_path / "cache"))
+    windows = [_window(0, 5), _window(5, 3), _window(8, 4)]
+    all_chunks = [chunk for chunks, _ in windows for chunk in chunks]
+    all_vectors = np.vstack([vectors for _, vectors in windows])
+
+    cache.put("whole", "page one page two", all_chunks, all_vectors)
+    writer = cache.writer("windowed")
+    for chunks, vectors in windows:
+        writer.add(chunks, vectors)
+    writer.add_text("page one")
+    writer.add_text("page two")
+    assert writer.commit()
+
+    whole, windowed = cache.get("whole"), cache.get("windowed")
+    assert windowed.text == whole.text == "page one page two"
+    assert windowed.chunks == whole.chunks == all_chunks
+    np.testing.assert_array_equal(windowed.embeddings, all_vectors)
+
+
+def test_aborted_writer_leaves_no_entry(tmp_path):
+    cache = IngestCache(str(tmp_path / "cache"))
+    writer = cache.writer("key")
+    writer.add(*_window(0, 3))
+    writer.abort()
+
+    assert cache.get("key") is None
+    assert list(cache.cache_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("change", [
+    {"max_tokens": 512},
+    {"overlap_tokens": 0},
+    {"chunker": "fixed"},
+    {"model_name": "all-mpnet-base-v2"},
+])
+def test_key_changes_with_settings(change):
+    assert IngestCache.make_key(b"file", SETTINGS) == IngestCache.make_key(b"file", dict(SETTINGS))
+    assert IngestCache.make_key(b"file", dict(SETTINGS, **change)) != IngestCache.make_key(b"file", SETTINGS)
+    assert IngestCache.make_key(b"other file", SETTINGS) != IngestCache.make_key(b"file", SETTINGS)
+
+
+def test_entries_from_an_older_ingest_version_are_not_served(tmp_path, monkeypatch):
+    cache = IngestCache(str(tmp_path / "cache"))
+    old_key = IngestCache.make_key(b"file", SETTINGS)
+    cache.put(old_key, "old text", *_window(0, 3))
+
+    monkeypatch.setattr(ingest_cache, "INGEST_VERSION", ingest_cache.INGEST_VERSION + 1)
+    new_key = IngestCache.make_key(b"file", SETTINGS)
+    assert new_key != old_key
+    assert cache.get(new_key) is None
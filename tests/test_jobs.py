@@ -0,0 +1,175 @@
+import io
+import time
+import threading
+
+import numpy as np
+import pytest
+
+docx = pytest.importorskip("docx")
+pytest.importorskip("sentence_transformers")
+
+from src import jobs
+from src.ingest_cache import IngestCache
+from src.jobs import CANCELLED, DONE, FAILED, INDEXING, QUEUED, READY, RUNNING, JobQueue, index_ready_jobs, run_job
+
+DIM = 8
+
+
+class SlowEmbedder:
+    cache_tag = "fake:slow"
+    dimension = DIM
+
+    def __init__(self, on_first_window=None, delay: float = 0.05):
+        self.on_first_window = on_first_window
+        self.delay = delay
+        self.windows = 0
+
+    def embed_stream(self, items, window_size: int = 1024):
+        for index, item in enumerate(items):
+            if index == 0 and self.on_first_window:
+                self.on_first_window()
+            time.sleep(self.delay)
+            self.windows += 1
+            yield [item], np.ones((1, DIM), dtype=np.float32)
+
+
+def _docx(sentences: int) -> bytes:
+    document = docx.Document()
+    for i in range(sentences):
+        document.add_paragraph(f"Sentence number {i} about gradients and entropy in some detail.")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs"), max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def _has_file(queue: JobQueue, job_id: int) -> bool:
+    return queue._file_path(job_id).exists()
+
+
+def test_claim_and_lease_expiry_requeue(queue):
+    job = queue.submit("lib", "cs101", "notes.pdf", b"first version")
+    claimed = queue.claim()
+    assert (claimed.id, claimed.status, claimed.attempts) == (job.id, RUNNING, 1)
+    assert queue.claim() is None
+
+    assert queue.requeue_stale(lease_seconds=-1) == 1
+    assert queue.get(job.id).status == QUEUED
+    # The worker that lost its lease can no longer move the job on.
+    assert queue.mark_ready(claimed, "key", 3) is None
+    assert queue.heartbeat(claimed)
+
+    reclaimed = queue.claim()
+    assert (reclaimed.id, reclaimed.attempts) == (job.id, 2)
+    assert queue.mark_ready(reclaimed, "key", 3) == READY
+    assert _has_file(queue, job.id)
+
+
+def test_attempt_limit_fails_the_job(queue):
+    job = queue.submit("lib", "cs101", "notes.pdf", b"crashes the worker")
+    for _ in range(queue.max_attempts):
+        assert queue.claim().id == job.id
+        queue.requeue_stale(lease_seconds=-1)
+
+    failed = queue.get(job.id)
+    assert failed.status == FAILED
+    assert "2 attempts" in failed.error
+    assert queue.claim() is None
+    assert not _has_file(queue, job.id)
+
+
+def test_cancel_after_final_check_discards_file(queue):
+    job = queue.submit("lib", "cs101", "notes.pdf", b"data")
+    claimed = queue.claim()
+    queue.cancel(job.id)
+    assert queue.get(job.id).status == RUNNING
+
+    assert queue.mark_ready(claimed, "key", 3) == CANCELLED
+    assert queue.get(job.id).status == CANCELLED
+    assert not _has_file(queue, job.id)
+
+
+def test_cancel_while_running_stops_the_worker(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(jobs, "JOB_WINDOW_SIZE", 1)
+    job = queue.submit("lib", "cs101", "notes.docx", _docx(400))
+    claimed = queue.claim()
+    embedder = SlowEmbedder(on_first_window=lambda: queue.cancel(job.id))
+
+    status = run_job(queue, claimed, embedder, IngestCache(str(tmp_path / "cache")))
+
+    assert status == CANCELLED
+    assert embedder.windows < 5
+    assert queue.get(job.id).status == CANCELLED
+    assert not _has_file(queue, job.id)
+
+
+def test_only_one_session_indexes_a_ready_job(queue, tmp_path, monkeypatch):
+    job = queue.submit("lib", "cs101", "notes.pdf", b"one version")
+    assert queue.mark_ready(queue.claim(), "key", 3) == READY
+
+    calls = []
+    started = threading.Event()
+
+    def slow_index_cached(cache, key, source, vector_store, course=None):
+        calls.append(key)
+        started.set()
+        time.sleep(0.2)
+        return 3
+
+    class FakeStore:
+        def save(self):
+            pass
+
+    monkeypatch.setattr(jobs, "index_cached", slow_index_cached)
+    other_session = JobQueue(str(tmp_path / "jobs"))
+    results = []
+    first = threading.Thread(target=lambda: results.append(index_ready_jobs(queue, "lib", FakeStore(), None)))
+    first.start()
+    started.wait(5)
+    assert queue.get(job.id).status == INDEXING
+    results.append(index_ready_jobs(other_session, "lib", FakeStore(), None))
+    first.join()
+    other_session.close()
+
+    assert calls == ["key"]
+    assert sorted(len(indexed) for indexed in results) == [0, 1]
+    assert queue.get(job.id).status == DONE
+
+
+def test_indexing_claim_of_a_dead_session_is_released(queue):
+    job = queue.submit("lib", "cs101", "notes.pdf", b"one version")
+    assert queue.mark_ready(queue.claim(), "key", 3) == READY
+    assert queue.claim_ready(queue.get(job.id)).status == INDEXING
+    assert queue.claim_ready(queue.get(job.id)) is None
+
+    assert queue.requeue_stale(lease_seconds=-1) == 1
+    assert queue.get(job.id).status == READY
+
+
+def test_workers_get_stable_metrics_slots(monkeypatch):
+    commands = []
+
+    class FakeProcess:
+        def __init__(self, command, env=None):
+            commands.append(command)
+
+        def terminate(self):
+            pass
+
+        def wait(self, timeout=None):
+            return 0
+
+    monkeypatch.setattr(jobs.subprocess, "Popen", FakeProcess)
+    monkeypatch.setattr(jobs.atexit, "register", lambda fn: None)
+    jobs.start_workers(3)
+    jobs.start_workers(3)
+
+    slots = [command[command.index("--slot") + 1] for command in commands]
+    assert slots == ["0", "1", "2", "0", "1", "2"]
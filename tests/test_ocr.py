@@ -0,0 +1,105 @@
+import io
+import os
+import sys
+import shutil
+
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip("pytesseract")
+pytest.importorskip("fitz")
+pptx = pytest.importorskip("pptx")
+from pptx.util import Inches
+
+from src.ingest import OcrTask, extract_segments, run_ocr_tasks
+
+SLOW_WIDTH = 377
+
+# Stands in for the tesseract binary when it is not installed: the "text" is derived from the
+# image it is given, and images SLOW_WIDTH pixels wide hang so the timeout path can be exercised.
+FAKE_TESSERACT = f"""#!{sys.executable}
+import sys, time, hashlib
+from PIL import Image
+image_path, output_base = sys.argv[1], sys.argv[2]
+with Image.open(image_path) as image:
+    width, height = image.size
+    digest = hashlib.sha256(image.tobytes()).hexdigest()[:12]
+if width == {SLOW_WIDTH}:
+    time.sleep(30)
+with open(output_base + ".txt", "w") as f:
+    f.write(f"text {{width}}x{{height}} {{digest}}")
+"""
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+@pytest.fixture
+def tesseract(tmp_path, monkeypatch):
+    # On PATH rather than patched into pytesseract, so OCR worker processes pick it up too.
+    if shutil.which("tesseract") is None or os.getenv("OCR_TEST_FAKE_TESSERACT") == "1":
+        script = tmp_path / "bin" / "tesseract"
+        script.parent.mkdir()
+        script.write_text(FAKE_TESSERACT)
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{script.parent}{os.pathsep}{os.environ['PATH']}")
+
+
+def _image(text: str, size: tuple) -> bytes:
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((10, 10), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _tasks() -> list[OcrTask]:
+    tasks = [OcrTask(_image(f"Slide text number {i}", (300 + 20 * i, 120)), f"image {i}") for i in range(6)]
+    tasks.insert(2, OcrTask(b"not an image", "broken image"))
+    tasks.insert(5, OcrTask(_image("slow", (SLOW_WIDTH, 120)), "slow image"))
+    return tasks
+
+
+def _pptx(images: list[bytes]) -> bytes:
+    presentation = pptx.Presentation()
+    for i, image_bytes in enumerate(images):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {i}"
+        slide.shapes.add_picture(io.BytesIO(image_bytes), Inches(1), Inches(2))
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    return buffer.getvalue()
+
+
+def test_parallel_ocr_matches_serial_including_failures(tesseract):
+    tasks = _tasks()
+    serial = run_ocr_tasks(tasks, workers=1, timeout=2)
+    parallel = run_ocr_tasks(tasks, workers=3, timeout=2)
+
+    assert parallel == serial
+    assert len(serial) == len(tasks)
+    # The undecodable image and the one that outlives the timeout fail in place, without shifting the rest.
+    assert serial[2] is None
+    assert serial[5] is None
+    assert all(text and text.strip() for i, text in enumerate(serial) if i not in (2, 5))
+
+
+def test_parallel_extraction_matches_serial(tesseract):
+    images = [_image(f"Diagram {i}", (280 + 30 * i, 140)) for i in range(5)]
+    images.insert(3, _image("slow", (SLOW_WIDTH, 140)))
+    data = _pptx(images)
+
+    serial = extract_segments(NamedBytesIO(data, "deck.pptx"), workers=1, ocr_timeout=2)
+    parallel = extract_segments(NamedBytesIO(data, "deck.pptx"), workers=4, ocr_timeout=2)
+
+    assert parallel == serial
+    assert [segment.page for segment in serial] == sorted(segment.page for segment in serial)
+    # One title per slide plus the OCR text of every image except the one that timed out.
+    assert len(serial) == 2 * len(images) - 1
+
+
+def test_no_tasks():
+    assert run_ocr_tasks([], workers=4) == []
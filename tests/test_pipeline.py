@@ -0,0 +1,99 @@
+import io
+import hashlib
+
+import numpy as np
+import pytest
+
+docx = pytest.importorskip("docx")
+pytest.importorskip("sentence_transformers")
+
+from src.ingest_cache import IngestCache
+from src.pipeline import index_file
+from src.vector_store import VectorStore
+
+DIM = 16
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class FakeEmbedder:
+    cache_tag = "fake:hash"
+    dimension = DIM
+
+    def __init__(self, fail_after_windows: int = None):
+        self.fail_after_windows = fail_after_windows
+
+    def embed_stream(self, items, window_size: int = 1024):
+        batch, windows = [], 0
+        for item in list(items) + [None]:
+            if item is not None:
+                batch.append(item)
+            if batch and (item is None or len(batch) == window_size):
+                if self.fail_after_windows is not None and windows == self.fail_after_windows:
+                    raise RuntimeError("embedding failed")
+                yield batch, np.stack([self._vector(chunk.text) for chunk in batch])
+                batch, windows = [], windows + 1
+
+    def _vector(self, text: str) -> np.ndarray:
+        return np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:DIM], dtype=np.uint8).astype(np.float32) - 128
+
+
+def _docx(paragraphs: list[str]) -> bytes:
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    yield store
+    store.close()
+
+
+def _texts(store: VectorStore, source: str) -> list[str]:
+    return sorted(store.get_texts(store.document_ids(source)).values())
+
+
+def _index(data: bytes, store: VectorStore, **kwargs) -> int:
+    return index_file(NamedBytesIO(data, "notes.docx"), kwargs.pop("embedder", FakeEmbedder()), store, max_tokens=8, overlap_tokens=0, window_size=2, **kwargs)
+
+
+def test_reindexing_replaces_previous_chunks(store, tmp_path):
+    cache = IngestCache(str(tmp_path / "cache"))
+    _index(_docx(["Old first sentence.", "Old second sentence."]), store, cache=cache)
+
+    added = _index(_docx(["New first sentence.", "New second sentence.", "New third one."]), store, cache=cache)
+
+    texts = _texts(store, "notes.docx")
+    assert added == len(texts) > 0
+    assert all("new" in text and "old" not in text for text in texts)
+
+
+def test_failed_extraction_keeps_previous_version(store):
+    _index(_docx(["Old first sentence.", "Old second sentence."]), store)
+    before = _texts(store, "notes.docx")
+
+    assert _index(b"not a docx file", store) == 0
+    assert _texts(store, "notes.docx") == before
+
+
+def test_failed_embedding_keeps_previous_version(store, tmp_path):
+    cache = IngestCache(str(tmp_path / "cache"))
+    _index(_docx(["Old first sentence.", "Old second sentence."]), store)
+    before = _texts(store, "notes.docx")
+    new_version = _docx([f"New sentence {i}." for i in range(6)])
+
+    with pytest.raises(RuntimeError):
+        _index(new_version, store, cache=cache, embedder=FakeEmbedder(fail_after_windows=1))
+
+    assert _texts(store, "notes.docx") == before
+    assert store.index.ntotal == len(before)
+    assert list(cache.cache_path.iterdir()) == []
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from src.answer_cache import SemanticAnswerCache
+from src.context_builder import ContextBuilder
+from src.groq_llm import LLMError
+from src.query_engine import QueryEngine
+from src.vector_store import VectorStore
+
+DIM = 16
+
+
+class FakeEmbedder:
+    cache_tag = "fake:hash"
+    dimension = DIM
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.stack([
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:DIM], dtype=np.uint8).astype(np.float32) - 128
+            for text in texts
+        ])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class FakeStreamingLLM:
+    model = "fake-model"
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.calls = 0
+
+    def generate_stream(self, prompt: str, system_prompt: str = ""):
+        self.calls += 1
+        yield from self.tokens
+
+
+class FakeLLM:
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt: str, system_prompt: str = "") -> str:
+        self.calls += 1
+        return f"Answer {self.calls}."
+
+
+@pytest.fixture
+def vector_store(tmp_path):
+    embedder = FakeEmbedder()
+    texts = ["Gradients point uphill.", "Entropy measures uncertainty.", "Eigenvalues scale eigenvectors."]
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    store.add(embedder.embed(texts), texts, [{"source": "notes.pdf", "page": i + 1} for i in range(len(texts))])
+    yield store
+    store.close()
+
+
+def _engine(llm, vector_store) -> QueryEngine:
+    return QueryEngine(llm=llm, vector_store=vector_store, embedder=FakeEmbedder(), answer_cache=SemanticAnswerCache())
+
+
+def test_ask_stream_yields_tokens_and_caches_answer(vector_store):
+    llm = FakeStreamingLLM(["Gradients ", "point ", "uphill."])
+    engine = _engine(llm, vector_store)
+
+    assert list(engine.ask_stream("What do gradients do?")) == ["Gradients ", "point ", "uphill."]
+    assert list(engine.ask_stream("What do gradients do?")) == ["Gradients point uphill."]
+    assert llm.calls == 1
+
+
+def test_ask_stream_does_not_cache_answer_broken_mid_stream(vector_store):
+    llm = FakeStreamingLLM(["Gradients ", "point", LLMError("Error: Could not generate a response due to an API issue.")])
+    engine = _engine(llm, vector_store)
+
+    first = list(engine.ask_stream("What do gradients do?"))
+    assert first[:2] == ["Gradients ", "point"]
+    assert isinstance(first[-1], LLMError)
+
+    list(engine.ask_stream("What do gradients do?"))
+    assert llm.calls == 2
+
+
+def test_async_engine_answers_and_caches(vector_store):
+    from src.query_engine import AsyncQueryEngine
+
+    class FakeAsyncLLM:
+        model = "fake-model"
+        calls = 0
+
+        async def generate(self, prompt: str, system_prompt: str = "") -> str:
+            self.calls += 1
+            return "Gradients point uphill."
+
+    llm = FakeAsyncLLM()
+    engine = AsyncQueryEngine(llm=llm, vector_store=vector_store, embedder=FakeEmbedder(), answer_cache=SemanticAnswerCache())
+    assert asyncio.run(engine.aask("What do gradients do?")) == "Gradients point uphill."
+    assert asyncio.run(engine.aask_many(["What do gradients do?", "What is entropy?"])) == ["Gradients point uphill."] * 2
+    assert llm.calls == 2
+    assert not hasattr(engine, "ask")
+
+
+class TableEmbedder:
+    cache_tag = "fake:table"
+    dimension = 4
+
+    def __init__(self, table: dict):
+        self.table = table
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return np.array([self.table[text] for text in texts], dtype=np.float32)
+
+
+def test_mmr_picks_k_from_a_wider_candidate_pool(tmp_path):
+    best, near_duplicate, diverse = "Gradients point uphill.", "Gradient vectors aim upward.", "Descent steps follow minus gradients."
+    embedder = TableEmbedder({
+        "What do gradients do?": [1.0, 0.0, 0.0, 0.0],
+        best: [1.0, 0.0, 0.0, 0.0],
+        near_duplicate: [1.0, 0.05, 0.0, 0.0],
+        diverse: [0.6, 0.0, 0.8, 0.0],
+    })
+    store = VectorStore(dim=4, store_dir=str(tmp_path / "store"))
+    texts = [best, near_duplicate, diverse]
+    ids = store.add(embedder.embed(texts), texts, [{"source": "notes.pdf", "page": i + 1} for i in range(len(texts))])
+
+    def context_ids(use_mmr: bool) -> list[int]:
+        builder = ContextBuilder(max_tokens=1000, use_mmr=use_mmr, mmr_lambda=0.3)
+        engine = QueryEngine(llm=FakeStreamingLLM([]), vector_store=store, embedder=embedder, context_builder=builder)
+        [result] = engine.build_context_results(["What do gradients do?"], k=2)
+        return result.chunk_ids
+
+    try:
+        assert sorted(context_ids(use_mmr=False)) == [ids[0], ids[1]]
+        assert sorted(context_ids(use_mmr=True)) == [ids[0], ids[2]]
+    finally:
+        store.close()
+
+
+def _add_chunk(store, embedder):
+    store.add(embedder.embed(["Gradients point uphill."]), ["Gradients point uphill."], [{"source": "more.pdf"}])
+
+
+def _remove_chunk(store, embedder):
+    store.remove_ids(store.document_ids("notes.pdf")[:1])
+
+
+def _upsert_document(store, embedder):
+    store.upsert_document("notes.pdf", embedder.embed(["Gradients point uphill."]), ["Gradients point uphill."])
+
+
+@pytest.mark.parametrize("change", [_add_chunk, _remove_chunk, _upsert_document])
+def test_answer_cache_misses_after_the_store_changes(vector_store, change):
+    llm, embedder = FakeLLM(), FakeEmbedder()
+    engine = QueryEngine(llm=llm, vector_store=vector_store, embedder=embedder, answer_cache=SemanticAnswerCache())
+    assert engine.ask("What do gradients do?") == engine.ask("What do gradients do?") == "Answer 1."
+
+    version = vector_store.version
+    change(vector_store, embedder)
+    assert vector_store.version != version
+    assert engine.ask("What do gradients do?") == "Answer 2."
+
+
+def test_answer_cache_is_keyed_on_embedder_and_filters(vector_store):
+    llm, cache = FakeLLM(), SemanticAnswerCache()
+
+    class OtherEmbedder(FakeEmbedder):
+        cache_tag = "fake:other"
+
+    def ask(embedder=FakeEmbedder(), filters=None):
+        engine = QueryEngine(llm=llm, vector_store=vector_store, embedder=embedder, answer_cache=cache, filters=filters)
+        return engine.ask("What do gradients do?")
+
+    assert ask() == ask() == "Answer 1."
+    assert ask(embedder=OtherEmbedder()) == "Answer 2."
+    assert ask(filters={"page": 1}) == ask(filters={"page": 1}) == "Answer 3."
+    assert ask(filters={"page": 2}) == "Answer 4."
+    assert llm.calls == 4
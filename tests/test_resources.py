@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from src import resources
+
+
+@pytest.fixture(autouse=True)
+def isolated_stores():
+    yield
+    for namespace in list(resources._vector_stores):
+        resources.release_vector_store(namespace)
+
+
+def test_least_recently_used_store_is_saved_and_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, "MAX_OPEN_VECTOR_STORES", 2)
+    root = str(tmp_path)
+
+    first = resources.get_vector_store("first", dim=4, root_dir=root)
+    first.add(np.eye(4, dtype=np.float32)[:2], ["a", "b"], [{"source": "a.pdf"}, {"source": "b.pdf"}])
+    resources.get_vector_store("second", dim=4, root_dir=root)
+    assert resources.get_vector_store("first", dim=4, root_dir=root) is first
+
+    resources.get_vector_store("third", dim=4, root_dir=root)
+    assert list(resources._vector_stores) == ["first", "third"]
+
+    resources.get_vector_store("fourth", dim=4, root_dir=root)
+    assert list(resources._vector_stores) == ["third", "fourth"]
+
+    # Evicted stores were saved, so reopening them gets the same chunks back.
+    reopened = resources.get_vector_store("first", dim=4, root_dir=root)
+    assert reopened is not first
+    assert reopened.index.ntotal == 2
+    assert reopened.document_ids("a.pdf") != []
+
+
+def test_idle_stores_are_closed(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    clock = [1000.0]
+    monkeypatch.setattr(resources.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(resources, "VECTOR_STORE_IDLE_SECONDS", 60)
+
+    resources.get_vector_store("idle", dim=4, root_dir=root)
+    clock[0] += 30
+    resources.get_vector_store("active", dim=4, root_dir=root)
+    assert set(resources._vector_stores) == {"idle", "active"}
+
+    clock[0] += 45
+    resources.get_vector_store("active", dim=4, root_dir=root)
+    assert list(resources._vector_stores) == ["active"]
+
+
+def test_invalid_namespace_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        resources.get_vector_store("../escape", dim=4, root_dir=str(tmp_path))
+
+
+def test_stores_in_use_are_not_closed(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    clock = [1000.0]
+    monkeypatch.setattr(resources.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(resources, "VECTOR_STORE_IDLE_SECONDS", 60)
+    monkeypatch.setattr(resources, "MAX_OPEN_VECTOR_STORES", 1)
+
+    with resources.use_vector_store("ingesting", dim=4, root_dir=root) as store:
+        # A long ingest outlives the idle timeout while other libraries push it out of the LRU.
+        clock[0] += 120
+        resources.get_vector_store("other", dim=4, root_dir=root)
+        resources.get_vector_store("another", dim=4, root_dir=root)
+        assert "ingesting" in resources._vector_stores
+        store.add(np.eye(4, dtype=np.float32)[:1], ["still open"])
+        store.save()
+
+    # Once released, the idle clock restarts and it is evicted like any other store.
+    assert resources.get_vector_store("ingesting", dim=4, root_dir=root) is store
+    clock[0] += 120
+    resources.get_vector_store("other", dim=4, root_dir=root)
+    assert "ingesting" not in resources._vector_stores
+    assert resources._vector_store_users == {}
@@ -0,0 +1,69 @@
+import random
+import re
+import unicodedata
+
+import pytest
+
+from src.utils import clean_text, iter_clean_text
+
+WORDS = (
+    "the gradient of a function points in the direction of steepest ascent and its magnitude "
+    "gives the rate of change eigenvalues describe how a linear map stretches space while "
+    "entropy measures uncertainty in a distribution course cs101 covers recursion and proofs"
+).split()
+NOISE = [
+    "https://example.com/a?b=c", "www.Example.org/path", "Alice.Smith@Uni.EDU", "a@b.cohttp://x.y",
+    "<b>", "</IMAGE_TEXT>", "<a href='x'>", "x<y", "a > b", "ﬁ", "Ｆｕｌｌ", " ", "\t", "\n", "\n\n  \n",
+    "\x1c", " ", "é", "ǅ", "İ", "<no close", "@", "http", "www.", ".", "mailto:bob@x.io>",
+    "HTTPS://Example.COM/Q", "WWW.A.B", "BOB@X.IO", "<TAG>",
+]
+# Half the cases stay ASCII so clean_text's ASCII fast path is exercised too.
+ASCII_NOISE = [piece for piece in NOISE if piece.isascii()]
+
+
+def reference_clean_text(text: str) -> str:
+    # The implementation clean_text replaced; its output is the contract.
+    if not text or not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize('NFKC', text)
+    text = text.lower()
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)
+    text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '', text)
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def make_text(rng: random.Random, pieces: int, noise_rate: float, noise: list[str] = NOISE) -> str:
+    out = []
+    for _ in range(pieces):
+        if rng.random() < noise_rate:
+            out.append(rng.choice(noise))
+        else:
+            out.append(rng.choice(WORDS).capitalize() if rng.random() < 0.1 else rng.choice(WORDS))
+        out.append(rng.choice([" ", " ", " ", "", "\n", ". "]))
+    return "".join(out)
+
+
+def _pages(seed: int) -> list[str]:
+    rng = random.Random(seed)
+    noise = NOISE if seed % 2 else ASCII_NOISE
+    return [make_text(rng, rng.randint(0, 60), 0.3, noise) for _ in range(rng.randint(1, 4))]
+
+
+@pytest.mark.parametrize("text", ["", None, "  \n\n ", "Hello <b>World</b> at www.x.org", "ﬁne\x1c\nprint"])
+def test_clean_text_matches_reference_on_edge_cases(text):
+    assert clean_text(text) == reference_clean_text(text)
+
+
+def test_clean_text_matches_reference_on_random_documents():
+    for seed in range(2000):
+        document = "\n\n".join(_pages(seed))
+        assert clean_text(document) == reference_clean_text(document), document
+
+
+def test_iter_clean_text_joins_to_clean_text():
+    for seed in range(2000):
+        pages = _pages(seed)
+        assert " ".join(iter_clean_text(pages)) == clean_text("\n\n".join(pages)), pages
@@ -0,0 +1,173 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from src import vector_store as vector_store_module
+from src.vector_store import VectorStore
+
+DIM = 8
+
+
+def _vectors(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def test_pending_vectors_spill_to_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "MAX_PENDING_VECTORS", 10)
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    for window in range(5):
+        store.add(_vectors(6, window), [f"text {window}-{i}" for i in range(6)])
+        assert store._pending_count < 10
+    store.remove_ids([0, 1])
+    spilled = len(store._segments)
+    store.save()
+    store.close()
+
+    assert spilled >= 2
+    reopened = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    assert reopened.index.ntotal == 28
+    assert reopened.get_texts([0, 2, 29]) == {2: "text 0-2", 29: "text 4-5"}
+    reopened.close()
+
+
+def test_unsaved_spilled_segments_are_discarded(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "MAX_PENDING_VECTORS", 4)
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    store.add(_vectors(3, 0), ["a", "b", "c"])
+    store.save()
+    store.add(_vectors(8, 1), [f"late {i}" for i in range(8)])
+    # Closed without saving, like a crash mid-ingest.
+    store._conn.close()
+
+    reopened = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    assert reopened.index.ntotal == 3
+    assert len(list(reopened.segments_path.iterdir())) == len(reopened._segments)
+    reopened.close()
+
+
+def test_index_size_metric_sums_open_stores(tmp_path):
+    from src import metrics
+
+    metrics.enable()
+    metrics.INDEX_VECTORS.reset()
+    try:
+        first = VectorStore(dim=DIM, store_dir=str(tmp_path / "first"))
+        second = VectorStore(dim=DIM, store_dir=str(tmp_path / "second"))
+        first.add(_vectors(5, 0), [f"a{i}" for i in range(5)])
+        second.add(_vectors(3, 1), ["b0", "b1", "b2"])
+        first.remove_ids([0])
+        assert metrics.INDEX_VECTORS.value() == 7
+
+        first.close()
+        assert metrics.INDEX_VECTORS.value() == 3
+        second.close()
+        assert metrics.INDEX_VECTORS.value() == 0
+        assert "store=" not in metrics.render_prometheus()
+    finally:
+        metrics.disable()
+        metrics.INDEX_VECTORS.reset()
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "ivfpq"])
+def test_ivf_nlist_grows_with_the_store(tmp_path, index_type):
+    import faiss
+    from src.index_factory import MIN_TRAINING_SIZE, default_nlist, describe_index
+
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"), index_type=index_type)
+    first = _vectors(MIN_TRAINING_SIZE - 1, 0)
+    store.add(first, [f"t{i}" for i in range(len(first))])
+    # Trained index types stay flat until there is enough data for a real training set.
+    assert describe_index(store.index) == "flat"
+
+    store.add(_vectors(1, 1), ["trigger"])
+    store.save()
+    trained_nlist = faiss.extract_index_ivf(store.index).nlist
+    assert trained_nlist == default_nlist(MIN_TRAINING_SIZE)
+
+    grown = _vectors(3 * MIN_TRAINING_SIZE, 2)
+    for start in range(0, len(grown), 5000):
+        batch = grown[start:start + 5000]
+        store.add(batch, [f"g{start + i}" for i in range(len(batch))])
+    assert faiss.extract_index_ivf(store.index).nlist == trained_nlist
+    store.save()
+    store.close()
+
+    reopened = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"), index_type=index_type)
+    assert faiss.extract_index_ivf(reopened.index).nlist >= 2 * trained_nlist
+    assert reopened.index.ntotal == 4 * MIN_TRAINING_SIZE
+    if index_type == "ivf":
+        hits = reopened.search_batch_ids(grown[:20], k=1)
+        assert [hit[0][1] for hit in hits] == list(range(MIN_TRAINING_SIZE, MIN_TRAINING_SIZE + 20))
+    reopened.close()
+
+
+def test_concurrent_upserts_of_a_document_leave_one_version(tmp_path):
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"))
+    store.upsert_document("notes.pdf", _vectors(3, 0), ["old 0", "old 1", "old 2"], course="cs101")
+
+    def other_tab():
+        store.upsert_document_windows("notes.pdf", [(_vectors(2, 1), ["b 0", "b 1"], None)], course="cs101")
+
+    def windows():
+        yield _vectors(2, 2), ["a 0", "a 1"], None
+        # Another upsert of the same file starts and finishes while this one is between windows.
+        other_tab()
+        yield _vectors(2, 3), ["a 2", "a 3"], None
+
+    ids = store.upsert_document_windows("notes.pdf", windows(), course="cs101")
+    assert sorted(store.document_ids("notes.pdf", course="cs101")) == sorted(ids)
+    assert [record.text for record in store.get_records(ids).values()] == ["a 0", "a 1", "a 2", "a 3"]
+    store.close()
+
+
+def test_reconcile_runs_only_when_rows_and_manifest_disagree(tmp_path, monkeypatch):
+    calls = []
+    reconcile = VectorStore._reconcile_rows
+    monkeypatch.setattr(VectorStore, "_reconcile_rows", lambda self: calls.append(1) or reconcile(self))
+    store_dir = str(tmp_path / "store")
+
+    store = VectorStore(dim=DIM, store_dir=store_dir)
+    ids = store.add(_vectors(5, 0), [f"text {i}" for i in range(5)])
+    store.save()
+    store.close()
+    store = VectorStore(dim=DIM, store_dir=store_dir)
+    assert calls == []
+
+    # A crash after the row deletes were committed but before the manifest was written.
+    store._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids[:2]])
+    store._conn.commit()
+    store.close()
+    store = VectorStore(dim=DIM, store_dir=store_dir)
+    assert calls == [1]
+    assert store.index.ntotal - len(store._tombstones) == 3
+    store.close()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_batched_search_matches_single_queries(tmp_path, index_type):
+    from src.index_factory import MIN_TRAINING_SIZE, describe_index
+
+    store = VectorStore(dim=DIM, store_dir=str(tmp_path / "store"), index_type=index_type)
+    count = MIN_TRAINING_SIZE + 16
+    metadatas = [{"source": f"doc{i % 50}.pdf", "course": "cs101" if i % 3 else "ma201"} for i in range(count)]
+    ids = store.add(_vectors(count, 0), [f"text {i}" for i in range(count)], metadatas)
+    store.save()
+    assert describe_index(store.index) == index_type
+    # Removals become tombstones on HNSW and real deletions on the others.
+    store.remove_document("doc0.pdf")
+    store.remove_ids(ids[:500])
+    assert bool(store._tombstones) == (index_type == "hnsw")
+
+    queries = _vectors(24, 1)
+    for filters in [None, {"course": "cs101"}, {"source": ["doc1.pdf", "doc2.pdf"], "course": "ma201"}]:
+        batched = store.search_batch_ids(queries, k=10, filters=filters)
+        for query, hits in zip(queries, batched):
+            single = store.search_batch_ids(query, k=10, filters=filters)[0]
+            assert [idx for _, idx in hits] == [idx for _, idx in single]
+            np.testing.assert_allclose([score for score, _ in hits], [score for score, _ in single], rtol=1e-5)
+            assert [text for _, text in store.search(query, k=10, filters=filters)] == [f"text {idx}" for _, idx in hits]
+            if index_type == "flat":
+                assert len(hits) == 10
+            assert not {idx for _, idx in hits} & set(ids[:500])
+    store.close()
@@ -1,81 +1,156 @@
-import sys
-import os
-import streamlit as st
-
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-
-from src.query_engine import QueryEngine
-from src.ingest import ingest_file
-from src.chunker import chunk_text
-from src.embedder import Embedder
-from src.vector_store import VectorStore
-from src.groq_llm import GroqLLM, list_groq_models
-
-st.set_page_config(page_title="RAG Study Assistant", layout="wide")
-st.title("📚 RAG Study Assistant")
-st.markdown("Ask questions from your own files using Retrieval-Augmented Generation (RAG).")
-
-with st.sidebar:
-    st.header("⚙️ Controls")
-    
-    available_models = list_groq_models()
-    if not available_models:
-        st.warning("⚠️ Could not fetch models from Groq. Check API key or internet.")
-    model_choice = st.selectbox("Select a Groq LLM Model", available_models)
-
-    st.header("📁 File Upload")
-    uploaded_files = st.file_uploader(
-        "Upload one or more files (PDF, DOCX, PPTX, or Images)",
-        type=["pdf", "docx", "pptx", "png", "jpg", "jpeg"],
-        accept_multiple_files=True
-    )
-
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "engine" not in st.session_state:
-    st.session_state.engine = None
-
-if uploaded_files and st.session_state.engine is None:
-    with st.spinner("Processing documents... This may take a moment."):
-        all_chunks = []
-        for uploaded_file in uploaded_files:
-            text = ingest_file(uploaded_file)
-            if text:
-                chunks = chunk_text(text)
-                all_chunks.extend(chunks)
-
-        embedder = Embedder()
-        vectors = embedder.embed(all_chunks)
-        
-        if vectors.size > 0:
-            dim = vectors.shape[1]
-            vector_store = VectorStore(dim=dim)
-            vector_store.add(vectors, all_chunks)
-            llm = GroqLLM(model=model_choice)
-
-            st.session_state.engine = QueryEngine(
-                llm=llm, 
-                vector_store=vector_store, 
-                embedder=embedder
-            )
-            st.success("Files processed successfully. You can now ask questions!")
-        else:
-            st.error("Could not extract any text from the uploaded files. Please check the files and try again.")
-
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-
-if prompt := st.chat_input("Ask a question about your uploaded documents..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    if st.session_state.engine:
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = st.session_state.engine.ask(prompt)
-                st.write(response)
-        st.session_state.messages.append({"role": "assistant", "content": response})
-    else:
+import sys
+import os
+import re
+import uuid
+import hashlib
+import streamlit as st
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.query_engine import QueryEngine
+from src.groq_llm import list_groq_models
+from src.resources import get_embedder, get_job_queue, get_llm, use_vector_store
+from src.ingest_cache import IngestCache
+from src.jobs import ACTIVE_STATUSES, DEFAULT_POLL_SECONDS, FAILED, index_ready_jobs
+from src.answer_cache import SemanticAnswerCache
+from src import metrics
+
+st.set_page_config(page_title="RAG Study Assistant", layout="wide")
+metrics.start_exporters_from_env()
+st.title("📚 RAG Study Assistant")
+st.markdown("Ask questions from your own files using Retrieval-Augmented Generation (RAG).")
+
+with st.sidebar:
+    st.header("⚙️ Controls")
+    
+    available_models = list_groq_models()
+    if not available_models:
+        st.warning("⚠️ Could not fetch models from Groq. Check API key or internet.")
+    model_choice = st.selectbox("Select a Groq LLM Model", available_models)
+
+    st.header("📁 File Upload")
+    course = st.text_input("Course", value="default").strip() or "default"
+    uploaded_files = st.file_uploader(
+        "Upload one or more files (PDF, DOCX, PPTX, or Images)",
+        type=["pdf", "docx", "pptx", "png", "jpg", "jpeg"],
+        accept_multiple_files=True
+    )
+
+if "messages" not in st.session_state:
+    st.session_state.messages = []
+if "engine" not in st.session_state:
+    st.session_state.engine = None
+if "namespace" not in st.session_state:
+    # Kept in the URL so a page refresh reattaches to the same library and its ingestion jobs.
+    namespace = st.query_params.get("library", "")
+    st.session_state.namespace = namespace if re.fullmatch(r"[0-9a-f]{32}", namespace) else uuid.uuid4().hex
+if "submitted_files" not in st.session_state:
+    # (course, file name) -> content digest of the upload that was queued for ingestion.
+    st.session_state.submitted_files = {}
+
+namespace = st.session_state.namespace
+st.query_params["library"] = namespace
+embedder = get_embedder()
+job_queue = get_job_queue()
+ingest_cache = IngestCache()
+submitted_files = st.session_state.submitted_files
+uploaded_files = uploaded_files or []
+
+
+def open_library():
+    # Resolved on every use and held for its duration, so an idle or LRU eviction triggered by
+    # other sessions cannot close the store while this one is writing to or searching it.
+    return use_vector_store(namespace, dim=embedder.dimension)
+
+
+def remove_document(source: str):
+    job_queue.remove_document(namespace, course, source)
+    with open_library() as vector_store:
+        vector_store.remove_document(source, course=course)
+        vector_store.save()
+
+
+# Files removed from the uploader leave the course; new or changed uploads are queued for the workers.
+current_files = {(course, uploaded_file.name) for uploaded_file in uploaded_files}
+for key in [key for key in submitted_files if key[0] == course and key not in current_files]:
+    remove_document(key[1])
+    del submitted_files[key]
+
+for uploaded_file in uploaded_files:
+    # Compared by content, like JobQueue.submit, so an edited file of the same size is still re-indexed.
+    data = uploaded_file.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    if submitted_files.get((course, uploaded_file.name)) != digest:
+        job_queue.submit(namespace, course, uploaded_file.name, data)
+        submitted_files[(course, uploaded_file.name)] = digest
+
+
+def show_jobs(polling: bool):
+    # Finished jobs are indexed here, so documents become searchable one by one while the rest run.
+    with open_library() as vector_store:
+        index_ready_jobs(job_queue, namespace, vector_store, ingest_cache)
+    jobs = job_queue.jobs(namespace, course)
+    active = [job for job in jobs if job.status in ACTIVE_STATUSES]
+
+    for job in active:
+        progress_col, cancel_col = st.columns([4, 1])
+        progress_col.progress(job.progress, text=f"{job.source}: {job.stage or job.status}")
+        if cancel_col.button("Cancel", key=f"cancel-{job.id}"):
+            job_queue.cancel(job.id)
+    for job in jobs:
+        if job.status == FAILED:
+            st.error(f"{job.source}: {job.error}")
+
+    # Listed from the job queue rather than this session's uploads, so documents stay removable after a refresh.
+    removed = False
+    documents = job_queue.documents(namespace, course)
+    if documents:
+        st.caption(f"{len(documents)} document(s) ready")
+    for job in documents:
+        name_col, remove_col = st.columns([4, 1])
+        name_col.write(job.source)
+        if remove_col.button("Remove", key=f"remove-{job.id}"):
+            # A file still in the uploader keeps its entry in submitted_files, so it is not queued again.
+            remove_document(job.source)
+            removed = True
+
+    # A full rerun stops polling once nothing is left to wait for.
+    if removed or (polling and not active):
+        st.rerun()
+
+
+with st.sidebar:
+    polling = any(job.status in ACTIVE_STATUSES for job in job_queue.jobs(namespace, course))
+    st.fragment(show_jobs, run_every=DEFAULT_POLL_SECONDS if polling else None)(polling)
+
+
+def get_engine(vector_store) -> QueryEngine:
+    engine = st.session_state.engine
+    # The store object changes when an idle library was closed and reopened.
+    if engine is None or engine.llm.model != model_choice or engine.vector_store is not vector_store:
+        engine = st.session_state.engine = QueryEngine(
+            llm=get_llm(model_choice), 
+            vector_store=vector_store, 
+            embedder=embedder,
+            answer_cache=SemanticAnswerCache(),
+            retrieval_mode="hybrid",
+        )
+    engine.filters = {"course": course}
+    return engine
+
+
+for message in st.session_state.messages:
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+if prompt := st.chat_input("Ask a question about your uploaded documents..."):
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    with st.chat_message("user"):
+        st.markdown(prompt)
+
+    if job_queue.documents(namespace, course):
+        with st.chat_message("assistant"), open_library() as vector_store:
+            response = st.write_stream(get_engine(vector_store).ask_stream(prompt))
+        st.session_state.messages.append({"role": "assistant", "content": response})
+    else:
         st.warning("Please upload your documents first before asking a question.")
\ No newline at end of file